@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Banc d'essai hors ligne de l'API mémoire (openwebui-memory.py)
+Mesure débit et latences p50/p95/p99 de /memory/save, /memory/search et
+/memory/context sur des conversations synthétiques, sans Qdrant ni Ollama
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ("save", "search", "context")
+
+def load_memory_module():
+    """Importe openwebui-memory.py sous son nom de fichier
+
+    Le nom reste importable par les processus du pool d'encodage (spawn).
+    """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module("openwebui-memory")
+
+class StubEncoder:
+    """Encodeur déterministe (sac de mots haché) compatible SentenceTransformer
+
+    Aucun téléchargement de modèle : les vecteurs restent assez proches pour
+    des textes qui partagent des mots, ce qui suffit à exercer la recherche.
+    """
+
+    def __init__(self, dimension: int = 384, max_seq_length: int = 256):
+        self.dimension = dimension
+        self.max_seq_length = max_seq_length
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, batch_size: Optional[int] = None, **kwargs):
+        if isinstance(texts, str):
+            return self._encode_one(texts)
+        return np.stack([self._encode_one(text) for text in texts])
+
+class SerializedClient:
+    """Sérialise les appels d'un QdrantClient local (mode :memory: / path non thread-safe)"""
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attribute(*args, **kwargs)
+        return call
+
+class ConversationGenerator:
+    """Conversations synthétiques reproductibles (graine fixe)
+
+    Avec tenants > 1, les sessions sont réparties entre autant de tenants
+    ("tenant-<k>:bench-session-<i>") et chaque requête est limitée au sien.
+    """
+
+    def __init__(self, seed: int, sessions: int, message_words: int, vocabulary: int = 2000,
+                 tenants: int = 1):
+        self.random = random.Random(seed)
+        self.sessions = [f"bench-session-{index}" for index in range(max(1, sessions))]
+        if tenants > 1:
+            self.sessions = [f"tenant-{index % tenants}:{session}"
+                             for index, session in enumerate(self.sessions)]
+        self.message_words = message_words
+        self.vocabulary = [f"mot{index}" for index in range(vocabulary)]
+
+    def sentence(self, words: int) -> str:
+        return " ".join(self.random.choices(self.vocabulary, k=max(1, words)))
+
+    def conversation(self) -> Dict[str, Any]:
+        return {
+            "user_message": self.sentence(self.message_words // 4),
+            "ai_response": self.sentence(self.message_words),
+            "model_used": "phi3:3.8b",
+            "session_id": self.random.choice(self.sessions)
+        }
+
+    def query(self) -> Dict[str, Any]:
+        return {
+            "query": self.sentence(self.message_words // 4),
+            "session_id": self.random.choice(self.sessions)
+        }
+
+def build_memory(module, args, workdir: str):
+    """Instance OpenWebUIMemory sur un stockage local et l'encodeur demandé"""
+    if args.store == "local":
+        backend = module.LocalMemoryBackend(os.path.join(workdir, "local"))
+    elif args.store == "qdrant":
+        # Serveur réel (REST ou gRPC) : collection jetable, supprimée en fin de mesure
+        backend = module.QdrantBackend(
+            args.qdrant_host, args.qdrant_port,
+            collection_name=f"memory_bench_{os.getpid()}",
+            quantization=args.quantization,
+            grpc_port=args.grpc_port,
+            prefer_grpc=args.grpc,
+            tenant_hnsw=args.tenant_hnsw
+        )
+    else:
+        from qdrant_client import QdrantClient
+        backend = module.QdrantBackend(quantization=args.quantization)
+        client = QdrantClient(":memory:") if args.store == "qdrant-memory" \
+            else QdrantClient(path=os.path.join(workdir, "qdrant"))
+        backend._client = SerializedClient(client)
+    memory = module.OpenWebUIMemory(
+        backend=backend,
+        batching=args.batching,
+        query_cache_size=args.query_cache_size,
+        chunk_tokens=args.chunk_tokens,
+        context_max_tokens=args.context_max_tokens,
+        encoder=StubEncoder() if args.encoder == "stub" else args.encoder,
+        encoder_processes=args.encoder_processes,
+        encoder_options={"quantize": True} if args.onnx_quantize else None
+    )
+    if not memory.warm_up():
+        raise RuntimeError(f"Préparation impossible: {memory.last_error}")
+    return memory
+
+def percentile_report(latencies: List[float], errors: int, wall_time: float,
+                      cpu_time: Optional[float] = None) -> Dict[str, Any]:
+    """Débit (par seconde et par seconde CPU du processus) et percentiles (ms) d'une série de requêtes"""
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(total / wall_time, 2) if wall_time else None,
+        "cpu_time_s": round(cpu_time, 3) if cpu_time is not None else None,
+        "requests_per_cpu_s": round(total / cpu_time, 2) if cpu_time else None,
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3)
+    }
+
+def run_phase(app, path: str, payloads: List[Dict[str, Any]], concurrency: int,
+              check: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+    """Envoie les requêtes via le client de test Flask depuis concurrency threads"""
+    local = threading.local()
+    lock = threading.Lock()
+    latencies: List[float] = []
+    errors = 0
+
+    def send(payload: Dict[str, Any]):
+        nonlocal errors
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.post(path, json=payload)
+        elapsed = time.perf_counter() - start
+        ok = response.status_code == 200 and check(response.get_json())
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        list(executor.map(send, payloads))
+    return percentile_report(latencies, errors, time.perf_counter() - start,
+                             time.process_time() - cpu_start)
+
+def compare_batching(module, args, generator: ConversationGenerator, workdir: str) -> Dict[str, Any]:
+    """Mêmes sauvegardes concurrentes sans puis avec micro-batching, chacune sur un stockage neuf
+
+    requests_per_cpu_s (sauvegardes par seconde CPU du processus) mesure le
+    gain par cœur ; throughput_rps dépend aussi du nombre de cœurs libres.
+    """
+    payloads = [generator.conversation() for _ in range(args.requests)]
+    results = {}
+    for batching in (False, True):
+        variant = argparse.Namespace(**dict(vars(args), batching=batching))
+        memory = build_memory(module, variant, os.path.join(workdir, f"batching-{batching}"))
+        module.memory = memory
+        try:
+            name = "save_batched" if batching else "save_unbatched"
+            results[name] = run_phase(module.app, "/memory/save", payloads, args.concurrency,
+                                      lambda body: body.get("success") is True)
+        finally:
+            if args.store == "qdrant":
+                memory.backend.client.delete_collection(memory.backend.collection_name)
+            memory.close()
+    unbatched, batched = results["save_unbatched"], results["save_batched"]
+    if unbatched["requests_per_cpu_s"] and batched["requests_per_cpu_s"]:
+        print(f"Micro-batching : {batched['requests_per_cpu_s'] / unbatched['requests_per_cpu_s']:.2f}x "
+              f"sauvegardes par seconde CPU", file=sys.stderr)
+    return results
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(args) -> Dict[str, Any]:
+    module = load_memory_module()
+    module.logger.setLevel("WARNING")
+    logging.getLogger("openwebui_memory").setLevel("WARNING")
+    generator = ConversationGenerator(args.seed, args.sessions, args.message_words,
+                                      tenants=args.tenants)
+
+    with tempfile.TemporaryDirectory(prefix="memory-bench-") as workdir:
+        memory = build_memory(module, args, workdir)
+        module.memory = memory  # les routes Flask utilisent l'instance du module
+        try:
+            if args.prefill:
+                prefill = [generator.conversation() for _ in range(args.prefill)]
+                report = memory.save_conversations(prefill, parallelism=1)
+                print(f"Préremplissage: {report['saved']} conversations", file=sys.stderr)
+
+            results = {}
+            for _ in range(args.warmup):
+                query = generator.query()
+                memory.search_similar_conversations(query["query"], session_id=query["session_id"])
+
+            if "save" in args.endpoints:
+                payloads = [generator.conversation() for _ in range(args.requests)]
+                results["save"] = run_phase(module.app, "/memory/save", payloads, args.concurrency,
+                                            lambda body: body.get("success") is True)
+            if "search" in args.endpoints:
+                payloads = [dict(generator.query(), limit=args.limit) for _ in range(args.requests)]
+                results["search"] = run_phase(module.app, "/memory/search", payloads, args.concurrency,
+                                              lambda body: "results" in body)
+            if "context" in args.endpoints:
+                payloads = [generator.query() for _ in range(args.requests)]
+                results["context"] = run_phase(module.app, "/memory/context", payloads, args.concurrency,
+                                               lambda body: "context" in body)
+            collection_points = memory.backend.count()
+        finally:
+            if args.store == "qdrant":
+                memory.backend.client.delete_collection(memory.backend.collection_name)
+            memory.close()
+        if args.compare_batching:
+            results.update(compare_batching(module, args, generator, workdir))
+
+    return {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "collection_points": collection_points,
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+        },
+        "results": results
+    }
+
+def compare_reports(baseline: Dict[str, Any], report: Dict[str, Any]) -> List[str]:
+    """Écarts relatifs de débit et de percentiles par rapport à un rapport précédent"""
+    lines = [f"Comparaison avec {baseline['meta'].get('git_revision')} "
+             f"({baseline['meta'].get('timestamp')})"]
+    for endpoint, result in report["results"].items():
+        previous = baseline.get("results", {}).get(endpoint)
+        if not previous:
+            continue
+        deltas = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if previous.get(key):
+                deltas.append(f"{key} {(result[key] - previous[key]) / previous[key] * 100:+.1f}%")
+        lines.append(f"{endpoint:8s} " + "  ".join(deltas))
+    return lines
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Banc d'essai hors ligne de l'API mémoire")
+    parser.add_argument("--store", choices=["qdrant-memory", "qdrant-path", "local", "qdrant"],
+                        default="qdrant-memory",
+                        help="QdrantClient(':memory:'), Qdrant local sur disque, backend embarqué "
+                             "ou serveur Qdrant (--qdrant-host)")
+    parser.add_argument("--qdrant-host", default=os.getenv("QDRANT_HOST", "localhost"))
+    parser.add_argument("--qdrant-port", type=int, default=int(os.getenv("QDRANT_PORT", "6333")))
+    parser.add_argument("--grpc-port", type=int, default=int(os.getenv("QDRANT_GRPC_PORT", "6334")))
+    parser.add_argument("--grpc", action="store_true", help="Transport gRPC (prefer_grpc) avec --store qdrant")
+    parser.add_argument("--encoder", choices=["stub", "torch", "onnx"], default="stub",
+                        help="Encodeur haché sans dépendance, SentenceTransformer (PyTorch) ou ONNX Runtime")
+    parser.add_argument("--onnx-quantize", action="store_true", help="Modèle ONNX quantifié int8")
+    parser.add_argument("--encoder-processes", type=int, default=0,
+                        help="Encodage réparti sur un pool de processus (0 = dans le processus)")
+    parser.add_argument("--requests", type=int, default=200, help="Requêtes par endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--prefill", type=int, default=1000,
+                        help="Conversations insérées avant les mesures (taille de la collection)")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--tenants", type=int, default=1,
+                        help="Tenants entre lesquels les sessions sont réparties")
+    parser.add_argument("--tenant-hnsw", action="store_true",
+                        help="Index HNSW par tenant (m=0, payload_m) avec --store qdrant")
+    parser.add_argument("--message-words", type=int, default=80, help="Mots par réponse synthétique")
+    parser.add_argument("--limit", type=int, default=5, help="limit des requêtes /memory/search")
+    parser.add_argument("--warmup", type=int, default=10, help="Recherches non mesurées avant les phases")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batching", action="store_true", help="Activer le micro-batching des sauvegardes")
+    parser.add_argument("--compare-batching", action="store_true",
+                        help="Mesurer aussi /memory/save sans puis avec micro-batching (débit par seconde CPU)")
+    parser.add_argument("--query-cache-size", type=int, default=1024)
+    parser.add_argument("--chunk-tokens", type=int, default=0)
+    parser.add_argument("--context-max-tokens", type=int, default=None)
+    parser.add_argument("--quantization", choices=["none", "scalar", "binary"], default=None)
+    parser.add_argument("--output", help="Fichier JSON de résultats (sortie standard par défaut)")
+    parser.add_argument("--compare", help="Rapport JSON d'un commit précédent à comparer")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        for endpoint, result in report["results"].items():
+            print(f"{endpoint:14s} {result['throughput_rps']:>9} req/s  p50 {result['p50_ms']} ms  "
+                  f"p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  erreurs {result['errors']}")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare_reports(baseline, report)), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
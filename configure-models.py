@@ -4,93 +4,165 @@ Script de configuration automatique des modèles OpenWebUI
 Configure les modèles avec des paramètres optimisés via l'API OpenWebUI
 """
 
+import argparse
 import requests
 import json
+import random
+import re
 import time
 import os
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Union
+
+# Configuration des modèles avec paramètres optimisés (ordre = priorité de préchargement)
+MODELS_CONFIG = {
+    "llama2": {
+        "name": "llama2",
+        "display_name": "Llama 2 (Optimisé)",
+        "description": "Modèle Llama 2 optimisé pour la conversation",
+        "parameters": {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "top_k": 40,
+            "max_tokens": 2048,
+            "repeat_penalty": 1.1,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0
+        },
+        "context_length": 4096,
+        "prompt_template": "<s>[INST] {prompt} [/INST]",
+        "stop_sequences": ["</s>", "[INST]", "[/INST]"]
+    },
+    "phi3": {
+        "name": "phi3",
+        "display_name": "Phi-3 (Optimisé)",
+        "description": "Modèle Phi-3 optimisé pour la créativité",
+        "parameters": {
+            "temperature": 0.8,
+            "top_p": 0.95,
+            "top_k": 50,
+            "max_tokens": 4096,
+            "repeat_penalty": 1.05,
+            "frequency_penalty": 0.1,
+            "presence_penalty": 0.1
+        },
+        "context_length": 8192,
+        "prompt_template": "<|user|>\n{prompt}<|end|>\n<|assistant|>",
+        "stop_sequences": ["<|end|>", "<|user|>"]
+    },
+    "gemma2": {
+        "name": "gemma2",
+        "display_name": "Gemma 2 (Optimisé)",
+        "description": "Modèle Gemma 2 optimisé pour la précision",
+        "parameters": {
+            "temperature": 0.6,
+            "top_p": 0.85,
+            "top_k": 30,
+            "max_tokens": 3072,
+            "repeat_penalty": 1.15,
+            "frequency_penalty": 0.05,
+            "presence_penalty": 0.05
+        },
+        "context_length": 6144,
+        "prompt_template": "<start_of_turn>user\n{prompt}<end_of_turn>\n<start_of_turn>model\n",
+        "stop_sequences": ["<end_of_turn>", "<start_of_turn>"]
+    }
+}
+
+GIB = 1024 ** 3
+
+def env_flag(name: str, default: bool) -> bool:
+    """Lit un booléen depuis l'environnement"""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def parse_keep_alive(value: Union[str, int]) -> Union[str, int]:
+    """Convertit un keep_alive (« -1 », « 300 », « 30m », « 24h ») au format accepté par Ollama
+
+    Ollama refuse un nombre passé sous forme de chaîne : « -1 » doit devenir l'entier -1.
+    """
+    value = str(value).strip()
+    return int(value) if re.fullmatch(r"-?\d+", value) else value
+
+def parse_usage(value: Optional[str]) -> Dict[str, float]:
+    """Lit un décompte d'usage par modèle au format « phi3=120,llama2=40 »"""
+    usage = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, count = item.split("=", 1)
+            usage[name.strip()] = float(count)
+    return usage
+
+def ollama_url_from_env() -> str:
+    """URL de l'API Ollama (OLLAMA_BASE_URL, sinon OLLAMA_HOST, schéma ajouté si absent)"""
+    url = os.getenv("OLLAMA_BASE_URL") or os.getenv("OLLAMA_HOST") or "http://localhost:11434"
+    if "://" not in url:
+        url = f"http://{url}"
+    url = url.rstrip("/")
+    return url[:-len("/api")] if url.endswith("/api") else url
+
+def wait_until_ready(name: str, url: str, timeout: float = 60.0,
+                     initial_delay: float = 0.5, max_delay: float = 10.0,
+                     max_attempts: Optional[int] = None) -> bool:
+    """Interroger url avec un backoff exponentiel (avec gigue) jusqu'à une réponse 200 ou l'échéance
+
+    max_attempts borne en plus le nombre de tentatives.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            remaining = max(deadline - time.monotonic(), 0.5)
+            if requests.get(url, timeout=min(5.0, remaining)).status_code == 200:
+                print(f"✅ {name} est prêt! (tentative {attempt})")
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (max_attempts is not None and attempt >= max_attempts):
+            print(f"   ❌ {name} indisponible après {attempt} tentatives")
+            return False
+        pause = min(delay * random.uniform(0.5, 1.0), remaining)
+        print(f"   {name}: tentative {attempt} échouée, nouvel essai dans {pause:.1f}s")
+        time.sleep(pause)
+        delay = min(delay * 2, max_delay)
+
+def wait_for_services(endpoints: Dict[str, str], timeout: float = 60.0) -> Dict[str, bool]:
+    """Attendre plusieurs services en parallèle : le temps total est celui du plus lent, pas la somme"""
+    if not endpoints:
+        return {}
+    print(f"⏳ Attente du démarrage de {', '.join(endpoints)}...")
+    with ThreadPoolExecutor(max_workers=len(endpoints)) as pool:
+        futures = {name: pool.submit(wait_until_ready, name, url, timeout) for name, url in endpoints.items()}
+        return {name: future.result() for name, future in futures.items()}
 
 class OpenWebUIConfigurator:
     def __init__(self, base_url: str = "http://localhost:3000"):
         self.base_url = base_url
         self.session = requests.Session()
         
-    def wait_for_service(self, max_retries: int = 30) -> bool:
-        """Attendre que le service OpenWebUI soit disponible"""
-        print("⏳ Attente du démarrage d'OpenWebUI...")
-        for i in range(max_retries):
-            try:
-                response = self.session.get(f"{self.base_url}/api/version", timeout=5)
-                if response.status_code == 200:
-                    print("✅ OpenWebUI est prêt!")
-                    return True
-            except requests.exceptions.RequestException:
-                pass
-            time.sleep(2)
-            print(f"   Tentative {i+1}/{max_retries}...")
-        return False
+    def wait_for_service(self, max_retries: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+        """Attendre que le service OpenWebUI soit disponible (backoff exponentiel)
+
+        max_retries (ancienne interface : une tentative toutes les 2 s) borne le
+        nombre de tentatives ; sans timeout, l'échéance est alors celle de
+        l'ancienne boucle.
+        """
+        if timeout is None:
+            timeout = 2.0 * max_retries if max_retries is not None else 60.0
+        return wait_until_ready("OpenWebUI", f"{self.base_url}/api/version", timeout,
+                                max_attempts=max_retries)
     
     def configure_models(self):
         """Configurer les modèles avec des paramètres optimisés"""
         print("🔧 Configuration des modèles optimisés...")
         
-        # Configuration des modèles avec paramètres optimisés
-        models_config = {
-            "llama2": {
-                "name": "llama2",
-                "display_name": "Llama 2 (Optimisé)",
-                "description": "Modèle Llama 2 optimisé pour la conversation",
-                "parameters": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "top_k": 40,
-                    "max_tokens": 2048,
-                    "repeat_penalty": 1.1,
-                    "frequency_penalty": 0.0,
-                    "presence_penalty": 0.0
-                },
-                "context_length": 4096,
-                "prompt_template": "<s>[INST] {prompt} [/INST]",
-                "stop_sequences": ["</s>", "[INST]", "[/INST]"]
-            },
-            "phi3": {
-                "name": "phi3",
-                "display_name": "Phi-3 (Optimisé)",
-                "description": "Modèle Phi-3 optimisé pour la créativité",
-                "parameters": {
-                    "temperature": 0.8,
-                    "top_p": 0.95,
-                    "top_k": 50,
-                    "max_tokens": 4096,
-                    "repeat_penalty": 1.05,
-                    "frequency_penalty": 0.1,
-                    "presence_penalty": 0.1
-                },
-                "context_length": 8192,
-                "prompt_template": "<|user|>\n{prompt}<|end|>\n<|assistant|>",
-                "stop_sequences": ["<|end|>", "<|user|>"]
-            },
-            "gemma2": {
-                "name": "gemma2",
-                "display_name": "Gemma 2 (Optimisé)",
-                "description": "Modèle Gemma 2 optimisé pour la précision",
-                "parameters": {
-                    "temperature": 0.6,
-                    "top_p": 0.85,
-                    "top_k": 30,
-                    "max_tokens": 3072,
-                    "repeat_penalty": 1.15,
-                    "frequency_penalty": 0.05,
-                    "presence_penalty": 0.05
-                },
-                "context_length": 6144,
-                "prompt_template": "<start_of_turn>user\n{prompt}<end_of_turn>\n<start_of_turn>model\n",
-                "stop_sequences": ["<end_of_turn>", "<start_of_turn>"]
-            }
-        }
-        
         # Configuration via l'API OpenWebUI
-        for model_name, config in models_config.items():
+        for model_name, config in MODELS_CONFIG.items():
             try:
                 print(f"  📝 Configuration de {model_name}...")
                 
@@ -178,33 +250,238 @@ class OpenWebUIConfigurator:
         except Exception as e:
             print(f"  ❌ Erreur configuration vocale: {e}")
 
+class OllamaPreloader:
+    """Préchargement des modèles dans Ollama après un déploiement
+
+    Sans préchargement, la première conversation avec chaque modèle paie son chargement
+    depuis le disque. Les modèles sont classés par usage décroissant (ordre de MODELS_CONFIG
+    à égalité) ; ceux qui tiennent dans le budget mémoire sont chargés, les pin_count premiers
+    avec pin_keep_alive (épinglés), les suivants avec keep_alive. Les modèles hors budget ne
+    sont pas chargés : les forcer ferait évincer les plus utilisés.
+    """
+
+    def __init__(self, base_url: str, keep_alive: Union[str, int] = "30m",
+                 pin_keep_alive: Union[str, int] = -1, pin_count: int = 1,
+                 memory_budget_bytes: Optional[int] = None, memory_overhead: float = 1.2,
+                 usage: Optional[Dict[str, float]] = None, timeout: float = 600.0):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.pin_keep_alive = parse_keep_alive(pin_keep_alive)
+        self.pin_count = pin_count
+        self.memory_budget_bytes = memory_budget_bytes
+        # La taille sur disque sous-estime la mémoire résidente (cache KV, tampons)
+        self.memory_overhead = memory_overhead
+        self.usage = usage or {}
+        self.timeout = timeout
+    
+    @classmethod
+    def from_env(cls, base_url: Optional[str] = None) -> "OllamaPreloader":
+        """Construit le préchargeur depuis les variables OLLAMA_*"""
+        budget = os.getenv("OLLAMA_MEMORY_BUDGET_GB", "").strip()
+        return cls(
+            base_url or ollama_url_from_env(),
+            keep_alive=os.getenv("OLLAMA_PRELOAD_KEEP_ALIVE", "30m"),
+            pin_keep_alive=os.getenv("OLLAMA_PIN_KEEP_ALIVE", "-1"),
+            pin_count=int(os.getenv("OLLAMA_PIN_COUNT", "1")),
+            memory_budget_bytes=int(float(budget) * GIB) if budget else None,
+            memory_overhead=float(os.getenv("OLLAMA_MEMORY_OVERHEAD", "1.2")),
+            usage=parse_usage(os.getenv("OLLAMA_MODEL_USAGE")),
+        )
+    
+    def available_models(self) -> Dict[str, int]:
+        """Modèles installés dans Ollama et leur taille sur disque"""
+        response = self.session.get(f"{self.base_url}/api/tags", timeout=10)
+        response.raise_for_status()
+        return {model["name"]: int(model.get("size", 0)) for model in response.json().get("models", [])}
+    
+    def running_models(self) -> Dict[str, Dict[str, Any]]:
+        """Modèles résidents en mémoire (taille réelle et échéance)"""
+        response = self.session.get(f"{self.base_url}/api/ps", timeout=10)
+        response.raise_for_status()
+        return {model["name"]: model for model in response.json().get("models", [])}
+    
+    @staticmethod
+    def resolve(name: str, available: Dict[str, int]) -> Optional[str]:
+        """Nom Ollama complet d'un modèle configuré (« llama2 » → « llama2:latest » ou « llama2:7b »)"""
+        if name in available:
+            return name
+        if ":" in name:
+            return None
+        if f"{name}:latest" in available:
+            return f"{name}:latest"
+        tagged = sorted(candidate for candidate in available if candidate.split(":")[0] == name)
+        return tagged[0] if tagged else None
+    
+    def plan(self, models: List[str]) -> List[Dict[str, Any]]:
+        """Décide pour chaque modèle : épingler, précharger ou ignorer"""
+        available = self.available_models()
+        ranked = sorted(enumerate(models), key=lambda item: (-self.usage.get(item[1], 0), item[0]))
+        plan: List[Dict[str, Any]] = []
+        reserved = 0
+        pinned = 0
+        seen = set()
+        for _, name in ranked:
+            resolved = self.resolve(name, available)
+            entry = {"model": name, "resolved": resolved, "estimate": None, "action": "skip", "reason": ""}
+            plan.append(entry)
+            if resolved is None:
+                entry["reason"] = "absent d'Ollama"
+                continue
+            if resolved in seen:
+                entry["reason"] = "doublon"
+                continue
+            seen.add(resolved)
+            entry["estimate"] = int(available[resolved] * self.memory_overhead)
+            if self.memory_budget_bytes is not None and reserved + entry["estimate"] > self.memory_budget_bytes:
+                entry["reason"] = "hors budget mémoire"
+                continue
+            reserved += entry["estimate"]
+            if pinned < self.pin_count:
+                pinned += 1
+                entry["action"], entry["keep_alive"] = "pin", self.pin_keep_alive
+            else:
+                entry["action"], entry["keep_alive"] = "warm", self.keep_alive
+        return plan
+    
+    def warm(self, model: str, keep_alive: Union[str, int]) -> float:
+        """Charge un modèle (prompt vide) et renvoie la durée de chargement rapportée par Ollama"""
+        response = self.session.post(
+            f"{self.base_url}/api/generate",
+            json={"model": model, "prompt": "", "keep_alive": keep_alive, "stream": False},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json().get("load_duration", 0) / 1e9
+    
+    def unload(self, model: str):
+        """Décharge un modèle (keep_alive = 0)"""
+        self.warm(model, 0)
+    
+    def preload(self, models: List[str]) -> List[Dict[str, Any]]:
+        """Précharge les modèles retenus puis vérifie qu'ils sont résidents et dans le budget"""
+        print("🔥 Préchargement des modèles Ollama...")
+        try:
+            plan = self.plan(models)
+        except requests.exceptions.RequestException as e:
+            print(f"  ❌ Liste des modèles Ollama indisponible: {e}")
+            return []
+        selected = [entry for entry in plan if entry["action"] != "skip"]
+        for entry in plan:
+            if entry["action"] == "skip":
+                print(f"  ⏭️  {entry['model']}: ignoré ({entry['reason']})")
+        # Les moins prioritaires d'abord : en cas de pression mémoire Ollama évince le modèle
+        # utilisé le moins récemment, jamais celui qu'on vient de charger
+        for entry in reversed(selected):
+            start = time.monotonic()
+            try:
+                entry["load_s"] = self.warm(entry["resolved"], entry["keep_alive"])
+                entry["elapsed_s"] = time.monotonic() - start
+                label = "épinglé" if entry["action"] == "pin" else "préchargé"
+                print(f"  ✅ {entry['resolved']} {label} (keep_alive={entry['keep_alive']}, "
+                      f"chargement {entry['load_s']:.1f}s)")
+            except requests.exceptions.RequestException as e:
+                entry["action"], entry["reason"] = "skip", f"échec: {e}"
+                print(f"  ❌ {entry['resolved']}: {e}")
+        self.enforce_budget(plan)
+        self.verify(plan)
+        return plan
+    
+    def enforce_budget(self, plan: List[Dict[str, Any]]):
+        """Corrige l'estimation avec les tailles réelles de /api/ps : si le budget est dépassé,
+        décharge les modèles non épinglés en partant du moins utilisé"""
+        if self.memory_budget_bytes is None:
+            return
+        try:
+            running = self.running_models()
+        except requests.exceptions.RequestException as e:
+            print(f"  ⚠️  /api/ps indisponible, budget non vérifié: {e}")
+            return
+        loaded = [entry for entry in plan if entry["action"] != "skip" and entry["resolved"] in running]
+        resident = sum(int(running[entry["resolved"]].get("size", 0)) for entry in loaded)
+        for entry in reversed(loaded):
+            if resident <= self.memory_budget_bytes:
+                break
+            if entry["action"] != "warm":
+                continue
+            try:
+                self.unload(entry["resolved"])
+            except requests.exceptions.RequestException as e:
+                print(f"  ⚠️  Déchargement de {entry['resolved']} impossible: {e}")
+                continue
+            resident -= int(running[entry["resolved"]].get("size", 0))
+            entry["action"], entry["reason"] = "skip", "déchargé (budget dépassé en mémoire réelle)"
+            print(f"  ⚠️  {entry['resolved']} déchargé: budget mémoire dépassé")
+        print(f"  🧮 Mémoire résidente: {resident / GIB:.1f} Go / budget {self.memory_budget_bytes / GIB:.1f} Go")
+    
+    def verify(self, plan: List[Dict[str, Any]]):
+        """Une seconde requête ne doit plus rien charger : la latence du premier token
+        est alors celle du régime établi"""
+        for entry in plan:
+            if entry["action"] == "skip":
+                continue
+            try:
+                entry["probe_load_s"] = self.warm(entry["resolved"], entry["keep_alive"])
+            except requests.exceptions.RequestException as e:
+                print(f"  ⚠️  Vérification de {entry['resolved']} impossible: {e}")
+                continue
+            status = "✅" if entry["probe_load_s"] < 0.1 else "⚠️ "
+            print(f"  {status} {entry['resolved']}: chargement à la requête suivante "
+                  f"{entry['probe_load_s'] * 1000:.0f}ms")
+
 def main():
     """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Configuration automatique d'OpenWebUI et préchargement Ollama")
+    parser.add_argument("--preload-only", action="store_true",
+                        help="Ne faire que le préchargement des modèles Ollama")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Ne pas précharger les modèles dans Ollama")
+    parser.add_argument("--timeout", type=float, default=float(os.getenv("CONFIGURE_WAIT_TIMEOUT", "60")),
+                        help="Délai maximal d'attente des services, en secondes")
+    args = parser.parse_args()
+    
     print("🚀 Configuration automatique d'OpenWebUI")
     print("=" * 50)
     
     # Récupérer l'URL depuis les variables d'environnement ou utiliser la valeur par défaut
     base_url = os.getenv("OPENWEBUI_URL", "http://localhost:3000")
+    preload = not args.no_preload and env_flag("OLLAMA_PRELOAD", True)
+    ollama_url = ollama_url_from_env()
     
-    configurator = OpenWebUIConfigurator(base_url)
-    
-    # Attendre que le service soit prêt
-    if not configurator.wait_for_service():
-        print("❌ Impossible de se connecter à OpenWebUI")
-        return False
+    # Attendre en parallèle que les services soient prêts
+    endpoints = {}
+    if not args.preload_only:
+        endpoints["OpenWebUI"] = f"{base_url}/api/version"
+    if preload:
+        endpoints["Ollama"] = f"{ollama_url}/api/version"
+    ready = wait_for_services(endpoints, args.timeout)
     
-    # Configurer les modèles
-    configurator.configure_models()
-    
-    # Configurer la mémoire
-    configurator.configure_memory_settings()
+    if not args.preload_only:
+        if not ready.get("OpenWebUI"):
+            print("❌ Impossible de se connecter à OpenWebUI")
+            return False
+        
+        configurator = OpenWebUIConfigurator(base_url)
+        
+        # Configurer les modèles
+        configurator.configure_models()
+        
+        # Configurer la mémoire
+        configurator.configure_memory_settings()
+        
+        # Configurer les paramètres vocaux
+        configurator.configure_voice_settings()
     
-    # Configurer les paramètres vocaux
-    configurator.configure_voice_settings()
+    # Précharger les modèles pour que la première conversation ne paie pas leur chargement
+    if preload and ready.get("Ollama"):
+        OllamaPreloader.from_env(ollama_url).preload(list(MODELS_CONFIG))
+    elif preload:
+        print("⚠️  Ollama indisponible, préchargement ignoré")
     
     print("\n✅ Configuration terminée!")
-    print(f"🌐 Accédez à OpenWebUI: {base_url}")
-    print("🔑 Connectez-vous avec les identifiants par défaut")
+    if not args.preload_only:
+        print(f"🌐 Accédez à OpenWebUI: {base_url}")
+        print("🔑 Connectez-vous avec les identifiants par défaut")
     
     return True
 
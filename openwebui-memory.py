@@ -2,189 +2,187 @@
 """
 Module de mémoire pour OpenWebUI avec Qdrant
 Gère la sauvegarde des conversations et la recherche réflexive
+
+Ce script porte le service (API Flask et ASGI) et les commandes d'administration ;
+la mémoire, les backends, les encodeurs, la rétention et les snapshots sont dans
+le paquet openwebui_memory.
 """
 
+import argparse
+import itertools
 import json
+import os
+import sys
+import threading
 import time
-from datetime import datetime
-from typing import List, Dict, Any, Optional
-import requests
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-import numpy as np
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
+from openwebui_memory.backends import (
+    LocalMemoryBackend, MemoryBackend, QdrantBackend, build_search_params, recall_latency_report
+)
+from openwebui_memory.encoders import Encoder, ProcessPoolEncoder, compare_encoders, create_encoder
+from openwebui_memory.memory import AsyncOpenWebUIMemory, OpenWebUIMemory
+from openwebui_memory.retention import RetentionJob, load_summarizer
+from openwebui_memory.schema import CONTEXT_SIMILAR_RESULTS
+from openwebui_memory.snapshot import export_snapshot, import_snapshot
+from openwebui_memory.streams import iter_json_array, iter_ndjson
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class OpenWebUIMemory:
-    def __init__(self, qdrant_host: str = "localhost", qdrant_port: int = 6333):
-        """Initialise le système de mémoire avec Qdrant"""
-        self.qdrant_client = QdrantClient(host=qdrant_host, port=qdrant_port)
-        self.collection_name = "openwebui_memory"
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self._init_collection()
-    
-    def _init_collection(self):
-        """Initialise la collection Qdrant si elle n'existe pas"""
-        try:
-            collections = self.qdrant_client.get_collections()
-            if self.collection_name not in [c.name for c in collections.collections]:
-                self.qdrant_client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(
-                        size=self.embedding_model.get_sentence_embedding_dimension(),
-                        distance=Distance.COSINE
-                    )
-                )
-                logger.info(f"Collection {self.collection_name} créée")
-        except Exception as e:
-            logger.error(f"Erreur lors de l'initialisation de la collection: {e}")
-    
-    def save_conversation(self, user_message: str, ai_response: str, 
-                         model_used: str = "phi3:3.8b", 
-                         session_id: Optional[str] = None) -> bool:
-        """Sauvegarde une conversation dans Qdrant"""
-        try:
-            timestamp = datetime.now().isoformat()
-            session_id = session_id or f"session_{int(time.time())}"
-            
-            # Créer le texte combiné pour l'embedding
-            combined_text = f"User: {user_message}\nAI: {ai_response}"
-            
-            # Générer l'embedding
-            embedding = self.embedding_model.encode(combined_text).tolist()
-            
-            # Préparer les métadonnées
-            metadata = {
-                "user_message": user_message,
-                "ai_response": ai_response,
-                "model_used": model_used,
-                "session_id": session_id,
-                "timestamp": timestamp,
-                "combined_text": combined_text
-            }
-            
-            # Créer le point pour Qdrant
-            point = PointStruct(
-                id=int(time.time() * 1000),  # ID unique basé sur le timestamp
-                vector=embedding,
-                payload=metadata
-            )
-            
-            # Insérer dans Qdrant
-            self.qdrant_client.upsert(
-                collection_name=self.collection_name,
-                points=[point]
-            )
-            
-            logger.info(f"Conversation sauvegardée pour la session {session_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Erreur lors de la sauvegarde: {e}")
-            return False
-    
-    def search_similar_conversations(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Recherche des conversations similaires"""
-        try:
-            # Générer l'embedding de la requête
-            query_embedding = self.embedding_model.encode(query).tolist()
-            
-            # Rechercher dans Qdrant
-            search_result = self.qdrant_client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=limit
-            )
-            
-            # Formater les résultats
-            results = []
-            for hit in search_result:
-                results.append({
-                    "score": hit.score,
-                    "user_message": hit.payload.get("user_message", ""),
-                    "ai_response": hit.payload.get("ai_response", ""),
-                    "model_used": hit.payload.get("model_used", ""),
-                    "session_id": hit.payload.get("session_id", ""),
-                    "timestamp": hit.payload.get("timestamp", "")
-                })
-            
-            return results
-            
-        except Exception as e:
-            logger.error(f"Erreur lors de la recherche: {e}")
-            return []
-    
-    def get_conversation_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Récupère l'historique d'une session spécifique"""
-        try:
-            # Rechercher par session_id
-            search_result = self.qdrant_client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter={"must": [{"key": "session_id", "match": {"value": session_id}}]},
-                limit=limit
-            )
-            
-            # Formater les résultats
-            results = []
-            for hit in search_result[0]:
-                results.append({
-                    "user_message": hit.payload.get("user_message", ""),
-                    "ai_response": hit.payload.get("ai_response", ""),
-                    "model_used": hit.payload.get("model_used", ""),
-                    "timestamp": hit.payload.get("timestamp", "")
-                })
-            
-            # Trier par timestamp
-            results.sort(key=lambda x: x["timestamp"])
-            return results
-            
-        except Exception as e:
-            logger.error(f"Erreur lors de la récupération de l'historique: {e}")
-            return []
-    
-    def create_reflective_context(self, current_query: str, session_id: str = None) -> str:
-        """Crée un contexte réflexif basé sur l'historique et les conversations similaires"""
-        try:
-            context_parts = []
-            
-            # Ajouter l'historique de la session si disponible
-            if session_id:
-                history = self.get_conversation_history(session_id, limit=5)
-                if history:
-                    context_parts.append("=== Historique de la conversation ===")
-                    for conv in history[-3:]:  # Dernières 3 conversations
-                        context_parts.append(f"User: {conv['user_message']}")
-                        context_parts.append(f"AI: {conv['ai_response']}")
-                    context_parts.append("")
-            
-            # Ajouter des conversations similaires
-            similar = self.search_similar_conversations(current_query, limit=3)
-            if similar:
-                context_parts.append("=== Conversations similaires ===")
-                for conv in similar:
-                    context_parts.append(f"User: {conv['user_message']}")
-                    context_parts.append(f"AI: {conv['ai_response']}")
-                context_parts.append("")
-            
-            # Ajouter le contexte actuel
-            context_parts.append("=== Contexte actuel ===")
-            context_parts.append(f"User: {current_query}")
-            
-            return "\n".join(context_parts)
-            
-        except Exception as e:
-            logger.error(f"Erreur lors de la création du contexte réflexif: {e}")
-            return f"User: {current_query}"
-
 # API Flask pour l'intégration avec OpenWebUI
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 
 app = Flask(__name__)
-memory = OpenWebUIMemory(qdrant_host="qdrant")
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+def _env_bool(name: str) -> Optional[bool]:
+    value = os.getenv(name)
+    return value.lower() == "true" if value else None
+
+def backend_from_env(qdrant_host: Optional[str] = None,
+                     qdrant_port: Optional[int] = None) -> MemoryBackend:
+    """Backend choisi par MEMORY_BACKEND (qdrant par défaut, ou local)
+
+    Sans qdrant_host / qdrant_port explicites, QDRANT_HOST et QDRANT_PORT
+    sont utilisés ; QDRANT_PREFER_GRPC, QDRANT_GRPC_PORT, QDRANT_TIMEOUT,
+    QDRANT_RETRIES, QDRANT_RETRY_BACKOFF et QDRANT_POOL_SIZE règlent le transport.
+    MEMORY_TENANT_HNSW=true construit un index HNSW par tenant.
+    """
+    if os.getenv("MEMORY_BACKEND", "qdrant").lower() == "local":
+        return LocalMemoryBackend(os.getenv("MEMORY_LOCAL_PATH", "./memory-data"))
+    return QdrantBackend(
+        qdrant_host or os.getenv("QDRANT_HOST", "qdrant"),
+        qdrant_port or int(os.getenv("QDRANT_PORT", "6333")),
+        quantization=os.getenv("MEMORY_QUANTIZATION") or None,
+        vectors_on_disk=_env_bool("MEMORY_VECTORS_ON_DISK") or False,
+        hnsw_m=_env_int("MEMORY_HNSW_M"),
+        hnsw_ef_construct=_env_int("MEMORY_HNSW_EF_CONSTRUCT"),
+        search_params=build_search_params(
+            hnsw_ef=_env_int("MEMORY_SEARCH_HNSW_EF"),
+            rescore=_env_bool("MEMORY_SEARCH_RESCORE"),
+            oversampling=_env_float("MEMORY_SEARCH_OVERSAMPLING")
+        ),
+        grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
+        prefer_grpc=_env_bool("QDRANT_PREFER_GRPC") or False,
+        timeout=_env_float("QDRANT_TIMEOUT"),
+        retries=int(os.getenv("QDRANT_RETRIES", "2")),
+        retry_backoff=float(os.getenv("QDRANT_RETRY_BACKOFF", "0.2")),
+        pool_size=_env_int("QDRANT_POOL_SIZE"),
+        tenant_hnsw=_env_bool("MEMORY_TENANT_HNSW") or False
+    )
+
+def encoder_from_env() -> Dict[str, Any]:
+    """Modèle et encodeur (MEMORY_EMBEDDING_MODEL, MEMORY_ENCODER, MEMORY_ENCODER_PROCESSES, MEMORY_ONNX_*)"""
+    options: Dict[str, Any] = {}
+    encoder = os.getenv("MEMORY_ENCODER", "torch").lower()
+    if encoder == "onnx":
+        options = {
+            "quantize": _env_bool("MEMORY_ONNX_QUANTIZE") or False,
+            "cache_dir": os.getenv("MEMORY_ONNX_CACHE") or None,
+            "model_path": os.getenv("MEMORY_ONNX_PATH") or None
+        }
+    return {
+        "model_name": os.getenv("MEMORY_EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+        "encoder": encoder,
+        "encoder_processes": int(os.getenv("MEMORY_ENCODER_PROCESSES", "0")),
+        "encoder_threads": _env_int("MEMORY_ENCODER_THREADS"),
+        "encoder_options": options
+    }
+
+def tenancy_from_env() -> Dict[str, Any]:
+    """Séparateur de tenant (MEMORY_TENANT_SEPARATOR) et tenants à collection dédiée"""
+    dedicated = os.getenv("MEMORY_DEDICATED_TENANTS", "")
+    return {
+        "tenant_separator": os.getenv("MEMORY_TENANT_SEPARATOR", ":") or None,
+        "dedicated_tenants": [tenant.strip() for tenant in dedicated.split(",") if tenant.strip()]
+    }
+
+def retention_from_env() -> Dict[str, Any]:
+    """Réglages de RetentionJob (MEMORY_RETENTION_*, MEMORY_COMPACT_AFTER_DAYS)
+
+    Le résumeur (MEMORY_COMPACTION_SUMMARIZER) n'en fait pas partie : il n'est
+    chargé que lorsqu'une rétention est effectivement construite.
+    """
+    return {
+        "ttl_days": _env_float("MEMORY_RETENTION_TTL_DAYS"),
+        "max_turns_per_session": _env_int("MEMORY_RETENTION_MAX_TURNS"),
+        "compact_after_days": _env_float("MEMORY_COMPACT_AFTER_DAYS"),
+        "batch_size": int(os.getenv("MEMORY_RETENTION_BATCH_SIZE", "256")),
+        "state_path": os.getenv("MEMORY_RETENTION_STATE") or None
+    }
+
+def clamp_ingest_options(batch_size: int, parallelism: int) -> Tuple[int, int]:
+    """Borne batch_size et parallelism d'un import en masse (MEMORY_MAX_BATCH_SIZE, MEMORY_MAX_PARALLELISM)"""
+    max_batch_size = int(os.getenv("MEMORY_MAX_BATCH_SIZE", "1024"))
+    max_parallelism = int(os.getenv("MEMORY_MAX_PARALLELISM", "8"))
+    return min(max(1, batch_size), max_batch_size), min(max(1, parallelism), max_parallelism)
+
+memory = OpenWebUIMemory(
+    qdrant_host=os.getenv("QDRANT_HOST", "qdrant"),
+    qdrant_port=int(os.getenv("QDRANT_PORT", "6333")),
+    batching=os.getenv("MEMORY_BATCHING", "false").lower() == "true",
+    batch_max_size=int(os.getenv("MEMORY_BATCH_MAX_SIZE", "32")),
+    batch_max_wait_ms=float(os.getenv("MEMORY_BATCH_MAX_WAIT_MS", "5")),
+    query_cache_size=int(os.getenv("MEMORY_QUERY_CACHE_SIZE", "1024")),
+    query_cache_ttl=float(os.getenv("MEMORY_QUERY_CACHE_TTL", "3600")),
+    backend=backend_from_env(),
+    compress_threshold=int(os.getenv("MEMORY_COMPRESS_THRESHOLD", "0")),
+    chunk_tokens=int(os.getenv("MEMORY_CHUNK_TOKENS", "0")),
+    chunk_overlap=int(os.getenv("MEMORY_CHUNK_OVERLAP", "32")),
+    max_chunks=int(os.getenv("MEMORY_MAX_CHUNKS", "8")),
+    context_max_tokens=_env_int("MEMORY_CONTEXT_MAX_TOKENS"),
+    similarity_threshold=_env_float("MEMORY_SIMILARITY_THRESHOLD"),
+    context_max_results=int(os.getenv("MEMORY_CONTEXT_MAX_RESULTS", str(CONTEXT_SIMILAR_RESULTS))),
+    slow_request_ms=_env_float("MEMORY_SLOW_REQUEST_MS"),
+    **encoder_from_env(),
+    **tenancy_from_env()
+)
+
+# Construite par start_background_tasks si MEMORY_RETENTION_INTERVAL_S est défini
+retention: Optional[RetentionJob] = None
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_tasks():
+    """Préchauffage, puis rétention toutes les MEMORY_RETENTION_INTERVAL_S secondes si défini
+
+    Sans effet après le premier appel dans le processus. Un résumeur
+    introuvable est journalisé et laisse la rétention désactivée, sans
+    empêcher le service de démarrer.
+    """
+    global _background_started, retention
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    memory.start_warm_up()
+    interval = _env_float("MEMORY_RETENTION_INTERVAL_S")
+    if not interval:
+        return
+    try:
+        summarizer = load_summarizer(os.getenv("MEMORY_COMPACTION_SUMMARIZER"))
+    except Exception as e:
+        logger.error(f"Rétention désactivée, résumeur invalide: {e}")
+        return
+    retention = RetentionJob(memory, summarizer=summarizer, **retention_from_env())
+    retention.start(interval)
+
+@app.before_request
+def ensure_background_tasks():
+    """Serveur WSGI qui importe app sans passer par main() (gunicorn) : préchauffage à la première requête"""
+    if not _background_started:
+        start_background_tasks()
 
 @app.route('/memory/save', methods=['POST'])
 def save_conversation():
@@ -194,17 +192,47 @@ def save_conversation():
         user_message=data.get('user_message', ''),
         ai_response=data.get('ai_response', ''),
         model_used=data.get('model_used', 'phi3:3.8b'),
-        session_id=data.get('session_id')
+        session_id=data.get('session_id'),
+        idempotency_key=data.get('idempotency_key') or request.headers.get('Idempotency-Key'),
+        tenant_id=data.get('tenant_id') or request.headers.get('X-Tenant-Id')
     )
     return jsonify({"success": success})
 
+@app.route('/memory/save_batch', methods=['POST'])
+def save_conversations():
+    """Endpoint d'import en masse (tableau JSON ou flux NDJSON), lu en flux"""
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        records = iter_ndjson(request.stream)
+    else:
+        records = iter_json_array(request.stream)
+        try:
+            # Première lecture : vérifie que le corps est bien un tableau
+            first = next(records, None)
+        except ValueError:
+            return jsonify({"error": "Tableau JSON ou flux NDJSON attendu"}), 400
+        records = itertools.chain([] if first is None else [first], records)
+    batch_size, parallelism = clamp_ingest_options(
+        request.args.get('batch_size', 256, type=int),
+        request.args.get('parallelism', 4, type=int)
+    )
+    report = memory.save_conversations(records, batch_size=batch_size, parallelism=parallelism)
+    report["success"] = report["failed"] == 0
+    return jsonify(report)
+
 @app.route('/memory/search', methods=['POST'])
 def search_conversations():
     """Endpoint pour rechercher des conversations similaires"""
     data = request.json
     results = memory.search_similar_conversations(
         query=data.get('query', ''),
-        limit=data.get('limit', 5)
+        limit=data.get('limit', 5),
+        hnsw_ef=data.get('hnsw_ef'),
+        exact=data.get('exact', False),
+        rescore=data.get('rescore'),
+        oversampling=data.get('oversampling'),
+        ids_only=data.get('ids_only', False),
+        tenant_id=data.get('tenant_id') or request.headers.get('X-Tenant-Id'),
+        session_id=data.get('session_id')
     )
     return jsonify({"results": results})
 
@@ -212,11 +240,376 @@ def search_conversations():
 def get_reflective_context():
     """Endpoint pour obtenir le contexte réflexif"""
     data = request.json
+    timings = {} if data.get('include_timings') else None
     context = memory.create_reflective_context(
         current_query=data.get('query', ''),
-        session_id=data.get('session_id')
+        session_id=data.get('session_id'),
+        timings=timings,
+        max_tokens=data.get('max_tokens'),
+        score_threshold=data.get('score_threshold'),
+        max_results=data.get('max_results'),
+        tenant_id=data.get('tenant_id') or request.headers.get('X-Tenant-Id')
     )
-    return jsonify({"context": context})
+    response = {"context": context}
+    if timings is not None:
+        response["timings"] = timings
+    return jsonify(response)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Sonde de vivacité : le processus répond"""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Sonde de préparation : modèle chargé et collection disponible"""
+    state = memory.readiness()
+    return jsonify(state), 200 if state["ready"] else 503
+
+@app.route('/memory/stats', methods=['GET'])
+def get_stats():
+    """Endpoint des statistiques du service"""
+    return jsonify(memory.get_stats())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Métriques Prometheus (latences par étape, erreurs, état du service)"""
+    return Response(memory.get_metrics(), mimetype="text/plain; version=0.0.4")
+
+# API ASGI (FastAPI) : même contrat JSON, à lancer avec
+#   uvicorn openwebui-memory:asgi_app --host 0.0.0.0 --port 5001 --workers 4
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, ConfigDict
+
+class SaveRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    user_message: str = ""
+    ai_response: str = ""
+    model_used: str = "phi3:3.8b"
+    session_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    tenant_id: Optional[str] = None
+
+class SearchRequest(BaseModel):
+    query: str = ""
+    limit: int = 5
+    hnsw_ef: Optional[int] = None
+    exact: bool = False
+    rescore: Optional[bool] = None
+    oversampling: Optional[float] = None
+    ids_only: bool = False
+    tenant_id: Optional[str] = None
+    session_id: Optional[str] = None
+
+class ContextRequest(BaseModel):
+    query: str = ""
+    session_id: Optional[str] = None
+    include_timings: bool = False
+    max_tokens: Optional[int] = None
+    score_threshold: Optional[float] = None
+    max_results: Optional[int] = None
+    tenant_id: Optional[str] = None
+
+@asynccontextmanager
+async def asgi_lifespan(application: FastAPI):
+    start_background_tasks()
+    application.state.memory = AsyncOpenWebUIMemory(
+        memory,
+        encode_workers=int(os.getenv("MEMORY_ENCODE_WORKERS", "2"))
+    )
+    yield
+    if retention is not None:
+        retention.stop()
+    await application.state.memory.close()
+
+asgi_app = FastAPI(title="OpenWebUI Memory", lifespan=asgi_lifespan)
+
+@asgi_app.get('/healthz')
+async def asgi_healthz():
+    """Sonde de vivacité : le processus répond"""
+    return {"status": "ok"}
+
+@asgi_app.get('/readyz')
+async def asgi_readyz():
+    """Sonde de préparation : modèle chargé et collection disponible"""
+    state = memory.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@asgi_app.get('/metrics')
+def asgi_get_metrics():
+    """Métriques Prometheus du worker qui répond (comptage Qdrant bloquant : hors boucle)"""
+    return PlainTextResponse(memory.get_metrics(), media_type="text/plain; version=0.0.4")
+
+@asgi_app.post('/memory/save')
+async def asgi_save_conversation(data: SaveRequest,
+                                 idempotency_key: Optional[str] = Header(None),
+                                 x_tenant_id: Optional[str] = Header(None)):
+    """Endpoint pour sauvegarder une conversation"""
+    success = await asgi_app.state.memory.save_conversation(
+        user_message=data.user_message,
+        ai_response=data.ai_response,
+        model_used=data.model_used,
+        session_id=data.session_id,
+        idempotency_key=data.idempotency_key or idempotency_key,
+        tenant_id=data.tenant_id or x_tenant_id
+    )
+    return {"success": success}
+
+@asgi_app.post('/memory/search')
+async def asgi_search_conversations(data: SearchRequest,
+                                    x_tenant_id: Optional[str] = Header(None)):
+    """Endpoint pour rechercher des conversations similaires"""
+    results = await asgi_app.state.memory.search_similar_conversations(
+        query=data.query,
+        limit=data.limit,
+        hnsw_ef=data.hnsw_ef,
+        exact=data.exact,
+        rescore=data.rescore,
+        oversampling=data.oversampling,
+        ids_only=data.ids_only,
+        tenant_id=data.tenant_id or x_tenant_id,
+        session_id=data.session_id
+    )
+    return {"results": results}
+
+@asgi_app.post('/memory/context')
+async def asgi_get_reflective_context(data: ContextRequest,
+                                      x_tenant_id: Optional[str] = Header(None)):
+    """Endpoint pour obtenir le contexte réflexif"""
+    timings = {} if data.include_timings else None
+    context = await asgi_app.state.memory.create_reflective_context(
+        current_query=data.query,
+        session_id=data.session_id,
+        timings=timings,
+        max_tokens=data.max_tokens,
+        score_threshold=data.score_threshold,
+        max_results=data.max_results,
+        tenant_id=data.tenant_id or x_tenant_id
+    )
+    response = {"context": context}
+    if timings is not None:
+        response["timings"] = timings
+    return response
+
+def import_file(path: str, qdrant_host: str, qdrant_port: int,
+                batch_size: int, parallelism: int) -> Dict[str, Any]:
+    """Importe hors ligne un fichier JSON (tableau) ou NDJSON de conversations"""
+    importer = OpenWebUIMemory(qdrant_host=qdrant_host, qdrant_port=qdrant_port,
+                               backend=backend_from_env(qdrant_host, qdrant_port),
+                               compress_threshold=int(os.getenv("MEMORY_COMPRESS_THRESHOLD", "0")),
+                               **encoder_from_env(), **tenancy_from_env())
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            first = f.read(1)
+            while first and first.isspace():
+                first = f.read(1)
+            f.seek(0)
+            records = iter_json_array(f) if first == "[" else iter_ndjson(f)
+            batch_size, parallelism = clamp_ingest_options(batch_size, parallelism)
+            return importer.save_conversations(records, batch_size=batch_size, parallelism=parallelism)
+    finally:
+        importer.close()
+
+# Phrases de contrôle de check-encoder (longueurs et langues variées)
+ENCODER_CHECK_TEXTS = [
+    "Bonjour, comment vas-tu ?",
+    "User: Peux-tu résumer notre dernière conversation ?\nAI: Nous avons parlé de Qdrant.",
+    "How do I configure the gRPC port for the vector database?",
+    "La quantification int8 réduit la mémoire mais peut dégrader légèrement la précision.",
+    "def save_conversation(self, user_message, ai_response): return True",
+    " ".join(["Un texte long pour atteindre la limite de séquence du modèle."] * 40),
+]
+
+def check_encoder(kind: str, tolerance: float, texts: List[str],
+                  processes: int = 0, **options) -> Dict[str, Any]:
+    """Compare un encodeur à la référence PyTorch et mesure le débit de chacun"""
+    model_name = memory.model_name
+    reference = create_encoder("torch", model_name)
+    candidate = (ProcessPoolEncoder(kind, model_name, processes, **options) if processes > 0
+                 else create_encoder(kind, model_name, **options))
+    try:
+        report = compare_encoders(candidate, reference, texts)
+        report["tolerance"] = tolerance
+        report["ok"] = 1 - report["min_cosine"] <= tolerance
+        corpus = texts * max(1, 256 // len(texts))
+        for name, encoder in (("reference", reference), ("candidate", candidate)):
+            start = time.perf_counter()
+            encoder.encode(corpus, batch_size=32)
+            report[f"{name}_texts_per_s"] = round(len(corpus) / (time.perf_counter() - start), 1)
+        return report
+    finally:
+        if isinstance(candidate, Encoder):
+            candidate.close()
+
+def main(argv: Optional[List[str]] = None):
+    """Point d'entrée : serveur API (par défaut, sans debug) ou commandes d'administration"""
+    parser = argparse.ArgumentParser(description="API de mémoire OpenWebUI")
+    subparsers = parser.add_subparsers(dest="command")
+    qdrant_args = argparse.ArgumentParser(add_help=False)
+    qdrant_args.add_argument("--qdrant-host", default=os.getenv("QDRANT_HOST", "localhost"))
+    qdrant_args.add_argument("--qdrant-port", type=int, default=int(os.getenv("QDRANT_PORT", "6333")))
+    import_parser = subparsers.add_parser("import", parents=[qdrant_args],
+                                          help="Importer un fichier JSON/NDJSON de conversations")
+    import_parser.add_argument("path", help="Fichier JSON (tableau) ou NDJSON")
+    import_parser.add_argument("--batch-size", type=int, default=256)
+    import_parser.add_argument("--parallelism", type=int, default=4)
+    export_parser = subparsers.add_parser("export-snapshot", parents=[qdrant_args],
+                                          help="Exporter la mémoire (vecteurs .npy + payloads NDJSON gzip)")
+    export_parser.add_argument("path", help="Répertoire du snapshot")
+    export_parser.add_argument("--batch-size", type=int, default=1024)
+    export_parser.add_argument("--float16", action="store_true", help="Vecteurs en float16 (taille divisée par deux)")
+    snapshot_parser = subparsers.add_parser("import-snapshot", parents=[qdrant_args],
+                                            help="Importer un snapshot d'export-snapshot")
+    snapshot_parser.add_argument("path", help="Répertoire du snapshot")
+    snapshot_parser.add_argument("--batch-size", type=int, default=512)
+    snapshot_parser.add_argument("--parallelism", type=int, default=4)
+    snapshot_parser.add_argument("--reencode", action=argparse.BooleanOptionalAction, default=None,
+                                 help="Réencoder avec MEMORY_EMBEDDING_MODEL (défaut : si le modèle diffère)")
+    subparsers.add_parser("backfill-timestamps", parents=[qdrant_args],
+                          help="Ajouter timestamp_ms aux points existants")
+    subparsers.add_parser("backfill-tenants", parents=[qdrant_args],
+                          help="Ajouter tenant_id (déduit de session_id) aux points existants")
+    subparsers.add_parser("tune-collection", parents=[qdrant_args],
+                          help="Appliquer quantification / on_disk / HNSW (MEMORY_*) à la collection existante")
+    report_parser = subparsers.add_parser("recall-report", parents=[qdrant_args],
+                                          help="Rapport rappel / latence des réglages de recherche")
+    report_parser.add_argument("--sample-size", type=int, default=50)
+    report_parser.add_argument("--limit", type=int, default=10)
+    report_parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    check_parser = subparsers.add_parser("check-encoder",
+                                         help="Comparer un encodeur (ONNX, int8, pool) à la référence PyTorch")
+    check_parser.add_argument("--encoder", choices=["torch", "onnx"], default="onnx")
+    check_parser.add_argument("--quantize", action="store_true", help="Modèle ONNX quantifié int8")
+    check_parser.add_argument("--model-path", help="Répertoire local (model.onnx et tokenizer)")
+    check_parser.add_argument("--processes", type=int, default=0, help="Encodage dans un pool de processus")
+    check_parser.add_argument("--tolerance", type=float, default=0.01,
+                              help="Écart cosinus maximal toléré (1 - cosinus minimal)")
+    check_parser.add_argument("--texts-file", help="Fichier de textes de contrôle (un par ligne)")
+    retention_parser = subparsers.add_parser("retention", parents=[qdrant_args],
+                                             help="Appliquer TTL, plafond par session et compaction (reprenable)")
+    retention_settings = retention_from_env()
+    retention_parser.add_argument("--ttl-days", type=float, default=retention_settings["ttl_days"])
+    retention_parser.add_argument("--max-turns", type=int,
+                                  default=retention_settings["max_turns_per_session"],
+                                  help="Tours gardés par session (les plus récents)")
+    retention_parser.add_argument("--compact-after-days", type=float,
+                                  default=retention_settings["compact_after_days"],
+                                  help="Résumer les sessions inactives depuis ce nombre de jours")
+    retention_parser.add_argument("--summarizer", default=os.getenv("MEMORY_COMPACTION_SUMMARIZER"),
+                                  help="extractive (défaut) ou module:fabrique")
+    retention_parser.add_argument("--batch-size", type=int, default=retention_settings["batch_size"])
+    retention_parser.add_argument("--state", default=retention_settings["state_path"],
+                                  help="Fichier d'état pour reprendre un passage interrompu")
+    serve_parser = subparsers.add_parser("serve", help="Lancer l'API (Flask par défaut)")
+    serve_parser.add_argument("--asgi", action="store_true", help="Servir l'API ASGI avec uvicorn")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=int(os.getenv("MEMORY_API_PORT", "5001")))
+    serve_parser.add_argument("--workers", type=int, default=int(os.getenv("MEMORY_API_WORKERS", "1")))
+    serve_parser.add_argument("--debug", action="store_true",
+                              help="Serveur Flask de debug avec rechargement (développement uniquement)")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        # Sans sous-commande : même serveur que "serve", jamais en mode debug
+        args = parser.parse_args(["serve"])
+    
+    if args.command == "import":
+        report = import_file(args.path, args.qdrant_host, args.qdrant_port,
+                             args.batch_size, args.parallelism)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0 if report["failed"] == 0 else 1
+    
+    if args.command in ("export-snapshot", "import-snapshot"):
+        target = OpenWebUIMemory(qdrant_host=args.qdrant_host, qdrant_port=args.qdrant_port,
+                                 backend=backend_from_env(args.qdrant_host, args.qdrant_port),
+                                 compress_threshold=int(os.getenv("MEMORY_COMPRESS_THRESHOLD", "0")),
+                                 chunk_tokens=int(os.getenv("MEMORY_CHUNK_TOKENS", "0")),
+                                 chunk_overlap=int(os.getenv("MEMORY_CHUNK_OVERLAP", "32")),
+                                 max_chunks=int(os.getenv("MEMORY_MAX_CHUNKS", "8")),
+                                 **encoder_from_env(), **tenancy_from_env())
+        try:
+            if args.command == "export-snapshot":
+                report = export_snapshot(target, args.path, args.batch_size,
+                                         "float16" if args.float16 else "float32")
+            else:
+                report = import_snapshot(target, args.path, args.batch_size, args.parallelism, args.reencode)
+        finally:
+            target.close()
+        print(json.dumps(report, indent=2))
+        return 0
+    
+    if args.command == "backfill-timestamps":
+        migrator = OpenWebUIMemory(qdrant_host=args.qdrant_host, qdrant_port=args.qdrant_port,
+                                   backend=backend_from_env(args.qdrant_host, args.qdrant_port))
+        print(f"{migrator.backfill_timestamps()} points mis à jour")
+        return 0
+    
+    if args.command == "backfill-tenants":
+        migrator = OpenWebUIMemory(qdrant_host=args.qdrant_host, qdrant_port=args.qdrant_port,
+                                   backend=backend_from_env(args.qdrant_host, args.qdrant_port),
+                                   **tenancy_from_env())
+        print(f"{migrator.backfill_tenants()} points mis à jour")
+        return 0
+    
+    if args.command == "retention":
+        target = OpenWebUIMemory(qdrant_host=args.qdrant_host, qdrant_port=args.qdrant_port,
+                                 backend=backend_from_env(args.qdrant_host, args.qdrant_port),
+                                 compress_threshold=int(os.getenv("MEMORY_COMPRESS_THRESHOLD", "0")),
+                                 **encoder_from_env(), **tenancy_from_env())
+        job = RetentionJob(target, ttl_days=args.ttl_days, max_turns_per_session=args.max_turns,
+                           compact_after_days=args.compact_after_days,
+                           summarizer=load_summarizer(args.summarizer),
+                           batch_size=args.batch_size, state_path=args.state)
+        try:
+            print(json.dumps(job.run(), indent=2))
+        finally:
+            target.close()
+        return 0
+    
+    if args.command == "tune-collection":
+        backend = backend_from_env(args.qdrant_host, args.qdrant_port)
+        backend.apply_collection_config()
+        return 0
+    
+    if args.command == "recall-report":
+        backend = backend_from_env(args.qdrant_host, args.qdrant_port)
+        if not isinstance(backend, QdrantBackend):
+            parser.error("recall-report mesure l'index HNSW de Qdrant (MEMORY_BACKEND=qdrant)")
+        report = recall_latency_report(backend, args.sample_size, args.limit, args.ef)
+        print(json.dumps(report, indent=2))
+        return 0
+    
+    if args.command == "check-encoder":
+        texts = ENCODER_CHECK_TEXTS
+        if args.texts_file:
+            with open(args.texts_file, "r", encoding="utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+        options: Dict[str, Any] = {}
+        if args.encoder == "onnx":
+            options = {"quantize": args.quantize, "model_path": args.model_path}
+        report = check_encoder(args.encoder, args.tolerance, texts, args.processes, **options)
+        print(json.dumps(report, indent=2))
+        return 0 if report["ok"] else 1
+    
+    if args.command == "serve" and args.asgi:
+        import uvicorn
+        module_name = os.path.splitext(os.path.basename(__file__))[0]
+        uvicorn.run(f"{module_name}:asgi_app", host=args.host, port=args.port,
+                    workers=args.workers, app_dir=os.path.dirname(os.path.abspath(__file__)))
+        return 0
+    
+    if args.debug:
+        # Avec le reloader de debug, seul le processus enfant sert les requêtes
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            start_background_tasks()
+        app.run(host=args.host, port=args.port, debug=True)
+        return 0
+    
+    start_background_tasks()
+    app.run(host=args.host, port=args.port)
+    return 0
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Mémoire des conversations OpenWebUI (Qdrant ou stockage local)
+
+- schema : champs de payload, tenants et IDs des points
+- streams : lecture en flux des imports en masse
+- metrics : métriques Prometheus par étape
+- encoders : encodeurs d'embeddings, cache des requêtes et micro-batching
+- backends : stockage Qdrant et stockage local
+- memory : OpenWebUIMemory et sa variante asynchrone
+- retention : TTL, plafond par session et compaction
+- snapshot : export / import en flux
+
+Le service HTTP et les commandes d'administration sont dans openwebui-memory.py.
+"""
+
+from .schema import (
+    CHUNK_HIT_FIELDS, CHUNK_KIND, CHUNK_SEARCH_OVERSAMPLING, CONTEXT_HISTORY_TURNS,
+    CONTEXT_SIMILAR_RESULTS, DEFAULT_TENANT, HISTORY_PAYLOAD_FIELDS, PAYLOAD_INDEXES,
+    POINT_ID_NAMESPACE, SEARCH_PAYLOAD_FIELDS, SUMMARY_KIND, TENANT_FIELD, TEXT_FIELDS,
+    chunk_point_id, collapse_chunk_hits, combined_text, compress_text, payload_text,
+    resolve_tenant, resolve_turn_hits, tenant_collection_name, tenant_filter,
+    timestamp_to_ms, turn_point_id, widened_search_limit
+)
+from .streams import JSON_READ_CHUNK, MAX_JSON_RECORD_CHARS, iter_json_array, iter_ndjson
+from .metrics import BATCH_SIZE_BUCKETS, LATENCY_BUCKETS, StageMetrics
+from .encoders import (
+    EmbeddingBatcher, Encoder, OnnxEncoder, ProcessPoolEncoder, QueryEmbeddingCache,
+    compare_encoders, create_encoder, encode_kwargs, encoder_lowercases
+)
+from .backends import (
+    LocalMemoryBackend, MemoryBackend, QdrantBackend, build_search_params,
+    is_transient_error, recall_latency_report
+)
+from .memory import MAX_REPORTED_ERRORS, AsyncOpenWebUIMemory, OpenWebUIMemory
+from .retention import ExtractiveSummarizer, RetentionJob, Summarizer, load_summarizer
+from .snapshot import (
+    NPY_HEADER_BYTES, SNAPSHOT_FORMAT, SNAPSHOT_MANIFEST, SNAPSHOT_PAYLOADS, SNAPSHOT_VECTORS,
+    SNAPSHOT_VERSION, ThroughputReport, export_snapshot, import_snapshot, read_snapshot_manifest
+)
@@ -0,0 +1,880 @@
+"""
+Backends de stockage : Qdrant (serveur ou client embarqué) et stockage local sans serveur
+"""
+
+import asyncio
+import copy
+import json
+import os
+import random
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+from qdrant_client.models import (
+    BinaryQuantization, BinaryQuantizationConfig, Direction, Disabled, Distance,
+    FieldCondition, Filter, HnswConfigDiff, IsEmptyCondition, MatchValue, OrderBy,
+    PayloadField, PointIdsList, PointStruct, QuantizationSearchParams,
+    Range, Record, ScalarQuantization, ScalarQuantizationConfig, ScalarType, ScoredPoint,
+    SearchParams, SetPayload, SetPayloadOperation, VectorParams, VectorParamsDiff
+)
+import numpy as np
+import logging
+
+from .schema import (
+    CHUNK_KIND, DEFAULT_TENANT, HISTORY_PAYLOAD_FIELDS, PAYLOAD_INDEXES, SEARCH_PAYLOAD_FIELDS,
+    TENANT_FIELD, resolve_tenant, tenant_filter, timestamp_to_ms
+)
+
+logger = logging.getLogger(__name__)
+
+def is_transient_error(error: Exception) -> bool:
+    """Erreur de transport qui mérite une nouvelle tentative (REST ou gRPC)"""
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code in (429, 502, 503, 504)
+    if isinstance(error, (ResponseHandlingException, ConnectionError, TimeoutError)):
+        return True
+    # grpc.RpcError expose code() ; pas d'import de grpc pour le chemin REST
+    code = getattr(error, "code", None)
+    if callable(code):
+        return getattr(code(), "name", None) in (
+            "UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED", "ABORTED"
+        )
+    return False
+
+def build_search_params(hnsw_ef: Optional[int] = None, exact: bool = False,
+                        rescore: Optional[bool] = None,
+                        oversampling: Optional[float] = None) -> Optional[SearchParams]:
+    """Paramètres de recherche Qdrant (ef HNSW, recherche exacte, rescoring)"""
+    quantization = None
+    if rescore is not None or oversampling is not None:
+        quantization = QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+    if hnsw_ef is None and not exact and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+class MemoryBackend:
+    """Interface de stockage des conversations (vecteur + payload par point)
+
+    Les résultats sont renvoyés sous forme de ScoredPoint / Record Qdrant afin
+    que le formatage soit commun à toutes les implémentations.
+    """
+
+    def ensure_collection(self, vector_size: int):
+        """Crée le stockage s'il n'existe pas encore"""
+        raise NotImplementedError
+
+    def upsert(self, points: List[PointStruct], wait: bool = True):
+        """Insère ou remplace des points"""
+        raise NotImplementedError
+
+    def search(self, vector: List[float], limit: int,
+               search_params: Optional[SearchParams] = None,
+               with_payload: Any = SEARCH_PAYLOAD_FIELDS,
+               score_threshold: Optional[float] = None,
+               tenant: Optional[str] = None) -> List[ScoredPoint]:
+        """Les limit points les plus proches (similarité cosinus)
+
+        search_params n'est utilisé que par les backends à index approximatif ;
+        with_payload suit la convention Qdrant (booléen ou liste de champs) ;
+        les points sous score_threshold sont écartés par le backend. Avec
+        tenant, seuls les points de ce tenant sont considérés (None : tous,
+        pour les outils d'administration).
+        """
+        raise NotImplementedError
+
+    def session_history(self, session_id: str, limit: int,
+                        tenant: Optional[str] = None) -> List[Record]:
+        """Les limit derniers tours d'une session, les plus récents d'abord
+
+        Les points de type chunk sont exclus ; seuls les champs
+        HISTORY_PAYLOAD_FIELDS sont requis dans les payloads.
+        """
+        raise NotImplementedError
+
+    def retrieve(self, ids: List[Any], with_payload: Any = SEARCH_PAYLOAD_FIELDS) -> List[Record]:
+        """Points par ID (les IDs inconnus sont ignorés)"""
+        raise NotImplementedError
+
+    def existing_ids(self, ids: List[Any]) -> set:
+        """Sous-ensemble des ids déjà stockés (sans lire les payloads)"""
+        return {record.id for record in self.retrieve(ids, with_payload=False)}
+
+    def count(self, exact: bool = True) -> int:
+        """Nombre de points stockés (exact=False : estimation bon marché, pour les métriques)"""
+        raise NotImplementedError
+
+    def scan(self, offset: Any = None, limit: int = 256, before_ms: Optional[int] = None,
+             with_payload: Any = True, with_vectors: bool = False,
+             session_id: Optional[str] = None) -> Tuple[List[Record], Any]:
+        """Une page de points (chunks compris) et l'offset de la page suivante (None à la fin)
+
+        Avec before_ms, seuls les points dont timestamp_ms est antérieur sont
+        renvoyés ; les points à timestamp illisible (timestamp_ms = 0) ne le
+        sont jamais. Avec session_id, seuls les points de cette session (tous
+        tenants confondus). Supprimer les points d'une page ne décale pas
+        l'offset. with_vectors ajoute l'embedding de chaque point (export).
+        """
+        raise NotImplementedError
+
+    def delete(self, ids: List[Any]):
+        """Supprime des points par ID (les IDs inconnus sont ignorés)"""
+        raise NotImplementedError
+
+    def vacuum(self) -> int:
+        """Récupère l'espace des points supprimés ; retourne les octets libérés"""
+        return 0
+
+    def for_collection(self, collection_name: str) -> "MemoryBackend":
+        """Même stockage, autre collection (collections dédiées aux gros tenants)"""
+        raise NotImplementedError
+
+    def apply_collection_config(self):
+        """Applique les réglages d'index à une collection existante ; rien à faire par défaut"""
+        logger.info(f"{type(self).__name__} : aucun réglage de collection à appliquer")
+
+    def backfill_timestamps(self, batch_size: int = 256) -> int:
+        """Migration des points sans timestamp_ms ; rien à faire par défaut"""
+        return 0
+
+    def backfill_tenants(self, separator: Optional[str], batch_size: int = 256) -> int:
+        """Migration des points sans tenant_id ; rien à faire par défaut"""
+        return 0
+
+    def close(self):
+        pass
+
+class QdrantBackend(MemoryBackend):
+    """Stockage dans une collection Qdrant
+
+    quantization ("scalar" int8 ou "binary") garde les vecteurs quantifiés en
+    RAM ; avec vectors_on_disk=True, les vecteurs originaux restent sur disque
+    et ne servent qu'au rescoring. hnsw_m / hnsw_ef_construct règlent l'index,
+    search_params fixe les paramètres de recherche par défaut.
+    
+    prefer_grpc fait passer les données par gRPC (grpc_port, 6334) plutôt que
+    REST. Un seul client (pool httpx de pool_size connexions ou canal gRPC
+    multiplexé) est partagé par tous les threads du processus ; les appels
+    de données sont rejoués jusqu'à retries fois, avec un délai exponentiel
+    à partir de retry_backoff secondes, sur les erreurs transitoires.
+    
+    Avec tenant_hnsw=True, le graphe HNSW global est remplacé par un graphe
+    par tenant (m=0, payload_m) : une recherche filtrée ne parcourt que les
+    données du tenant, quelle que soit la taille de la collection.
+    
+    host=":memory:" utilise le client Qdrant embarqué (tests, sans serveur).
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6333,
+                 collection_name: str = "openwebui_memory",
+                 quantization: Optional[str] = None, vectors_on_disk: bool = False,
+                 hnsw_m: Optional[int] = None, hnsw_ef_construct: Optional[int] = None,
+                 search_params: Optional[SearchParams] = None,
+                 grpc_port: int = 6334, prefer_grpc: bool = False,
+                 timeout: Optional[float] = None, retries: int = 2,
+                 retry_backoff: float = 0.2, pool_size: Optional[int] = None,
+                 tenant_hnsw: bool = False):
+        if quantization not in (None, "none", "scalar", "binary"):
+            raise ValueError(f"Quantification inconnue: {quantization}")
+        self.host = host
+        self.port = port
+        self.collection_name = collection_name
+        self.quantization = None if quantization == "none" else quantization
+        self.vectors_on_disk = vectors_on_disk
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.search_params = search_params
+        self.grpc_port = grpc_port
+        self.prefer_grpc = prefer_grpc
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff
+        self.pool_size = pool_size
+        self.tenant_hnsw = tenant_hnsw
+        self._client = None
+        self._owns_client = True
+        self._lock = threading.Lock()
+
+    def _client_args(self) -> Dict[str, Any]:
+        if self.host == ":memory:":
+            # Qdrant embarqué dans le processus, sans serveur (tests)
+            return {"location": ":memory:"}
+        args = {
+            "host": self.host,
+            "port": self.port,
+            "grpc_port": self.grpc_port,
+            "prefer_grpc": self.prefer_grpc,
+            "timeout": self.timeout
+        }
+        if self.pool_size:
+            import httpx
+            args["limits"] = httpx.Limits(max_connections=self.pool_size,
+                                          max_keepalive_connections=self.pool_size)
+        return args
+
+    @property
+    def client(self) -> QdrantClient:
+        """Client Qdrant, créé au premier accès"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = QdrantClient(**self._client_args())
+        return self._client
+
+    def create_async_client(self) -> AsyncQdrantClient:
+        return AsyncQdrantClient(**self._client_args())
+
+    def _retry_delay(self, attempt: int) -> float:
+        # Délai exponentiel avec gigue pour ne pas synchroniser les reprises
+        return self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def call(self, fn, *args, **kwargs):
+        """Appelle fn en rejouant les erreurs transitoires"""
+        for attempt in range(self.retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries or not is_transient_error(e):
+                    raise
+                logger.warning(f"Erreur Qdrant transitoire, nouvelle tentative: {e}")
+                time.sleep(self._retry_delay(attempt))
+
+    async def acall(self, fn, *args, **kwargs):
+        """Variante asynchrone de call() pour AsyncQdrantClient"""
+        for attempt in range(self.retries + 1):
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries or not is_transient_error(e):
+                    raise
+                logger.warning(f"Erreur Qdrant transitoire, nouvelle tentative: {e}")
+                await asyncio.sleep(self._retry_delay(attempt))
+
+    def _quantization_config(self):
+        if self.quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=True
+            ))
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def _hnsw_config(self) -> Optional[HnswConfigDiff]:
+        if self.tenant_hnsw:
+            return HnswConfigDiff(m=0, payload_m=self.hnsw_m or 16,
+                                  ef_construct=self.hnsw_ef_construct)
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def ensure_collection(self, vector_size: int):
+        collections = self.client.get_collections()
+        if self.collection_name not in [c.name for c in collections.collections]:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(
+                    size=vector_size,
+                    distance=Distance.COSINE,
+                    on_disk=self.vectors_on_disk or None
+                ),
+                hnsw_config=self._hnsw_config(),
+                quantization_config=self._quantization_config()
+            )
+            logger.info(f"Collection {self.collection_name} créée")
+        # Idempotent : ajoute aussi les index manquants d'une collection existante
+        for field_name, schema in PAYLOAD_INDEXES.items():
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name=field_name,
+                field_schema=schema
+            )
+
+    def apply_collection_config(self):
+        """Applique quantification, stockage sur disque et HNSW à une collection existante
+
+        Qdrant reconstruit les segments en arrière-plan ; la collection reste
+        interrogeable pendant la migration.
+        """
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            vectors_config={"": VectorParamsDiff(on_disk=self.vectors_on_disk)},
+            hnsw_config=self._hnsw_config(),
+            quantization_config=self._quantization_config() or Disabled.DISABLED
+        )
+        logger.info(f"Configuration de {self.collection_name} mise à jour "
+                    f"(quantification={self.quantization}, on_disk={self.vectors_on_disk})")
+
+    def upsert_args(self, points: List[PointStruct], wait: bool = True) -> Dict[str, Any]:
+        return {"collection_name": self.collection_name, "points": points, "wait": wait}
+
+    def search_args(self, vector: List[float], limit: int,
+                    search_params: Optional[SearchParams] = None,
+                    with_payload: Any = SEARCH_PAYLOAD_FIELDS,
+                    score_threshold: Optional[float] = None,
+                    tenant: Optional[str] = None) -> Dict[str, Any]:
+        conditions = tenant_filter(tenant)
+        return {
+            "collection_name": self.collection_name,
+            "query": vector,
+            "query_filter": Filter(must=conditions) if conditions else None,
+            "limit": limit,
+            "search_params": search_params or self.search_params,
+            "with_payload": with_payload,
+            "score_threshold": score_threshold
+        }
+
+    def history_args(self, session_id: str, limit: int,
+                     tenant: Optional[str] = None) -> Dict[str, Any]:
+        # Filtre sur tenant et session_id (index keyword), tri serveur sur timestamp_ms
+        return {
+            "collection_name": self.collection_name,
+            "scroll_filter": Filter(
+                must=tenant_filter(tenant) + [
+                    FieldCondition(key="session_id", match=MatchValue(value=session_id))
+                ],
+                must_not=[FieldCondition(key="kind", match=MatchValue(value=CHUNK_KIND))]
+            ),
+            "order_by": OrderBy(key="timestamp_ms", direction=Direction.DESC),
+            "limit": limit,
+            "with_payload": HISTORY_PAYLOAD_FIELDS,
+            "with_vectors": False
+        }
+
+    def retrieve_args(self, ids: List[Any], with_payload: Any = SEARCH_PAYLOAD_FIELDS) -> Dict[str, Any]:
+        return {
+            "collection_name": self.collection_name,
+            "ids": ids,
+            "with_payload": with_payload,
+            "with_vectors": False
+        }
+
+    def upsert(self, points: List[PointStruct], wait: bool = True):
+        self.call(self.client.upsert, **self.upsert_args(points, wait))
+
+    def retrieve(self, ids: List[Any], with_payload: Any = SEARCH_PAYLOAD_FIELDS) -> List[Record]:
+        return self.call(self.client.retrieve, **self.retrieve_args(ids, with_payload))
+
+    def search(self, vector: List[float], limit: int,
+               search_params: Optional[SearchParams] = None,
+               with_payload: Any = SEARCH_PAYLOAD_FIELDS,
+               score_threshold: Optional[float] = None,
+               tenant: Optional[str] = None) -> List[ScoredPoint]:
+        return self.call(
+            self.client.query_points,
+            **self.search_args(vector, limit, search_params, with_payload, score_threshold, tenant)
+        ).points
+
+    def session_history(self, session_id: str, limit: int,
+                        tenant: Optional[str] = None) -> List[Record]:
+        records, _ = self.call(self.client.scroll, **self.history_args(session_id, limit, tenant))
+        return records
+
+    def count(self, exact: bool = True) -> int:
+        # exact=False lit l'estimation des segments au lieu de parcourir la collection
+        return self.call(self.client.count, collection_name=self.collection_name, exact=exact).count
+
+    def scan(self, offset: Any = None, limit: int = 256, before_ms: Optional[int] = None,
+             with_payload: Any = True, with_vectors: bool = False,
+             session_id: Optional[str] = None) -> Tuple[List[Record], Any]:
+        conditions = []
+        if before_ms is not None:
+            conditions.append(FieldCondition(key="timestamp_ms", range=Range(gte=1, lt=before_ms)))
+        if session_id is not None:
+            conditions.append(FieldCondition(key="session_id", match=MatchValue(value=session_id)))
+        return self.call(
+            self.client.scroll,
+            collection_name=self.collection_name,
+            scroll_filter=Filter(must=conditions) if conditions else None,
+            offset=offset,
+            limit=limit,
+            with_payload=with_payload,
+            with_vectors=with_vectors
+        )
+
+    def delete(self, ids: List[Any]):
+        # L'optimiseur de Qdrant libère l'espace des segments en arrière-plan
+        self.call(
+            self.client.delete,
+            collection_name=self.collection_name,
+            points_selector=PointIdsList(points=ids),
+            wait=True
+        )
+
+    def for_collection(self, collection_name: str) -> "QdrantBackend":
+        # Même client (pool de connexions) ; une collection d'un seul tenant garde le HNSW global
+        backend = copy.copy(self)
+        backend.collection_name = collection_name
+        backend.tenant_hnsw = False
+        backend._client = self.client
+        backend._owns_client = False
+        return backend
+
+    def backfill_timestamps(self, batch_size: int = 256) -> int:
+        """Ajoute timestamp_ms aux points enregistrés avant son introduction
+
+        Les points dont le timestamp ISO est illisible reçoivent 0 pour ne pas
+        être retraités indéfiniment. Retourne le nombre de points mis à jour.
+        """
+        missing = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="timestamp_ms"))])
+        updated = 0
+        while True:
+            records, _ = self.call(
+                self.client.scroll,
+                collection_name=self.collection_name,
+                scroll_filter=missing,
+                limit=batch_size,
+                with_payload=["timestamp"],
+                with_vectors=False
+            )
+            if not records:
+                break
+            self.call(
+                self.client.batch_update_points,
+                collection_name=self.collection_name,
+                update_operations=[
+                    SetPayloadOperation(set_payload=SetPayload(
+                        payload={"timestamp_ms": timestamp_to_ms(record.payload.get("timestamp")) or 0},
+                        points=[record.id]
+                    ))
+                    for record in records
+                ]
+            )
+            updated += len(records)
+        logger.info(f"{updated} points complétés avec timestamp_ms")
+        return updated
+
+    def backfill_tenants(self, separator: Optional[str], batch_size: int = 256) -> int:
+        """Ajoute tenant_id aux points enregistrés avant son introduction
+
+        Le tenant est déduit de session_id comme pour les nouveaux tours (les
+        chunks portent la session de leur tour). Retourne le nombre de points
+        mis à jour.
+        """
+        missing = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key=TENANT_FIELD))])
+        updated = 0
+        while True:
+            records, _ = self.call(
+                self.client.scroll,
+                collection_name=self.collection_name,
+                scroll_filter=missing,
+                limit=batch_size,
+                with_payload=["session_id"],
+                with_vectors=False
+            )
+            if not records:
+                break
+            self.call(
+                self.client.batch_update_points,
+                collection_name=self.collection_name,
+                update_operations=[
+                    SetPayloadOperation(set_payload=SetPayload(
+                        payload={TENANT_FIELD: resolve_tenant(None, record.payload.get("session_id"),
+                                                              separator)},
+                        points=[record.id]
+                    ))
+                    for record in records
+                ]
+            )
+            updated += len(records)
+        logger.info(f"{updated} points complétés avec {TENANT_FIELD}")
+        return updated
+
+    def close(self):
+        if self._client is not None and self._owns_client:
+            self._client.close()
+
+def recall_latency_report(backend: QdrantBackend, sample_size: int = 50, limit: int = 10,
+                          ef_values: Iterable[int] = (16, 32, 64, 128, 256)) -> Dict[str, Any]:
+    """Mesure rappel@limit et latence pour plusieurs réglages de recherche
+
+    Des vecteurs stockés servent de requêtes ; la vérité terrain est une
+    recherche exacte sur les vecteurs originaux. Chaque requête est filtrée
+    sur le tenant de son point, comme en production : avec tenant_hnsw, le
+    rapport mesure bien les graphes par tenant et non un parcours exhaustif.
+    """
+    records, _ = backend.call(
+        backend.client.scroll,
+        collection_name=backend.collection_name,
+        limit=sample_size,
+        with_payload=[TENANT_FIELD],
+        with_vectors=True
+    )
+    queries = [(record.vector, (record.payload or {}).get(TENANT_FIELD)) for record in records]
+    exact = SearchParams(exact=True, quantization=QuantizationSearchParams(ignore=True))
+    truth = [
+        {hit.id for hit in backend.search(query, limit, exact, with_payload=False, tenant=tenant)}
+        for query, tenant in queries
+    ]
+    
+    settings = []
+    for ef in ef_values:
+        if backend.quantization:
+            settings.append(build_search_params(hnsw_ef=ef, rescore=False))
+            settings.append(build_search_params(hnsw_ef=ef, rescore=True, oversampling=2.0))
+        else:
+            settings.append(build_search_params(hnsw_ef=ef))
+    
+    rows = []
+    for params in settings:
+        latencies = []
+        recall = 0.0
+        for (query, tenant), expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = backend.search(query, limit, params, tenant=tenant)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if expected:
+                recall += len(expected & {hit.id for hit in hits}) / len(expected)
+        latencies.sort()
+        quantization = params.quantization
+        rows.append({
+            "hnsw_ef": params.hnsw_ef,
+            "rescore": quantization.rescore if quantization else None,
+            "oversampling": quantization.oversampling if quantization else None,
+            "recall": recall / len(queries) if queries else 0.0,
+            "latency_ms_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_ms_p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+        })
+    return {
+        "collection": backend.collection_name,
+        "quantization": backend.quantization,
+        "vectors_on_disk": backend.vectors_on_disk,
+        "tenant_hnsw": backend.tenant_hnsw,
+        "queries": len(queries),
+        "limit": limit,
+        "results": rows
+    }
+
+class LocalMemoryBackend(MemoryBackend):
+    """Stockage embarqué, sans serveur Qdrant
+
+    Les embeddings (float32, normalisés) sont dans une matrice memory-mappée
+    `vectors.f32` et les payloads dans un journal append-only `payloads.jsonl`.
+    Seuls les index (ID, tenant, session, timestamp, position dans le journal)
+    restent en mémoire ; les payloads sont relus sur disque à la demande. Une
+    recherche filtrée ne lit que les lignes du tenant.
+    
+    Une suppression écrit une entrée {"deleted": true} dans le journal et
+    libère la ligne de la matrice, réutilisée par les insertions suivantes ;
+    vacuum() réécrit le journal sans les entrées mortes.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, path: str, collection_name: str = "openwebui_memory"):
+        self.directory = os.path.join(path, collection_name)
+        self.collection_name = collection_name
+        self._lock = threading.RLock()
+        self._dim = 0
+        self._vectors = None
+        self._log = None
+        self._count = 0
+        self._row_by_id: Dict[Any, int] = {}
+        self._ids: List[Any] = []
+        self._sessions: List[Optional[str]] = []
+        self._tenants: List[Optional[str]] = []
+        self._timestamps: List[int] = []
+        self._offsets: List[Any] = []
+        self._session_rows: Dict[str, List[int]] = {}
+        self._chunk_rows: set = set()
+        self._tenant_rows: Dict[str, set] = {}
+        self._free: List[int] = []
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    def _log_path(self) -> str:
+        return os.path.join(self.directory, "payloads.jsonl")
+
+    def ensure_collection(self, vector_size: int):
+        with self._lock:
+            if self._log is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            if os.path.exists(self._meta_path()):
+                with open(self._meta_path(), "r", encoding="utf-8") as f:
+                    self._dim = json.load(f)["dim"]
+                if self._dim != vector_size:
+                    raise ValueError(f"Dimension stockée {self._dim} != dimension du modèle {vector_size}")
+            else:
+                self._dim = vector_size
+                with open(self._meta_path(), "w", encoding="utf-8") as f:
+                    json.dump({"dim": vector_size, "distance": "cosine"}, f)
+                logger.info(f"Stockage local {self.directory} créé")
+            self._open_vectors(self.INITIAL_CAPACITY)
+            self._replay_log()
+            self._log = open(self._log_path(), "ab")
+
+    def _open_vectors(self, min_rows: int):
+        """(Ré)ouvre la matrice mmap avec au moins min_rows lignes"""
+        row_bytes = self._dim * 4
+        path = self._vectors_path()
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        capacity = max(size // row_bytes, 1)
+        while capacity < min_rows:
+            capacity *= 2
+        if capacity * row_bytes != size:
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+
+    def _replay_log(self):
+        """Reconstruit les index depuis le journal ; la dernière version d'un point l'emporte"""
+        if not os.path.exists(self._log_path()):
+            return
+        with open(self._log_path(), "rb") as f:
+            offset = 0
+            for line in f:
+                length = len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Ligne tronquée par un arrêt brutal : ignorée
+                    offset += length
+                    continue
+                if entry.get("deleted"):
+                    if entry["row"] < self._count and self._ids[entry["row"]] == entry["id"]:
+                        self._unindex(entry["row"])
+                else:
+                    self._index(entry["row"], entry["id"], entry["payload"], (offset, length))
+                offset += length
+        self._free = [row for row in range(self._count) if self._ids[row] is None]
+
+    def _index(self, row: int, point_id: Any, payload: Dict[str, Any], location):
+        """Met à jour les index en mémoire d'une ligne"""
+        if row >= self._count:
+            grow = row + 1 - self._count
+            self._ids.extend([None] * grow)
+            self._sessions.extend([None] * grow)
+            self._tenants.extend([None] * grow)
+            self._timestamps.extend([0] * grow)
+            self._offsets.extend([None] * grow)
+            self._count = row + 1
+        previous_session = self._sessions[row]
+        if previous_session is not None:
+            self._session_rows[previous_session].remove(row)
+        previous_tenant = self._tenants[row]
+        if previous_tenant is not None:
+            self._tenant_rows[previous_tenant].discard(row)
+        # Les chunks sont indexés avec leur session (rétention) mais exclus de l'historique
+        session_id = payload.get("session_id")
+        if payload.get("kind") == CHUNK_KIND:
+            self._chunk_rows.add(row)
+        else:
+            self._chunk_rows.discard(row)
+        tenant = payload.get(TENANT_FIELD, DEFAULT_TENANT)
+        self._tenant_rows.setdefault(tenant, set()).add(row)
+        self._tenants[row] = tenant
+        self._ids[row] = point_id
+        self._sessions[row] = session_id
+        self._timestamps[row] = payload.get("timestamp_ms") or 0
+        self._offsets[row] = location
+        self._row_by_id[point_id] = row
+        if session_id is not None:
+            self._session_rows.setdefault(session_id, []).append(row)
+
+    def _unindex(self, row: int):
+        """Retire une ligne des index en mémoire ; elle pourra être réutilisée"""
+        session_id = self._sessions[row]
+        if session_id is not None:
+            self._session_rows[session_id].remove(row)
+        tenant = self._tenants[row]
+        if tenant is not None:
+            self._tenant_rows[tenant].discard(row)
+        self._chunk_rows.discard(row)
+        self._row_by_id.pop(self._ids[row], None)
+        self._ids[row] = None
+        self._sessions[row] = None
+        self._tenants[row] = None
+        self._timestamps[row] = 0
+        self._offsets[row] = None
+
+    def _read_payload(self, row: int, with_payload: Any = True) -> Optional[Dict[str, Any]]:
+        if with_payload is False:
+            return None
+        offset, length = self._offsets[row]
+        with open(self._log_path(), "rb") as f:
+            f.seek(offset)
+            payload = json.loads(f.read(length))["payload"]
+        if with_payload is True:
+            return payload
+        return {key: payload[key] for key in with_payload if key in payload}
+
+    def upsert(self, points: List[PointStruct], wait: bool = True):
+        if not points:
+            return
+        vectors = np.asarray([point.vector for point in points], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        with self._lock:
+            rows = []
+            next_row = self._count
+            for point in points:
+                row = self._row_by_id.get(point.id)
+                if row is None and self._free:
+                    row = self._free.pop()
+                elif row is None:
+                    row = next_row
+                    next_row += 1
+                rows.append(row)
+            if next_row > self._vectors.shape[0]:
+                self._open_vectors(next_row)
+            # Vecteurs d'abord : un journal sans vecteur n'est jamais écrit
+            self._vectors[rows] = vectors
+            self._vectors.flush()
+            offset = self._log.tell()
+            for point, row in zip(points, rows):
+                line = (json.dumps({"id": point.id, "row": row, "payload": point.payload},
+                                   ensure_ascii=False) + "\n").encode("utf-8")
+                self._log.write(line)
+                self._index(row, point.id, point.payload, (offset, len(line)))
+                offset += len(line)
+            self._log.flush()
+
+    def search(self, vector: List[float], limit: int,
+               search_params: Optional[SearchParams] = None,
+               with_payload: Any = SEARCH_PAYLOAD_FIELDS,
+               score_threshold: Optional[float] = None,
+               tenant: Optional[str] = None) -> List[ScoredPoint]:
+        # Recherche exhaustive : search_params n'a pas d'effet
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        with self._lock:
+            if tenant is not None:
+                # Seules les lignes du tenant sont lues et comparées
+                tenant_rows = self._tenant_rows.get(tenant, ())
+                rows = np.fromiter(tenant_rows, dtype=np.int64, count=len(tenant_rows))
+                if len(rows) * 4 > self._count:
+                    # Tenant majoritaire : un produit sur toute la matrice coûte moins qu'une copie
+                    scores = (self._vectors[:self._count] @ query)[rows]
+                else:
+                    scores = self._vectors[rows] @ query if len(rows) else np.empty(0, np.float32)
+            else:
+                rows = np.arange(self._count)
+                scores = self._vectors[:self._count] @ query
+                if self._free:
+                    # Lignes libérées par des suppressions
+                    scores[self._free] = -np.inf
+            count = len(rows) - (len(self._free) if tenant is None else 0)
+            limit = min(limit, count)
+            if limit <= 0:
+                return []
+            if limit < len(rows):
+                top = np.argpartition(-scores, limit - 1)[:limit]
+            else:
+                top = np.arange(len(rows))
+            top = top[np.argsort(-scores[top])]
+            if score_threshold is not None:
+                top = top[scores[top] >= score_threshold]
+            return [
+                ScoredPoint(id=self._ids[rows[index]], version=0, score=float(scores[index]),
+                            payload=self._read_payload(rows[index], with_payload))
+                for index in top
+            ]
+
+    def session_history(self, session_id: str, limit: int,
+                        tenant: Optional[str] = None) -> List[Record]:
+        with self._lock:
+            rows = [row for row in self._session_rows.get(session_id, [])
+                    if row not in self._chunk_rows and (tenant is None or self._tenants[row] == tenant)]
+            rows = sorted(rows, key=lambda row: self._timestamps[row], reverse=True)[:limit]
+            return [Record(id=self._ids[row], payload=self._read_payload(row, HISTORY_PAYLOAD_FIELDS))
+                    for row in rows]
+
+    def retrieve(self, ids: List[Any], with_payload: Any = SEARCH_PAYLOAD_FIELDS) -> List[Record]:
+        with self._lock:
+            rows = [self._row_by_id[point_id] for point_id in ids if point_id in self._row_by_id]
+            return [Record(id=self._ids[row], payload=self._read_payload(row, with_payload))
+                    for row in rows]
+
+    def count(self, exact: bool = True) -> int:
+        with self._lock:
+            return self._count - len(self._free)
+
+    def scan(self, offset: Any = None, limit: int = 256, before_ms: Optional[int] = None,
+             with_payload: Any = True, with_vectors: bool = False,
+             session_id: Optional[str] = None) -> Tuple[List[Record], Any]:
+        with self._lock:
+            if session_id is not None:
+                # Lignes de la session par ordre croissant : l'offset est la ligne suivante
+                rows = sorted(row for row in self._session_rows.get(session_id, [])
+                              if row >= (offset or 0) and (
+                                  before_ms is None or 0 < self._timestamps[row] < before_ms))
+                page = rows[:limit]
+                records = [Record(id=self._ids[row], payload=self._read_payload(row, with_payload),
+                                  vector=self._vectors[row].tolist() if with_vectors else None)
+                           for row in page]
+                return records, page[-1] + 1 if len(rows) > limit else None
+            records = []
+            row = offset or 0
+            while row < self._count and len(records) < limit:
+                if self._ids[row] is not None and (
+                        before_ms is None or 0 < self._timestamps[row] < before_ms):
+                    records.append(Record(id=self._ids[row],
+                                          payload=self._read_payload(row, with_payload),
+                                          vector=self._vectors[row].tolist() if with_vectors else None))
+                row += 1
+            return records, row if row < self._count else None
+
+    def delete(self, ids: List[Any]):
+        with self._lock:
+            rows = [self._row_by_id[point_id] for point_id in ids if point_id in self._row_by_id]
+            if not rows:
+                return
+            for row in rows:
+                line = json.dumps({"id": self._ids[row], "row": row, "deleted": True},
+                                  ensure_ascii=False) + "\n"
+                self._log.write(line.encode("utf-8"))
+                self._unindex(row)
+                self._free.append(row)
+            self._log.flush()
+            self._vectors[rows] = 0
+            self._vectors.flush()
+
+    def vacuum(self) -> int:
+        """Réécrit le journal avec la seule version vivante de chaque point
+
+        Les lignes de la matrice ne sont pas renumérotées (sa taille ne change
+        pas) : le journal réécrit remplace l'ancien en une seule opération.
+        """
+        with self._lock:
+            if self._log is None:
+                return 0
+            path = self._log_path()
+            before = os.path.getsize(path)
+            offsets = {}
+            with open(path, "rb") as source, open(path + ".tmp", "wb") as target:
+                for row in range(self._count):
+                    if self._ids[row] is None:
+                        continue
+                    offset, length = self._offsets[row]
+                    source.seek(offset)
+                    offsets[row] = (target.tell(), length)
+                    target.write(source.read(length))
+                target.flush()
+                os.fsync(target.fileno())
+            self._log.close()
+            os.replace(path + ".tmp", path)
+            self._log = open(path, "ab")
+            for row, location in offsets.items():
+                self._offsets[row] = location
+            reclaimed = before - os.path.getsize(path)
+            logger.info(f"Journal {path} compacté ({reclaimed} octets libérés)")
+            return reclaimed
+
+    def for_collection(self, collection_name: str) -> "LocalMemoryBackend":
+        return LocalMemoryBackend(os.path.dirname(self.directory), collection_name)
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
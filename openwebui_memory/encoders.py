@@ -0,0 +1,362 @@
+"""
+Encodeurs d'embeddings (PyTorch, ONNX, pool de processus), cache des requêtes et micro-batching
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class QueryEmbeddingCache:
+    """Cache LRU thread-safe des embeddings de requêtes, avec expiration (TTL)"""
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, model_name: str, lowercase: bool = False) -> str:
+        """Clé = hash du texte normalisé (espaces, Unicode) et du modèle
+
+        La casse n'est ignorée que si le modèle met lui-même son entrée en
+        minuscules (lowercase) : sinon deux casses donnent deux embeddings.
+        """
+        normalized = unicodedata.normalize("NFKC", text)
+        if lowercase:
+            normalized = normalized.casefold()
+        normalized = " ".join(normalized.split())
+        return hashlib.sha256(f"{model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, embedding = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, embedding: List[float]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+class EmbeddingBatcher:
+    """Regroupe les sauvegardes concurrentes en un seul encode et un seul upsert
+
+    flush_fn reçoit les éléments d'un lot et renvoie un résultat par élément ;
+    si elle échoue (ou renvoie un nombre de résultats différent), l'exception
+    est transmise au Future de chaque élément du lot.
+    """
+
+    def __init__(self, flush_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.flush_fn = flush_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Dict[str, Any]) -> Future:
+        """Ajoute un élément à la file et retourne le Future de son résultat"""
+        future: Future = Future()
+        if self._stopped.is_set():
+            future.set_exception(RuntimeError("Batcher arrêté"))
+            return future
+        self._queue.put((item, future))
+        return future
+
+    def close(self, timeout: float = 5.0):
+        """Arrête le thread après avoir vidé la file"""
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _collect(self) -> List[Any]:
+        """Attend un premier élément puis accumule jusqu'à max_batch_size ou max_wait"""
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Réinjecter le signal d'arrêt pour le tour suivant
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                items = [item for item, _ in batch]
+                try:
+                    results = list(self.flush_fn(items))
+                    if len(results) != len(batch):
+                        raise RuntimeError(f"{len(results)} résultats pour un lot de {len(batch)} éléments")
+                except Exception as e:
+                    # Chaque appelant reçoit l'erreur du lot : aucun Future ne reste en attente
+                    logger.error(f"Erreur lors du traitement du lot: {e}")
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            elif self._stopped.is_set() and self._queue.empty():
+                return
+
+class Encoder:
+    """Interface des encodeurs (celle de SentenceTransformer, utilisée par défaut)
+
+    encode() accepte un texte (vecteur) ou une liste (matrice) et renvoie des
+    embeddings normalisés ; tokenizer (tokenizer rapide Hugging Face) est
+    optionnel et sert au découpage en chunks et au budget de tokens.
+    """
+
+    tokenizer = None
+    max_seq_length = 256
+
+    def encode(self, texts, batch_size: Optional[int] = None, **kwargs) -> np.ndarray:
+        raise NotImplementedError
+
+    def get_sentence_embedding_dimension(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        """Libère les ressources (pool de processus)"""
+
+def _hub_repo(model_name: str) -> str:
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+class OnnxEncoder(Encoder):
+    """Encodeur ONNX Runtime (CPU), sans PyTorch
+
+    Utilise l'export onnx/model.onnx publié avec le modèle sentence-transformers
+    (ou model_path, répertoire local contenant model.onnx et le tokenizer) ;
+    quantize=True le quantifie dynamiquement en int8 (mis en cache dans
+    cache_dir). Mean pooling et normalisation L2 comme le modèle d'origine.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = False, threads: Optional[int] = None,
+                 cache_dir: Optional[str] = None, model_path: Optional[str] = None,
+                 max_seq_length: int = 256):
+        import onnxruntime
+        from transformers import AutoTokenizer
+        
+        if model_path:
+            onnx_path = os.path.join(model_path, "model.onnx")
+            self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        else:
+            from huggingface_hub import hf_hub_download
+            onnx_path = hf_hub_download(_hub_repo(model_name), "onnx/model.onnx")
+            self.tokenizer = AutoTokenizer.from_pretrained(_hub_repo(model_name))
+        if quantize:
+            onnx_path = self._quantized(onnx_path, model_name, cache_dir, model_path)
+        
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(onnx_path, options,
+                                                    providers=["CPUExecutionProvider"])
+        self._input_names = {node.name for node in self.session.get_inputs()}
+        self.max_seq_length = max_seq_length
+        self._dimension = None
+
+    @staticmethod
+    def _quantized(onnx_path: str, model_name: str, cache_dir: Optional[str],
+                   model_path: Optional[str] = None) -> str:
+        """Chemin du modèle quantifié int8, créé au premier usage
+
+        Le nom en cache dépend de la source (model_path ou dépôt du Hub) : deux
+        modèles locaux déclarés sous le même model_name ne se remplacent pas.
+        """
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "openwebui-memory")
+        os.makedirs(cache_dir, exist_ok=True)
+        source = os.path.abspath(model_path) if model_path else _hub_repo(model_name)
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+        target = os.path.join(cache_dir, f"{model_name.replace('/', '--')}-{digest}-int8.onnx")
+        if not os.path.exists(target):
+            partial = f"{target}.{os.getpid()}.tmp"
+            quantize_dynamic(onnx_path, partial, weight_type=QuantType.QInt8)
+            os.replace(partial, target)
+            logger.info(f"Modèle ONNX quantifié en int8: {target}")
+        return target
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in self._input_names if name in encoded}
+        if "token_type_ids" in self._input_names and "token_type_ids" not in feeds:
+            feeds["token_type_ids"] = np.zeros_like(feeds["input_ids"])
+        hidden = self.session.run(None, feeds)[0]
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts, batch_size: Optional[int] = None, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            return self._encode_batch([texts])[0]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        # Lots de longueurs voisines : moins de padding à calculer
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        size = batch_size or 32
+        embeddings = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), size):
+            indices = order[start:start + size]
+            batch = self._encode_batch([texts[index] for index in indices])
+            if embeddings.shape[1] == 0:
+                embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            embeddings[indices] = batch
+        return embeddings
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = int(self._encode_batch(["dimension"]).shape[1])
+        return self._dimension
+
+def encoder_lowercases(encoder: Any) -> bool:
+    """Vrai si l'encodeur met son entrée en minuscules (do_lower_case du tokenizer ou du modèle)"""
+    tokenizer = getattr(encoder, "tokenizer", None)
+    lowercase = getattr(tokenizer, "do_lower_case", None)
+    if lowercase is None:
+        lowercase = (getattr(tokenizer, "init_kwargs", None) or {}).get("do_lower_case")
+    if lowercase is None and hasattr(encoder, "_first_module"):
+        # SentenceTransformer : option du module Transformer, appliquée avant le tokenizer
+        lowercase = getattr(encoder._first_module(), "do_lower_case", None)
+    return bool(lowercase)
+
+def create_encoder(kind: str, model_name: str, threads: Optional[int] = None,
+                   **options) -> Any:
+    """Encodeur "torch" (SentenceTransformer) ou "onnx" (OnnxEncoder)"""
+    if kind == "onnx":
+        return OnnxEncoder(model_name, threads=threads, **options)
+    if kind == "torch":
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+    raise ValueError(f"Encodeur inconnu: {kind}")
+
+# Encodeur d'un processus du pool (initialisé par _init_encoder_worker)
+_worker_encoder = None
+
+def _init_encoder_worker(kind: str, model_name: str, threads: Optional[int], options: Dict[str, Any]):
+    global _worker_encoder
+    _worker_encoder = create_encoder(kind, model_name, threads=threads, **options)
+
+def encode_kwargs(batch_size: Optional[int]) -> Dict[str, Any]:
+    """batch_size transmis à encode() seulement s'il est fixé : sinon chaque encodeur garde le sien"""
+    return {} if batch_size is None else {"batch_size": batch_size}
+
+def _encode_in_worker(texts: List[str], batch_size: Optional[int]) -> np.ndarray:
+    return np.asarray(_worker_encoder.encode(texts, **encode_kwargs(batch_size)), dtype=np.float32)
+
+def _describe_worker_encoder():
+    return (_worker_encoder.get_sentence_embedding_dimension(),
+            getattr(_worker_encoder, "max_seq_length", 256))
+
+class ProcessPoolEncoder(Encoder):
+    """Répartit l'encodage sur processes processus (hors GIL)
+
+    Chaque processus charge son propre encodeur (kind, limité à threads
+    threads) ; une liste est découpée en tranches contiguës, une par
+    processus. Seul le tokenizer est chargé dans le processus principal.
+    """
+
+    def __init__(self, kind: str, model_name: str, processes: int,
+                 threads: Optional[int] = None, **options):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        
+        self.processes = max(1, processes)
+        threads = threads or max(1, (os.cpu_count() or 1) // self.processes)
+        # spawn : pas de fork d'un processus qui a déjà des threads (batcher, warm-up)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_encoder_worker,
+            initargs=(kind, model_name, threads, options)
+        )
+        self._dimension, self.max_seq_length = self.executor.submit(_describe_worker_encoder).result()
+        try:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(options.get("model_path") or _hub_repo(model_name))
+        except Exception as e:
+            logger.warning(f"Tokenizer indisponible, découpage approximatif: {e}")
+            self.tokenizer = None
+
+    def encode(self, texts, batch_size: Optional[int] = None, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            return self.executor.submit(_encode_in_worker, [texts], batch_size).result()[0]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self._dimension), dtype=np.float32)
+        size = -(-len(texts) // self.processes)
+        slices = [texts[start:start + size] for start in range(0, len(texts), size)]
+        return np.concatenate(list(self.executor.map(_encode_in_worker, slices,
+                                                     [batch_size] * len(slices))))
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dimension
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def compare_encoders(candidate: Any, reference: Any, texts: List[str]) -> Dict[str, float]:
+    """Écart entre les embeddings de deux encodeurs (cosinus et différence absolue)"""
+    a = np.asarray(candidate.encode(texts), dtype=np.float32)
+    b = np.asarray(reference.encode(texts), dtype=np.float32)
+    a /= np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b /= np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    cosines = (a * b).sum(axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "max_abs_diff": float(np.abs(a - b).max())
+    }
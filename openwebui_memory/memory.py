@@ -0,0 +1,1164 @@
+"""
+Mémoire des conversations : sauvegarde, recherche et contexte réflexif (API synchrone et asynchrone)
+"""
+
+import asyncio
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Optional
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, Record, ScoredPoint, SearchParams
+import logging
+
+from .backends import MemoryBackend, QdrantBackend, build_search_params
+from .encoders import (
+    EmbeddingBatcher, Encoder, ProcessPoolEncoder, QueryEmbeddingCache,
+    create_encoder, encode_kwargs, encoder_lowercases
+)
+from .metrics import StageMetrics
+from .schema import (
+    CHUNK_HIT_FIELDS, CHUNK_KIND, CHUNK_SEARCH_OVERSAMPLING, CONTEXT_HISTORY_TURNS,
+    CONTEXT_SIMILAR_RESULTS, DEFAULT_TENANT, SEARCH_PAYLOAD_FIELDS, TENANT_FIELD, TEXT_FIELDS,
+    chunk_point_id, collapse_chunk_hits, combined_text, compress_text, payload_text,
+    resolve_tenant, resolve_turn_hits, tenant_collection_name, timestamp_to_ms, turn_point_id,
+    widened_search_limit
+)
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal d'erreurs détaillées renvoyées par une ingestion en masse
+MAX_REPORTED_ERRORS = 1000
+
+class OpenWebUIMemory:
+    def __init__(self, qdrant_host: str = "localhost", qdrant_port: int = 6333,
+                 batching: bool = False, batch_max_size: int = 32,
+                 batch_max_wait_ms: float = 5.0, query_cache_size: int = 1024,
+                 query_cache_ttl: float = 3600.0, backend: Optional[MemoryBackend] = None,
+                 compress_threshold: int = 0, chunk_tokens: int = 0,
+                 chunk_overlap: int = 32, max_chunks: int = 8,
+                 context_max_tokens: Optional[int] = None,
+                 similarity_threshold: Optional[float] = None,
+                 context_max_results: int = CONTEXT_SIMILAR_RESULTS,
+                 slow_request_ms: Optional[float] = None,
+                 model_name: str = "all-MiniLM-L6-v2",
+                 encoder: Any = "torch", encoder_processes: int = 0,
+                 encoder_threads: Optional[int] = None,
+                 encoder_options: Optional[Dict[str, Any]] = None,
+                 tenant_separator: Optional[str] = ":",
+                 dedicated_tenants: Iterable[str] = ()):
+        """Initialise le système de mémoire avec Qdrant
+
+        backend permet de remplacer Qdrant par un autre stockage (par exemple
+        LocalMemoryBackend) ; par défaut, un QdrantBackend sur qdrant_host.
+        Les messages plus longs que compress_threshold caractères sont stockés
+        compressés (0 désactive la compression).
+        
+        Les tours plus longs que chunk_tokens tokens (0 = longueur maximale du
+        modèle) sont découpés en au plus max_chunks fenêtres qui se recouvrent
+        de chunk_overlap tokens, encodées dans le même appel.
+        
+        context_max_tokens, similarity_threshold et context_max_results sont
+        les valeurs par défaut du contexte réflexif (budget de tokens, score
+        minimal appliqué par le backend, nombre de conversations similaires).
+        
+        Chaque étape alimente self.metrics (exposé par /metrics) ; les
+        opérations plus longues que slow_request_ms sont journalisées avec le
+        détail de leurs étapes.
+        
+        encoder choisit l'encodeur de model_name : "torch" (SentenceTransformer), "onnx"
+        (ONNX Runtime, encoder_options={"quantize": True} pour l'int8) ou une
+        instance respectant l'interface Encoder. Avec encoder_processes > 0,
+        l'encodage est réparti sur autant de processus.
+        
+        Chaque tour appartient à un tenant : tenant_id explicite, sinon préfixe
+        de session_id avant tenant_separator (format "<email>:<session>" des
+        réglages OpenWebUI), sinon DEFAULT_TENANT. Recherche, historique et
+        contexte ne voient que les points du tenant. Les dedicated_tenants ont
+        leur propre collection, créée au premier usage.
+
+        Avec batching=True, les sauvegardes concurrentes sont regroupées pendant
+        au plus batch_max_wait_ms (ou batch_max_size éléments) avant d'être
+        encodées et insérées en une seule fois. Les embeddings des requêtes de
+        recherche sont mis en cache (query_cache_size=0 désactive le cache).
+        
+        Le modèle et le client Qdrant sont créés au premier usage ; warm_up()
+        (ou start_warm_up() en arrière-plan) les prépare avant le premier appel.
+        """
+        self.created_at = time.monotonic()
+        self.qdrant_host = qdrant_host
+        self.qdrant_port = qdrant_port
+        self.collection_name = "openwebui_memory"
+        self.model_name = model_name
+        self.encoder = encoder
+        self.encoder_processes = encoder_processes
+        self.encoder_threads = encoder_threads
+        self.encoder_options = encoder_options or {}
+        self.backend = backend or QdrantBackend(qdrant_host, qdrant_port, self.collection_name)
+        self.compress_threshold = compress_threshold
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.max_chunks = max(1, max_chunks)
+        self.context_max_tokens = context_max_tokens
+        self.similarity_threshold = similarity_threshold
+        self.context_max_results = context_max_results
+        self.slow_request_ms = slow_request_ms
+        self.tenant_separator = tenant_separator
+        self.dedicated_tenants = set(dedicated_tenants)
+        self._tenant_backends: Dict[str, MemoryBackend] = {}
+        self._tenant_lock = threading.Lock()
+        self.metrics = StageMetrics()
+        self._embedding_model = None if isinstance(encoder, str) else encoder
+        self._init_lock = threading.Lock()
+        self._collection_ready = False
+        self._model_warm = False
+        self._warm_up_thread = None
+        self.last_error: Optional[str] = None
+        self.startup_timings: Dict[str, float] = {}
+        self.query_cache = QueryEmbeddingCache(query_cache_size, query_cache_ttl)
+        # Casse ignorée dans les clés du cache si le tokenizer met en minuscules (lu au premier usage)
+        self._query_lowercase: Optional[bool] = None
+        self._in_flight: Dict[str, Future] = {}
+        self._in_flight_lock = threading.Lock()
+        self._context_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="context")
+        self.batcher = None
+        if batching:
+            self.batcher = EmbeddingBatcher(
+                self._save_batch,
+                max_batch_size=batch_max_size,
+                max_wait_ms=batch_max_wait_ms
+            )
+
+    @property
+    def qdrant_client(self) -> QdrantClient:
+        """Client Qdrant du backend (uniquement avec QdrantBackend)"""
+        return self.backend.client
+
+    @property
+    def embedding_model(self):
+        """Modèle d'embedding, chargé (import compris) au premier accès"""
+        if self._embedding_model is None:
+            with self._init_lock:
+                if self._embedding_model is None:
+                    start = time.monotonic()
+                    if self.encoder_processes > 0:
+                        model = ProcessPoolEncoder(self.encoder, self.model_name, self.encoder_processes,
+                                                   self.encoder_threads, **self.encoder_options)
+                    else:
+                        model = create_encoder(self.encoder, self.model_name, self.encoder_threads,
+                                               **self.encoder_options)
+                    self._embedding_model = model
+                    self.startup_timings["model_load_s"] = time.monotonic() - start
+                    logger.info(f"Modèle {self.model_name} ({self.encoder}) chargé en "
+                                f"{self.startup_timings['model_load_s']:.2f}s")
+        return self._embedding_model
+
+    def warm_up(self) -> bool:
+        """Charge le modèle, fait un encodage factice et vérifie la collection"""
+        try:
+            if not self._model_warm:
+                start = time.monotonic()
+                self.embedding_model.encode("warm-up")
+                self.startup_timings["warm_encode_s"] = time.monotonic() - start
+                self._model_warm = True
+        except Exception as e:
+            self.last_error = f"Modèle: {e}"
+            logger.error(f"Erreur lors du chargement du modèle: {e}")
+            return False
+        if not self._ensure_collection():
+            return False
+        if "time_to_ready_s" not in self.startup_timings:
+            self.startup_timings["time_to_ready_s"] = time.monotonic() - self.created_at
+            logger.info(f"Service mémoire prêt en {self.startup_timings['time_to_ready_s']:.2f}s")
+        return True
+
+    def start_warm_up(self, max_backoff: float = 30.0) -> threading.Thread:
+        """Lance warm_up() en arrière-plan, avec reprise exponentielle si Qdrant est absent"""
+        def run():
+            delay = 1.0
+            while not self.warm_up():
+                time.sleep(delay)
+                delay = min(delay * 2, max_backoff)
+        
+        if self._warm_up_thread is None or not self._warm_up_thread.is_alive():
+            self._warm_up_thread = threading.Thread(target=run, name="memory-warm-up", daemon=True)
+            self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    def readiness(self) -> Dict[str, Any]:
+        """État de préparation du service (modèle et collection)"""
+        return {
+            "ready": self._model_warm and self._collection_ready,
+            "model_loaded": self._embedding_model is not None,
+            "model_warm": self._model_warm,
+            "collection_ready": self._collection_ready,
+            "startup": dict(self.startup_timings),
+            "last_error": self.last_error
+        }
+
+    def close(self):
+        """Arrête proprement le batcher s'il est actif, le pool du contexte et ferme le stockage"""
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+        self._context_executor.shutdown(wait=False)
+        if isinstance(self._embedding_model, Encoder):
+            self._embedding_model.close()
+        for backend in self._tenant_backends.values():
+            backend.close()
+        self.backend.close()
+
+    def tenant(self, tenant_id: Optional[str] = None, session_id: Optional[str] = None) -> str:
+        """Tenant d'une requête (explicite, préfixe de session_id ou DEFAULT_TENANT)"""
+        return resolve_tenant(tenant_id, session_id, self.tenant_separator)
+
+    def _backend_for(self, tenant: Optional[str]) -> MemoryBackend:
+        """Collection dédiée du tenant s'il en a une, sinon la collection partagée"""
+        if tenant not in self.dedicated_tenants:
+            return self.backend
+        backend = self._tenant_backends.get(tenant)
+        if backend is None:
+            with self._tenant_lock:
+                backend = self._tenant_backends.get(tenant)
+                if backend is None:
+                    backend = self.backend.for_collection(
+                        tenant_collection_name(self.collection_name, tenant)
+                    )
+                    backend.ensure_collection(self.embedding_model.get_sentence_embedding_dimension())
+                    self._tenant_backends[tenant] = backend
+        return backend
+
+    def all_backends(self) -> List[MemoryBackend]:
+        """Collection partagée puis collections dédiées (maintenance, rétention)"""
+        return [self.backend] + [self._backend_for(tenant) for tenant in sorted(self.dedicated_tenants)]
+
+    def _encode_query(self, query: str) -> List[float]:
+        """Embedding d'une requête, servi depuis le cache quand c'est possible"""
+        if self._query_lowercase is None:
+            self._query_lowercase = encoder_lowercases(self.embedding_model)
+        key = QueryEmbeddingCache.make_key(query, self.model_name, self._query_lowercase)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            with self.metrics.timed("encode_query"):
+                embedding = self.embedding_model.encode(query).tolist()
+            self.query_cache.put(key, embedding)
+        return embedding
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiques du service (cache des requêtes)"""
+        return {"query_cache": self.query_cache.stats()}
+    
+    def get_metrics(self) -> str:
+        """Métriques au format Prometheus, jauges d'état comprises"""
+        cache = self.query_cache.stats()
+        gauges = {
+            "memory_model_loaded": ("gauge", "Modèle d'embedding chargé", self._embedding_model is not None),
+            "memory_model_warm": ("gauge", "Encodage de préchauffage effectué", self._model_warm),
+            "memory_collection_ready": ("gauge", "Collection initialisée", self._collection_ready),
+            "memory_query_cache_entries": ("gauge", "Embeddings de requêtes en cache", cache["size"]),
+            "memory_query_cache_hits_total": ("counter", "Requêtes servies par le cache", cache["hits"]),
+            "memory_query_cache_misses_total": ("counter", "Requêtes encodées", cache["misses"]),
+        }
+        if self._collection_ready:
+            try:
+                gauges["memory_collection_points"] = (
+                    "gauge", "Points dans la collection (chunks compris, estimation)",
+                    self.backend.count(exact=False)
+                )
+            except Exception as e:
+                logger.warning(f"Taille de la collection indisponible: {e}")
+        return self.metrics.render(gauges)
+    
+    def _finish_request(self, operation: str, timings: Dict[str, float]):
+        """Enregistre la durée d'une opération et la journalise si elle est lente"""
+        total_ms = timings.get("total_ms", 0.0)
+        self.metrics.observe_request(operation, total_ms / 1000)
+        if self.slow_request_ms is not None and total_ms >= self.slow_request_ms:
+            stages = ", ".join(f"{stage}={value:.1f}" for stage, value in timings.items())
+            logger.warning(f"Requête lente ({operation}): {stages}")
+
+    def _ensure_collection(self) -> bool:
+        """Initialise la collection si ce n'est pas déjà fait"""
+        return self._collection_ready or self._init_collection()
+    
+    def _init_collection(self) -> bool:
+        """Initialise la collection si elle n'existe pas"""
+        start = time.monotonic()
+        try:
+            self.backend.ensure_collection(self.embedding_model.get_sentence_embedding_dimension())
+            self._collection_ready = True
+            self.startup_timings["collection_s"] = time.monotonic() - start
+            return True
+        except Exception as e:
+            self.last_error = f"Stockage: {e}"
+            logger.error(f"Erreur lors de l'initialisation de la collection: {e}")
+            return False
+    
+    def backfill_timestamps(self, batch_size: int = 256) -> int:
+        """Ajoute timestamp_ms aux points enregistrés avant son introduction"""
+        self._ensure_collection()
+        return self.backend.backfill_timestamps(batch_size)
+    
+    def backfill_tenants(self, batch_size: int = 256) -> int:
+        """Ajoute tenant_id aux points de la collection partagée enregistrés avant son introduction"""
+        self._ensure_collection()
+        return self.backend.backfill_tenants(self.tenant_separator, batch_size)
+    
+    def _build_metadata(self, user_message: str, ai_response: str,
+                        model_used: str, session_id: Optional[str],
+                        timestamp: Optional[str] = None,
+                        idempotency_key: Optional[str] = None,
+                        tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """Prépare les métadonnées d'un tour de conversation"""
+        now = datetime.now()
+        timestamp = timestamp or now.isoformat()
+        session_id = session_id or f"session_{int(time.time())}"
+        timestamp_ms = timestamp_to_ms(timestamp)
+        metadata = {
+            TENANT_FIELD: self.tenant(tenant_id, session_id),
+            "user_message": user_message,
+            "ai_response": ai_response,
+            "model_used": model_used,
+            "session_id": session_id,
+            "timestamp": timestamp,
+            "timestamp_ms": timestamp_ms if timestamp_ms is not None else int(now.timestamp() * 1000)
+        }
+        if idempotency_key:
+            metadata["idempotency_key"] = idempotency_key
+        return metadata
+
+    def _make_point(self, embedding: List[float], metadata: Dict[str, Any]) -> PointStruct:
+        """Crée le point à stocker, en compressant les messages volumineux"""
+        payload = dict(metadata)
+        if self.compress_threshold > 0:
+            for key in TEXT_FIELDS:
+                text = payload.get(key, "")
+                if len(text) > self.compress_threshold:
+                    compressed = compress_text(text)
+                    # Garder le texte brut si la compression ne fait rien gagner
+                    if len(compressed) < len(text.encode("utf-8")):
+                        del payload[key]
+                        payload[f"{key}_z"] = compressed
+        return PointStruct(id=turn_point_id(metadata), vector=embedding, payload=payload)
+
+    def _token_offsets(self, text: str) -> List[Any]:
+        """Positions (début, fin) de chaque token du texte dans la chaîne"""
+        tokenizer = getattr(self.embedding_model, "tokenizer", None)
+        if tokenizer is None:
+            # Approximation par mots si le modèle n'expose pas de tokenizer
+            return [match.span() for match in re.finditer(r"\S+", text)]
+        return tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                         verbose=False)["offset_mapping"]
+    
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """Nombre de tokens de chaque texte (tokenizer rapide du modèle, en un appel)"""
+        tokenizer = getattr(self.embedding_model, "tokenizer", None)
+        if tokenizer is None:
+            return [len(re.findall(r"\S+", text)) for text in texts]
+        encoded = tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+    
+    def _truncate_tokens(self, text: str, max_tokens: int) -> str:
+        """Tronque un texte à max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        offsets = self._token_offsets(text)
+        if len(offsets) <= max_tokens:
+            return text
+        return text[:offsets[max_tokens - 1][1]] + "…"
+    
+    def _chunk_text(self, text: str) -> List[str]:
+        """Découpe un texte en fenêtres de tokens qui se recouvrent"""
+        model = self.embedding_model
+        window = self.chunk_tokens or max(getattr(model, "max_seq_length", 256) - 2, 16)
+        step = max(window - self.chunk_overlap, 1)
+        offsets = self._token_offsets(text)
+        if len(offsets) <= window:
+            return [text]
+        chunks = []
+        for start in range(0, len(offsets), step):
+            end = min(start + window, len(offsets))
+            chunks.append(text[offsets[start][0]:offsets[end - 1][1]])
+            if end == len(offsets) or len(chunks) == self.max_chunks:
+                break
+        return chunks
+    
+    def _embed_turns(self, items: List[Dict[str, Any]], batch_size: Optional[int] = None,
+                     timings: Optional[Dict[str, float]] = None) -> List[List[PointStruct]]:
+        """Encode des tours en un seul appel et renvoie les points de chacun
+
+        Le premier point porte le payload du tour et l'embedding de son premier
+        chunk ; les chunks suivants sont des points légers reliés par turn_id.
+        """
+        chunked = [self._chunk_text(combined_text(item)) for item in items]
+        texts = [text for chunks in chunked for text in chunks]
+        self.metrics.observe_batch("encode", len(texts))
+        with self.metrics.timed("encode", timings):
+            embeddings = self.embedding_model.encode(texts, **encode_kwargs(batch_size))
+        
+        turns = []
+        position = 0
+        for item, chunks in zip(items, chunked):
+            parent = self._make_point(embeddings[position].tolist(), item)
+            points = [parent]
+            for index in range(1, len(chunks)):
+                points.append(PointStruct(
+                    id=chunk_point_id(parent.id, index),
+                    vector=embeddings[position + index].tolist(),
+                    payload={
+                        "kind": CHUNK_KIND,
+                        "turn_id": parent.id,
+                        "chunk_index": index,
+                        TENANT_FIELD: item[TENANT_FIELD],
+                        "session_id": item["session_id"],
+                        "model_used": item["model_used"],
+                        "timestamp_ms": item["timestamp_ms"]
+                    }
+                ))
+            position += len(chunks)
+            turns.append(points)
+        return turns
+    
+    def _upsert(self, points: List[PointStruct], wait: bool = True,
+                timings: Optional[Dict[str, float]] = None, tenant: Optional[str] = None):
+        """Upsert instrumenté (latence, taille de lot, erreurs) dans la collection du tenant"""
+        backend = self._backend_for(tenant)
+        self.metrics.observe_batch("upsert", len(points))
+        with self.metrics.timed("upsert", timings):
+            backend.upsert(points, wait)
+    
+    def _is_stored(self, point_id: str, timings: Optional[Dict[str, float]] = None,
+                   tenant: Optional[str] = None) -> bool:
+        """Vérifie qu'un tour est déjà stocké (lecture d'ID seule, sans payload)"""
+        backend = self._backend_for(tenant)
+        with self.metrics.timed("exists", timings):
+            stored = point_id in backend.existing_ids([point_id])
+        if stored:
+            self.metrics.event("duplicate_save")
+        return stored
+    
+    def _save_once(self, point_id: str, save) -> bool:
+        """Exécute save() au plus une fois à la fois par tour
+
+        Les doublons concurrents (tempête de reprises) attendent le résultat
+        de la sauvegarde en cours au lieu d'encoder à leur tour.
+        """
+        with self._in_flight_lock:
+            pending = self._in_flight.get(point_id)
+            owner = pending is None
+            if owner:
+                pending = self._in_flight[point_id] = Future()
+        if not owner:
+            self.metrics.event("duplicate_save")
+            return pending.result()
+        result = False
+        try:
+            result = save()
+            return result
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[point_id]
+            pending.set_result(result)
+    
+    def save_conversation(self, user_message: str, ai_response: str, 
+                         model_used: str = "phi3:3.8b", 
+                         session_id: Optional[str] = None,
+                         idempotency_key: Optional[str] = None,
+                         tenant_id: Optional[str] = None) -> bool:
+        """Sauvegarde une conversation dans Qdrant
+
+        L'ID du point dérive du contenu (ou de idempotency_key) : un tour déjà
+        stocké est acquitté sans encodage ni écriture.
+        """
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        try:
+            metadata = self._build_metadata(user_message, ai_response, model_used, session_id,
+                                            idempotency_key=idempotency_key, tenant_id=tenant_id)
+            self._ensure_collection()
+            point_id = turn_point_id(metadata)
+            tenant = metadata[TENANT_FIELD]
+            
+            def save() -> bool:
+                if self._is_stored(point_id, timings, tenant):
+                    return True
+                
+                if self.batcher is not None:
+                    # Le batcher encode et insère le lot, puis renvoie le résultat de ce tour
+                    return self.batcher.submit(metadata).result()
+                
+                # Générer les embeddings et les points
+                points = self._embed_turns([metadata], timings=timings)[0]
+                
+                # Insérer dans le stockage
+                self._upsert(points, timings=timings, tenant=tenant)
+                
+                logger.info(f"Conversation sauvegardée pour la session {metadata['session_id']}")
+                return True
+            
+            return self._save_once(point_id, save)
+            
+        except Exception as e:
+            logger.error(f"Erreur lors de la sauvegarde: {e}")
+            return False
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000
+            self._finish_request("save", timings)
+    
+    def _group_by_backend(self, items: List[Dict[str, Any]]) -> List[List[int]]:
+        """Positions des items regroupées par collection de destination"""
+        groups: Dict[int, List[int]] = {}
+        for position, item in enumerate(items):
+            groups.setdefault(id(self._backend_for(item[TENANT_FIELD])), []).append(position)
+        return list(groups.values())
+    
+    def _save_batch(self, items: List[Dict[str, Any]]) -> List[bool]:
+        """Encode un lot de métadonnées en un appel et l'insère en un upsert par collection
+
+        Une erreur d'encodage concerne tout le lot : elle est propagée au
+        batcher, qui la transmet à chaque appelant.
+        """
+        turns = self._embed_turns(items)
+        
+        results = [False] * len(items)
+        for positions in self._group_by_backend(items):
+            tenant = items[positions[0]][TENANT_FIELD]
+            try:
+                self._upsert([point for i in positions for point in turns[i]], tenant=tenant)
+                for i in positions:
+                    results[i] = True
+                continue
+            except Exception as e:
+                logger.error(f"Erreur lors de l'upsert du lot, repli tour par tour: {e}")
+            
+            # Isoler les échecs pour que chaque appelant reçoive son propre résultat
+            for i in positions:
+                try:
+                    self._upsert(turns[i], tenant=tenant)
+                    results[i] = True
+                except Exception as e:
+                    logger.error(f"Erreur lors de la sauvegarde: {e}")
+        logger.info(f"Lot de {sum(results)} conversations sauvegardé")
+        return results
+    
+    def save_conversations(self, records: Iterable[Any], batch_size: int = 256,
+                           parallelism: int = 4) -> Dict[str, Any]:
+        """Sauvegarde en masse des conversations (import d'historique)
+
+        Les enregistrements sont lus au fil de l'eau, encodés par lots de
+        batch_size et insérés sans attendre l'indexation, avec au plus
+        parallelism lots en vol : la mémoire reste bornée quelle que soit la
+        taille de l'entrée. Les tours déjà stockés (ou répétés dans l'entrée)
+        sont comptés dans duplicates, sans être encodés ni réécrits.
+        """
+        saved = 0
+        failed = 0
+        duplicates = 0
+        errors: List[Dict[str, Any]] = []
+        
+        def record_error(index: int, message: str):
+            nonlocal failed
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"index": index, "error": message})
+        
+        def upsert_chunk(points: List[PointStruct], tenant: str):
+            self._upsert(points, wait=False, tenant=tenant)
+        
+        in_flight: deque = deque()
+        
+        def drain(max_pending: int):
+            nonlocal saved
+            while len(in_flight) > max_pending:
+                future, indices = in_flight.popleft()
+                try:
+                    future.result()
+                    saved += len(indices)
+                except Exception as e:
+                    for index in indices:
+                        record_error(index, f"Erreur Qdrant: {e}")
+        
+        def flush(chunk: List[Any]):
+            try:
+                groups = self._group_by_backend([metadata for _, metadata in chunk])
+            except Exception as e:
+                for index, _ in chunk:
+                    record_error(index, f"Erreur Qdrant: {e}")
+                return
+            for positions in groups:
+                flush_group([chunk[position] for position in positions])
+        
+        def flush_group(chunk: List[Any]):
+            nonlocal duplicates
+            tenant = chunk[0][1][TENANT_FIELD]
+            unique: Dict[str, Any] = {}
+            for index, metadata in chunk:
+                unique.setdefault(turn_point_id(metadata), (index, metadata))
+            try:
+                stored = self._backend_for(tenant).existing_ids(list(unique))
+            except Exception as e:
+                for index, _ in chunk:
+                    record_error(index, f"Erreur Qdrant: {e}")
+                return
+            fresh = [entry for point_id, entry in unique.items() if point_id not in stored]
+            duplicates += len(chunk) - len(fresh)
+            self.metrics.event("duplicate_save", len(chunk) - len(fresh))
+            if not fresh:
+                return
+            chunk = fresh
+            indices = [index for index, _ in chunk]
+            try:
+                turns = self._embed_turns([metadata for _, metadata in chunk])
+            except Exception as e:
+                for index in indices:
+                    record_error(index, f"Erreur d'encodage: {e}")
+                return
+            points = [point for turn_points in turns for point in turn_points]
+            in_flight.append((executor.submit(upsert_chunk, points, tenant), indices))
+            drain(parallelism)
+        
+        self._ensure_collection()
+        chunk: List[Any] = []
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+            for index, record in enumerate(records):
+                if isinstance(record, Exception):
+                    record_error(index, str(record))
+                    continue
+                if not isinstance(record, dict):
+                    record_error(index, "Enregistrement invalide: objet JSON attendu")
+                    continue
+                user_message = record.get("user_message", "")
+                ai_response = record.get("ai_response", "")
+                if not isinstance(user_message, str) or not isinstance(ai_response, str):
+                    record_error(index, "user_message et ai_response doivent être des chaînes")
+                    continue
+                if not user_message and not ai_response:
+                    record_error(index, "Conversation vide")
+                    continue
+                chunk.append((index, self._build_metadata(
+                    user_message,
+                    ai_response,
+                    record.get("model_used", "phi3:3.8b"),
+                    record.get("session_id"),
+                    record.get("timestamp"),
+                    record.get("idempotency_key"),
+                    record.get("tenant_id")
+                )))
+                if len(chunk) >= batch_size:
+                    flush(chunk)
+                    chunk = []
+            if chunk:
+                flush(chunk)
+            drain(0)
+        
+        logger.info(f"Import en masse: {saved} conversations sauvegardées, "
+                    f"{duplicates} déjà présentes, {failed} en erreur")
+        return {"saved": saved, "duplicates": duplicates, "failed": failed, "errors": errors}
+    
+    @staticmethod
+    def _format_search_hit(hit) -> Dict[str, Any]:
+        """Formate un résultat de recherche pour l'API"""
+        return {
+            "score": hit.score,
+            "user_message": payload_text(hit.payload, "user_message"),
+            "ai_response": payload_text(hit.payload, "ai_response"),
+            "model_used": hit.payload.get("model_used", ""),
+            "session_id": hit.payload.get("session_id", ""),
+            "timestamp": hit.payload.get("timestamp", "")
+        }
+    
+    @staticmethod
+    def _format_history(records) -> List[Dict[str, Any]]:
+        """Formate les points d'une session, du plus ancien au plus récent"""
+        records = sorted(records, key=lambda hit: hit.payload.get("timestamp_ms", 0))
+        return [{
+            "user_message": payload_text(hit.payload, "user_message"),
+            "ai_response": payload_text(hit.payload, "ai_response"),
+            "model_used": hit.payload.get("model_used", ""),
+            "timestamp": hit.payload.get("timestamp", "")
+        } for hit in records]
+    
+    @staticmethod
+    def _render_context(current_query: str, history: List[Dict[str, Any]],
+                        similar: List[Dict[str, Any]]) -> str:
+        """Assemble le texte du contexte réflexif"""
+        context_parts = []
+        
+        # Ajouter l'historique de la session si disponible
+        if history:
+            context_parts.append("=== Historique de la conversation ===")
+            for conv in history[-3:]:  # Dernières 3 conversations
+                context_parts.append(f"User: {conv['user_message']}")
+                context_parts.append(f"AI: {conv['ai_response']}")
+            context_parts.append("")
+        
+        # Ajouter des conversations similaires
+        if similar:
+            context_parts.append("=== Conversations similaires ===")
+            for conv in similar:
+                context_parts.append(f"User: {conv['user_message']}")
+                context_parts.append(f"AI: {conv['ai_response']}")
+            context_parts.append("")
+        
+        # Ajouter le contexte actuel
+        context_parts.append("=== Contexte actuel ===")
+        context_parts.append(f"User: {current_query}")
+        
+        return "\n".join(context_parts)
+    
+    def _search_hits(self, query: str, limit: int,
+                     timings: Optional[Dict[str, float]] = None,
+                     search_params: Optional[SearchParams] = None,
+                     ids_only: bool = False,
+                     score_threshold: Optional[float] = None,
+                     tenant: str = DEFAULT_TENANT) -> List[Any]:
+        """Encode la requête et renvoie les limit tours les plus proches du tenant (un résultat par tour)"""
+        start = time.perf_counter()
+        backend = self._backend_for(tenant)
+        # Générer l'embedding de la requête (ou le reprendre du cache)
+        query_embedding = self._encode_query(query)
+        encoded = time.perf_counter()
+        
+        # Rechercher dans le stockage : payloads réduits au rattachement des chunks
+        fetch = limit * CHUNK_SEARCH_OVERSAMPLING
+        while True:
+            with self.metrics.timed("search"):
+                hits = backend.search(query_embedding, fetch, search_params,
+                                      CHUNK_HIT_FIELDS, score_threshold, tenant)
+            best = collapse_chunk_hits(hits, limit)
+            fetch = widened_search_limit(fetch, len(hits), len(best), limit)
+            if fetch is None:
+                break
+        # Payloads complets pour les seuls tours retenus
+        payloads = {}
+        if best and not ids_only:
+            with self.metrics.timed("retrieve"):
+                payloads = {record.id: record.payload for record in backend.retrieve(list(best))}
+        hits = resolve_turn_hits(best, payloads, ids_only)
+        if timings is not None:
+            timings["encode_ms"] = (encoded - start) * 1000
+            timings["search_ms"] = (time.perf_counter() - encoded) * 1000
+        return hits
+    
+    def _history_records(self, session_id: str, limit: int,
+                         timings: Optional[Dict[str, float]] = None,
+                         tenant: str = DEFAULT_TENANT) -> List[Any]:
+        """Renvoie les limit derniers points d'une session du tenant (les plus récents d'abord)"""
+        backend = self._backend_for(tenant)
+        with self.metrics.timed("scroll", timings, "history_ms"):
+            return backend.session_history(session_id, limit, tenant)
+    
+    def search_similar_conversations(self, query: str, limit: int = 5,
+                                     hnsw_ef: Optional[int] = None, exact: bool = False,
+                                     rescore: Optional[bool] = None,
+                                     oversampling: Optional[float] = None,
+                                     ids_only: bool = False,
+                                     tenant_id: Optional[str] = None,
+                                     session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Recherche des conversations similaires parmi celles du tenant
+
+        hnsw_ef, exact, rescore et oversampling remplacent ponctuellement les
+        paramètres de recherche par défaut du backend. Avec ids_only=True,
+        seuls les IDs et scores sont demandés et renvoyés. Le tenant est
+        tenant_id, ou déduit de session_id.
+        """
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        try:
+            search_params = build_search_params(hnsw_ef, exact, rescore, oversampling)
+            hits = self._search_hits(query, limit, timings, search_params=search_params,
+                                     ids_only=ids_only, tenant=self.tenant(tenant_id, session_id))
+            # Formater les résultats
+            if ids_only:
+                return [{"id": hit.id, "score": hit.score} for hit in hits]
+            return [self._format_search_hit(hit) for hit in hits]
+            
+        except Exception as e:
+            logger.error(f"Erreur lors de la recherche: {e}")
+            return []
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000
+            self._finish_request("search", timings)
+    
+    def get_conversation_history(self, session_id: str, limit: int = 10,
+                                 tenant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Récupère les limit derniers tours d'une session, dans l'ordre chronologique"""
+        try:
+            # Formater les résultats, triés par timestamp
+            return self._format_history(self._history_records(
+                session_id, limit, tenant=self.tenant(tenant_id, session_id)
+            ))
+            
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération de l'historique: {e}")
+            return []
+    
+    def _fit_budget(self, current_query: str, history: List[Dict[str, Any]],
+                    similar: List[Dict[str, Any]], max_tokens: int):
+        """Garde les tours qui tiennent dans max_tokens, par ordre de pertinence
+
+        L'historique passe en premier (du plus récent au plus ancien), puis les
+        conversations similaires par score décroissant. Le premier tour qui ne
+        tient pas est tronqué (réponse d'abord) et le remplissage s'arrête.
+        """
+        # En-têtes et question courante sont toujours présents : on les réserve d'abord
+        empty = {"user_message": "", "ai_response": ""}
+        fixed = self._render_context(current_query, [empty], [empty])
+        candidates = list(reversed(history)) + similar
+        costs = self._count_tokens(
+            [fixed] + [f"User: {c['user_message']}\nAI: {c['ai_response']}" for c in candidates]
+        )
+        remaining = max_tokens - costs[0]
+        
+        kept = set()
+        truncated: Dict[int, Dict[str, Any]] = {}
+        for index, (conv, cost) in enumerate(zip(candidates, costs[1:])):
+            if cost <= remaining:
+                kept.add(index)
+                remaining -= cost
+                continue
+            prefix = self._count_tokens([f"User: {conv['user_message']}\nAI: "])[0]
+            if remaining > prefix:
+                truncated[index] = dict(conv, ai_response=self._truncate_tokens(
+                    conv["ai_response"], remaining - prefix
+                ))
+                kept.add(index)
+            elif remaining > 0:
+                truncated[index] = dict(conv, user_message=self._truncate_tokens(
+                    conv["user_message"], remaining
+                ), ai_response="")
+                kept.add(index)
+            break
+        
+        selected = [truncated.get(i, candidates[i]) if i in kept else None
+                    for i in range(len(candidates))]
+        fitted_history = [conv for conv in reversed(selected[:len(history)]) if conv is not None]
+        fitted_similar = [conv for conv in selected[len(history):] if conv is not None]
+        return fitted_history, fitted_similar
+    
+    def _build_context(self, current_query: str, history_records: List[Any],
+                       similar_hits: List[Any], max_results: int = CONTEXT_SIMILAR_RESULTS,
+                       max_tokens: Optional[int] = None) -> str:
+        """Assemble le contexte en écartant les conversations déjà présentes dans l'historique"""
+        history_ids = {record.id for record in history_records}
+        similar = [hit for hit in similar_hits if hit.id not in history_ids][:max_results]
+        history = self._format_history(history_records)
+        similar = [self._format_search_hit(hit) for hit in similar]
+        if max_tokens:
+            history, similar = self._fit_budget(current_query, history, similar, max_tokens)
+        return self._render_context(current_query, history, similar)
+    
+    def create_reflective_context(self, current_query: str, session_id: str = None,
+                                  timings: Optional[Dict[str, float]] = None,
+                                  max_tokens: Optional[int] = None,
+                                  score_threshold: Optional[float] = None,
+                                  max_results: Optional[int] = None,
+                                  tenant_id: Optional[str] = None) -> str:
+        """Crée un contexte réflexif basé sur l'historique et les conversations similaires
+
+        L'historique et la recherche sont lancés en parallèle. Si timings est
+        fourni, il reçoit la durée de chaque étape en millisecondes.
+        max_tokens, score_threshold et max_results remplacent les réglages par
+        défaut du service. Seules les conversations du tenant (tenant_id, ou
+        déduit de session_id) sont utilisées.
+        """
+        start = time.perf_counter()
+        stage_timings: Dict[str, float] = {}
+        max_tokens = max_tokens or self.context_max_tokens
+        if score_threshold is None:
+            score_threshold = self.similarity_threshold
+        max_results = max_results or self.context_max_results
+        try:
+            tenant = self.tenant(tenant_id, session_id)
+            history_future = None
+            if session_id:
+                history_future = self._context_executor.submit(
+                    self._history_records, session_id, CONTEXT_HISTORY_TURNS, stage_timings, tenant
+                )
+            
+            # Demander de quoi compenser les doublons retirés ensuite
+            try:
+                similar_hits = self._search_hits(
+                    current_query, max_results + CONTEXT_HISTORY_TURNS, stage_timings,
+                    score_threshold=score_threshold, tenant=tenant
+                )
+            except Exception as e:
+                logger.error(f"Erreur lors de la recherche: {e}")
+                similar_hits = []
+            
+            history_records = []
+            if history_future is not None:
+                try:
+                    history_records = history_future.result()
+                except Exception as e:
+                    logger.error(f"Erreur lors de la récupération de l'historique: {e}")
+            
+            with self.metrics.timed("render", stage_timings):
+                return self._build_context(current_query, history_records, similar_hits,
+                                           max_results, max_tokens)
+            
+        except Exception as e:
+            logger.error(f"Erreur lors de la création du contexte réflexif: {e}")
+            return f"User: {current_query}"
+        finally:
+            stage_timings["total_ms"] = (time.perf_counter() - start) * 1000
+            self._finish_request("context", stage_timings)
+            if timings is not None:
+                timings.update(stage_timings)
+
+class AsyncOpenWebUIMemory:
+    """Variante asynchrone pour le mode ASGI
+
+    Réutilise l'encodeur, le cache et le formatage d'un OpenWebUIMemory,
+    exécute l'encodage dans un pool de threads borné et dialogue avec Qdrant
+    via le client asynchrone. Les autres backends sont appelés dans le pool.
+    Avec le batcher, une sauvegarde attend son lot sans occuper de thread du
+    pool : la taille des lots n'est pas bornée par encode_workers.
+    """
+
+    def __init__(self, memory: OpenWebUIMemory, encode_workers: int = 2):
+        self.memory = memory
+        self.backend = memory.backend
+        self.metrics = memory.metrics
+        self.qdrant_client = None
+        if isinstance(self.backend, QdrantBackend):
+            self.qdrant_client = self.backend.create_async_client()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, encode_workers),
+                                           thread_name_prefix="encode")
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def _run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+        if self.qdrant_client is not None:
+            await self.qdrant_client.close()
+
+    async def _backend(self, tenant: str) -> MemoryBackend:
+        """Backend du tenant ; la première ouverture d'une collection dédiée se fait hors boucle"""
+        if tenant in self.memory.dedicated_tenants and tenant not in self.memory._tenant_backends:
+            return await self._run_blocking(self.memory._backend_for, tenant)
+        return self.memory._backend_for(tenant)
+
+    async def _upsert(self, points: List[PointStruct],
+                      timings: Optional[Dict[str, float]] = None, tenant: str = DEFAULT_TENANT):
+        if self.qdrant_client is None:
+            return await self._run_blocking(self.memory._upsert, points, True, timings, tenant)
+        backend = await self._backend(tenant)
+        self.metrics.observe_batch("upsert", len(points))
+        with self.metrics.timed("upsert", timings):
+            await self.backend.acall(self.qdrant_client.upsert, **backend.upsert_args(points))
+
+    async def _search(self, vector: List[float], limit: int,
+                      search_params: Optional[SearchParams] = None,
+                      with_payload: Any = SEARCH_PAYLOAD_FIELDS,
+                      score_threshold: Optional[float] = None,
+                      tenant: str = DEFAULT_TENANT) -> List[ScoredPoint]:
+        backend = await self._backend(tenant)
+        with self.metrics.timed("search"):
+            if self.qdrant_client is None:
+                return await self._run_blocking(backend.search, vector, limit, search_params,
+                                                with_payload, score_threshold, tenant)
+            response = await self.backend.acall(
+                self.qdrant_client.query_points,
+                **backend.search_args(vector, limit, search_params, with_payload, score_threshold, tenant)
+            )
+            return response.points
+
+    async def _retrieve(self, ids: List[Any], tenant: str = DEFAULT_TENANT) -> List[Record]:
+        backend = await self._backend(tenant)
+        with self.metrics.timed("retrieve"):
+            if self.qdrant_client is None:
+                return await self._run_blocking(backend.retrieve, ids)
+            return await self.backend.acall(self.qdrant_client.retrieve, **backend.retrieve_args(ids))
+
+    async def _history(self, session_id: str, limit: int, tenant: str = DEFAULT_TENANT) -> List[Record]:
+        backend = await self._backend(tenant)
+        with self.metrics.timed("scroll"):
+            if self.qdrant_client is None:
+                return await self._run_blocking(backend.session_history, session_id, limit, tenant)
+            records, _ = await self.backend.acall(self.qdrant_client.scroll,
+                                                  **backend.history_args(session_id, limit, tenant))
+            return records
+
+    async def _is_stored(self, point_id: str, timings: Dict[str, float],
+                         tenant: str = DEFAULT_TENANT) -> bool:
+        if self.qdrant_client is None:
+            return await self._run_blocking(self.memory._is_stored, point_id, timings, tenant)
+        backend = await self._backend(tenant)
+        with self.metrics.timed("exists", timings):
+            records = await self.backend.acall(
+                self.qdrant_client.retrieve,
+                **backend.retrieve_args([point_id], with_payload=False)
+            )
+        if records:
+            self.metrics.event("duplicate_save")
+        return bool(records)
+
+    async def _save_turn(self, metadata: Dict[str, Any], point_id: str,
+                         timings: Dict[str, float]) -> bool:
+        tenant = metadata[TENANT_FIELD]
+        if await self._is_stored(point_id, timings, tenant):
+            return True
+        if self.memory.batcher is not None:
+            # Attente sans bloquer de thread : le pool d'encodage reste libre pour les recherches
+            return await asyncio.wrap_future(self.memory.batcher.submit(metadata))
+        turns = await self._run_blocking(self.memory._embed_turns, [metadata], None, timings)
+        await self._upsert(turns[0], timings, tenant)
+        logger.info(f"Conversation sauvegardée pour la session {metadata['session_id']}")
+        return True
+
+    async def save_conversation(self, user_message: str, ai_response: str,
+                                model_used: str = "phi3:3.8b",
+                                session_id: Optional[str] = None,
+                                idempotency_key: Optional[str] = None,
+                                tenant_id: Optional[str] = None) -> bool:
+        """Sauvegarde une conversation dans Qdrant (un tour déjà stocké n'est pas réencodé)"""
+        memory = self.memory
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        try:
+            metadata = memory._build_metadata(user_message, ai_response, model_used, session_id,
+                                              idempotency_key=idempotency_key, tenant_id=tenant_id)
+            if not memory._collection_ready:
+                await self._run_blocking(memory._ensure_collection)
+            point_id = turn_point_id(metadata)
+            pending = self._in_flight.get(point_id)
+            if pending is not None:
+                # Même tour déjà en cours d'enregistrement dans ce worker
+                self.metrics.event("duplicate_save")
+                return await asyncio.shield(pending)
+            pending = self._in_flight[point_id] = asyncio.get_running_loop().create_future()
+            result = False
+            try:
+                result = await self._save_turn(metadata, point_id, timings)
+                return result
+            finally:
+                del self._in_flight[point_id]
+                pending.set_result(result)
+        except Exception as e:
+            logger.error(f"Erreur lors de la sauvegarde: {e}")
+            return False
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000
+            memory._finish_request("save", timings)
+
+    async def _search_hits(self, query: str, limit: int,
+                           timings: Optional[Dict[str, float]] = None,
+                           search_params: Optional[SearchParams] = None,
+                           ids_only: bool = False,
+                           score_threshold: Optional[float] = None,
+                           tenant: str = DEFAULT_TENANT) -> List[Any]:
+        start = time.perf_counter()
+        query_embedding = await self._run_blocking(self.memory._encode_query, query)
+        encoded = time.perf_counter()
+        fetch = limit * CHUNK_SEARCH_OVERSAMPLING
+        while True:
+            hits = await self._search(query_embedding, fetch, search_params,
+                                      CHUNK_HIT_FIELDS, score_threshold, tenant)
+            best = collapse_chunk_hits(hits, limit)
+            fetch = widened_search_limit(fetch, len(hits), len(best), limit)
+            if fetch is None:
+                break
+        payloads = {}
+        if best and not ids_only:
+            payloads = {record.id: record.payload for record in await self._retrieve(list(best), tenant)}
+        hits = resolve_turn_hits(best, payloads, ids_only)
+        if timings is not None:
+            timings["encode_ms"] = (encoded - start) * 1000
+            timings["search_ms"] = (time.perf_counter() - encoded) * 1000
+        return hits
+
+    async def _history_records(self, session_id: str, limit: int,
+                               timings: Optional[Dict[str, float]] = None,
+                               tenant: str = DEFAULT_TENANT) -> List[Any]:
+        start = time.perf_counter()
+        records = await self._history(session_id, limit, tenant)
+        if timings is not None:
+            timings["history_ms"] = (time.perf_counter() - start) * 1000
+        return records
+
+    async def search_similar_conversations(self, query: str, limit: int = 5,
+                                           hnsw_ef: Optional[int] = None, exact: bool = False,
+                                           rescore: Optional[bool] = None,
+                                           oversampling: Optional[float] = None,
+                                           ids_only: bool = False,
+                                           tenant_id: Optional[str] = None,
+                                           session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Recherche des conversations similaires parmi celles du tenant"""
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        try:
+            search_params = build_search_params(hnsw_ef, exact, rescore, oversampling)
+            hits = await self._search_hits(query, limit, timings, search_params=search_params,
+                                           ids_only=ids_only,
+                                           tenant=self.memory.tenant(tenant_id, session_id))
+            if ids_only:
+                return [{"id": hit.id, "score": hit.score} for hit in hits]
+            return [OpenWebUIMemory._format_search_hit(hit) for hit in hits]
+        except Exception as e:
+            logger.error(f"Erreur lors de la recherche: {e}")
+            return []
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000
+            self.memory._finish_request("search", timings)
+
+    async def get_conversation_history(self, session_id: str, limit: int = 10,
+                                       tenant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Récupère les limit derniers tours d'une session, dans l'ordre chronologique"""
+        try:
+            return OpenWebUIMemory._format_history(await self._history_records(
+                session_id, limit, tenant=self.memory.tenant(tenant_id, session_id)
+            ))
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération de l'historique: {e}")
+            return []
+
+    async def create_reflective_context(self, current_query: str, session_id: Optional[str] = None,
+                                        timings: Optional[Dict[str, float]] = None,
+                                        max_tokens: Optional[int] = None,
+                                        score_threshold: Optional[float] = None,
+                                        max_results: Optional[int] = None,
+                                        tenant_id: Optional[str] = None) -> str:
+        """Crée un contexte réflexif ; historique et recherche sont lancés en parallèle"""
+        start = time.perf_counter()
+        stage_timings: Dict[str, float] = {}
+        max_tokens = max_tokens or self.memory.context_max_tokens
+        if score_threshold is None:
+            score_threshold = self.memory.similarity_threshold
+        max_results = max_results or self.memory.context_max_results
+        try:
+            async def no_history() -> List[Any]:
+                return []
+            
+            tenant = self.memory.tenant(tenant_id, session_id)
+            history_records, similar_hits = await asyncio.gather(
+                self._history_records(session_id, CONTEXT_HISTORY_TURNS, stage_timings, tenant)
+                if session_id else no_history(),
+                self._search_hits(current_query, max_results + CONTEXT_HISTORY_TURNS,
+                                  stage_timings, score_threshold=score_threshold, tenant=tenant),
+                return_exceptions=True
+            )
+            if isinstance(history_records, Exception):
+                logger.error(f"Erreur lors de la récupération de l'historique: {history_records}")
+                history_records = []
+            if isinstance(similar_hits, Exception):
+                logger.error(f"Erreur lors de la recherche: {similar_hits}")
+                similar_hits = []
+            
+            # Le comptage de tokens est du CPU : hors de la boucle d'événements
+            with self.metrics.timed("render", stage_timings):
+                return await self._run_blocking(self.memory._build_context, current_query,
+                                                history_records, similar_hits, max_results, max_tokens)
+        except Exception as e:
+            logger.error(f"Erreur lors de la création du contexte réflexif: {e}")
+            return f"User: {current_query}"
+        finally:
+            stage_timings["total_ms"] = (time.perf_counter() - start) * 1000
+            self.memory._finish_request("context", stage_timings)
+            if timings is not None:
+                timings.update(stage_timings)
@@ -0,0 +1,127 @@
+"""
+Métriques Prometheus : histogrammes de latence par étape et compteurs d'erreurs
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+# Bornes des histogrammes de /metrics (secondes pour les latences, éléments pour les lots)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+class _Histogram:
+    """Histogramme cumulatif à bornes fixes (non protégé : voir StageMetrics)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+class StageMetrics:
+    """Latences par étape, erreurs et tailles de lot, exposées au format Prometheus
+
+    Une observation coûte deux appels à perf_counter et une insertion sous
+    verrou ; les jauges (taille de la collection, état du modèle) ne sont
+    calculées qu'au moment de l'exposition.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Histogram] = {}
+        self._requests: Dict[str, _Histogram] = {}
+        self._batches: Dict[str, _Histogram] = {}
+        self._errors: Dict[str, int] = {}
+        self._events: Dict[str, int] = {}
+
+    @staticmethod
+    def _observe(histograms: Dict[str, _Histogram], key: str, value: float, buckets):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms.setdefault(key, _Histogram(buckets))
+        histogram.observe(value)
+
+    def observe_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self._observe(self._stages, stage, seconds, LATENCY_BUCKETS)
+
+    def observe_request(self, operation: str, seconds: float):
+        with self._lock:
+            self._observe(self._requests, operation, seconds, LATENCY_BUCKETS)
+
+    def observe_batch(self, stage: str, size: int):
+        with self._lock:
+            self._observe(self._batches, stage, size, BATCH_SIZE_BUCKETS)
+
+    def error(self, stage: str):
+        with self._lock:
+            self._errors[stage] = self._errors.get(stage, 0) + 1
+
+    def event(self, name: str, count: int = 1):
+        with self._lock:
+            self._events[name] = self._events.get(name, 0) + count
+
+    @contextmanager
+    def timed(self, stage: str, timings: Optional[Dict[str, float]] = None,
+              key: Optional[str] = None):
+        """Mesure le bloc, compte ses erreurs et reporte sa durée (ms) dans timings[key]"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(stage)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe_stage(stage, elapsed)
+            if timings is not None:
+                timings[key or f"{stage}_ms"] = elapsed * 1000
+
+    def render(self, gauges: Optional[Dict[str, Any]] = None) -> str:
+        """Texte d'exposition Prometheus (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, label, histograms, help_text in (
+                ("memory_stage_duration_seconds", "stage", self._stages,
+                 "Durée de chaque étape (encodage, upsert, recherche, scroll, rendu)"),
+                ("memory_request_duration_seconds", "operation", self._requests,
+                 "Durée totale des opérations save, search et context"),
+                ("memory_batch_size", "stage", self._batches,
+                 "Nombre d'éléments par appel d'encodage ou d'upsert"),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(histograms.items()):
+                    lines.extend(histogram.render(name, f'{label}="{key}"'))
+            lines.append("# HELP memory_stage_errors_total Erreurs par étape")
+            lines.append("# TYPE memory_stage_errors_total counter")
+            for stage, count in sorted(self._errors.items()):
+                lines.append(f'memory_stage_errors_total{{stage="{stage}"}} {count}')
+            lines.append("# HELP memory_events_total Événements notables (sauvegardes dédupliquées)")
+            lines.append("# TYPE memory_events_total counter")
+            for event, count in sorted(self._events.items()):
+                lines.append(f'memory_events_total{{event="{event}"}} {count}')
+        for name, (metric_type, help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,359 @@
+"""
+Rétention : TTL, plafond de tours par session et compaction des sessions inactives
+"""
+
+import importlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+from qdrant_client.models import Record
+import logging
+
+from .backends import MemoryBackend
+from .memory import OpenWebUIMemory
+from .schema import CHUNK_KIND, DEFAULT_TENANT, SUMMARY_KIND, TENANT_FIELD, TEXT_FIELDS, payload_text
+
+logger = logging.getLogger(__name__)
+
+class Summarizer:
+    """Interface de résumé utilisée par la compaction des sessions"""
+
+    def summarize(self, turns: List[Dict[str, Any]]) -> str:
+        """Résumé d'une liste de tours ({"user_message", "ai_response", ...}), du plus ancien au plus récent"""
+        raise NotImplementedError
+
+class ExtractiveSummarizer(Summarizer):
+    """Résumé extractif, sans modèle : les phrases les plus représentatives de la session
+
+    Chaque phrase est notée par la fréquence moyenne, dans la session, de ses
+    mots de plus de trois lettres ; les max_sentences meilleures (dans la
+    limite de max_chars caractères) sont gardées dans l'ordre d'origine.
+    """
+
+    SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+    WORD = re.compile(r"\w{4,}")
+
+    def __init__(self, max_sentences: int = 6, max_chars: int = 2000):
+        self.max_sentences = max_sentences
+        self.max_chars = max_chars
+
+    def summarize(self, turns: List[Dict[str, Any]]) -> str:
+        sentences: List[str] = []
+        seen = set()
+        for turn in turns:
+            for key in TEXT_FIELDS:
+                for sentence in self.SENTENCE_SPLIT.split(turn.get(key) or ""):
+                    sentence = sentence.strip()
+                    if sentence and sentence not in seen:
+                        seen.add(sentence)
+                        sentences.append(sentence)
+        words = [self.WORD.findall(sentence.lower()) for sentence in sentences]
+        frequencies = Counter(word for sentence_words in words for word in sentence_words)
+        scores = [sum(frequencies[word] for word in sentence_words) / len(sentence_words)
+                  if sentence_words else 0.0 for sentence_words in words]
+        kept: List[int] = []
+        length = 0
+        for index in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+            if len(kept) == self.max_sentences:
+                break
+            if kept and length + len(sentences[index]) > self.max_chars:
+                continue
+            kept.append(index)
+            length += len(sentences[index])
+        return " ".join(sentences[index] for index in sorted(kept))[:self.max_chars]
+
+def load_summarizer(spec: Optional[str] = None) -> Summarizer:
+    """Summarizer désigné par "extractive" (défaut) ou "module:fabrique"
+
+    La fabrique (classe ou fonction sans argument) doit renvoyer un objet
+    doté d'une méthode summarize(turns) -> str, par exemple un client LLM.
+    """
+    if not spec or spec == "extractive":
+        return ExtractiveSummarizer()
+    module_name, _, factory = spec.partition(":")
+    if not factory:
+        raise ValueError(f"Summarizer invalide (module:fabrique attendu): {spec}")
+    return getattr(importlib.import_module(module_name), factory)()
+
+class RetentionJob:
+    """Rétention de la mémoire : TTL, plafond de tours par session et compaction
+
+    Un passage traite la collection partagée puis chaque collection dédiée ;
+    pour chacune, trois phases s'enchaînent par lots de batch_size points :
+    - ttl : suppression des points plus anciens que ttl_days ;
+    - sessions : au-delà de max_turns_per_session tours, les plus anciens
+      sont supprimés, et les sessions inactives depuis compact_after_days
+      sont remplacées par un point de résumé produit par summarizer (une
+      session est identifiée par son tenant et son session_id) ;
+    - vacuum : récupération de l'espace libéré (journal du stockage local).
+    
+    La phase sessions relève d'abord les sessions de la collection (tenant
+    et session_id seulement), puis lit les points d'une session à la fois :
+    la mémoire utilisée dépend du nombre de sessions et de la plus grosse
+    d'entre elles, pas de la taille de la collection.
+    
+    Avec state_path, la collection et la phase en cours, l'offset de parcours,
+    la dernière session traitée et le bilan sont enregistrés après chaque lot : un passage
+    interrompu reprend où il s'est arrêté, avec les mêmes dates limites. Le
+    verrou posé à côté de ce fichier empêche deux processus (workers uvicorn,
+    cron) de traiter la collection en même temps.
+    """
+
+    def __init__(self, memory: "OpenWebUIMemory", ttl_days: Optional[float] = None,
+                 max_turns_per_session: Optional[int] = None,
+                 compact_after_days: Optional[float] = None,
+                 summarizer: Optional[Summarizer] = None, batch_size: int = 256,
+                 state_path: Optional[str] = None):
+        self.memory = memory
+        self.ttl_days = ttl_days
+        self.max_turns_per_session = max_turns_per_session
+        self.compact_after_days = compact_after_days
+        self.summarizer = summarizer or ExtractiveSummarizer()
+        self.batch_size = batch_size
+        self.state_path = state_path
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _new_state() -> Dict[str, Any]:
+        return {
+            "now_ms": int(time.time() * 1000),
+            "completed": [],
+            "collection": None,
+            "phase": "ttl",
+            "offset": None,
+            "last_session": None,
+            "report": {
+                "points_deleted": 0,
+                "bytes_reclaimed": 0,
+                "sessions_capped": 0,
+                "sessions_compacted": 0,
+                "storage_bytes_reclaimed": 0
+            }
+        }
+
+    def _load_state(self) -> Dict[str, Any]:
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("phase") != "done":
+                logger.info(f"Reprise de la rétention en phase {state['phase']}")
+                return state
+        return self._new_state()
+
+    def _save_state(self, state: Dict[str, Any]):
+        if not self.state_path:
+            return
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def _cutoff(self, state: Dict[str, Any], days: Optional[float]) -> Optional[int]:
+        return None if days is None else state["now_ms"] - int(days * 86400 * 1000)
+
+    def _entry(self, record: Record, vector_bytes: int) -> Tuple[Any, Optional[str], int, Any, int]:
+        """(id, kind, timestamp_ms, turn_id, taille estimée) d'un point parcouru"""
+        payload = record.payload or {}
+        size = vector_bytes + len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        return (record.id, payload.get("kind"), payload.get("timestamp_ms") or 0,
+                payload.get("turn_id"), size)
+
+    def _delete(self, backend: MemoryBackend, entries: List[Tuple], report: Dict[str, Any]):
+        for start in range(0, len(entries), self.batch_size):
+            batch = entries[start:start + self.batch_size]
+            with self.memory.metrics.timed("delete"):
+                backend.delete([entry[0] for entry in batch])
+            report["points_deleted"] += len(batch)
+            report["bytes_reclaimed"] += sum(entry[4] for entry in batch)
+        self.memory.metrics.event("retention_deleted", len(entries))
+
+    def _expire(self, backend: MemoryBackend, state: Dict[str, Any], vector_bytes: int):
+        """Phase ttl : supprime page par page les points antérieurs à la date limite"""
+        cutoff = self._cutoff(state, self.ttl_days)
+        while True:
+            records, state["offset"] = backend.scan(state["offset"], self.batch_size, before_ms=cutoff)
+            self._delete(backend, [self._entry(record, vector_bytes) for record in records],
+                         state["report"])
+            self._save_state(state)
+            if state["offset"] is None:
+                return
+
+    def _compact(self, backend: MemoryBackend, tenant: str, session_id: str,
+                 entries: List[Tuple], report: Dict[str, Any]):
+        """Remplace les points d'une session par un point de résumé"""
+        turn_ids = [entry[0] for entry in entries if entry[1] != CHUNK_KIND]
+        records = backend.retrieve(turn_ids, with_payload=True)
+        if not records:
+            return
+        records.sort(key=lambda record: record.payload.get("timestamp_ms") or 0)
+        turns = []
+        compacted = 0
+        for record in records:
+            turns.append({
+                "user_message": payload_text(record.payload, "user_message"),
+                "ai_response": payload_text(record.payload, "ai_response"),
+                "timestamp": record.payload.get("timestamp"),
+                "model_used": record.payload.get("model_used")
+            })
+            # Un résumé précédent compte pour les tours qu'il remplace déjà
+            compacted += record.payload.get("compacted_turns", 1)
+        latest = records[-1].payload
+        metadata = self.memory._build_metadata(
+            f"Résumé de la session {session_id} ({compacted} échanges)",
+            self.summarizer.summarize(turns),
+            latest.get("model_used", "phi3:3.8b"),
+            session_id,
+            latest.get("timestamp"),
+            idempotency_key=f"{SUMMARY_KIND}:{session_id}",
+            tenant_id=tenant
+        )
+        metadata["kind"] = SUMMARY_KIND
+        metadata["compacted_turns"] = compacted
+        # Même ID d'un passage à l'autre : une reprise remplace le résumé au lieu de le dupliquer
+        points = self.memory._embed_turns([metadata])[0]
+        self.memory.metrics.observe_batch("upsert", len(points))
+        with self.memory.metrics.timed("upsert"):
+            backend.upsert(points)
+        kept = {point.id for point in points}
+        self._delete(backend, [entry for entry in entries if entry[0] not in kept], report)
+        report["bytes_reclaimed"] -= sum(
+            len(json.dumps(point.payload, ensure_ascii=False).encode("utf-8")) + 4 * len(point.vector)
+            for point in points
+        )
+        report["sessions_compacted"] += 1
+        self.memory.metrics.event("session_compacted")
+
+    def _cap(self, backend: MemoryBackend, entries: List[Tuple], turns: List[Tuple],
+             report: Dict[str, Any]):
+        """Supprime les tours (et leurs chunks) au-delà de max_turns_per_session"""
+        doomed = {entry[0] for entry in turns[:len(turns) - self.max_turns_per_session]}
+        self._delete(backend, [entry for entry in entries if entry[0] in doomed or entry[3] in doomed],
+                     report)
+        report["sessions_capped"] += 1
+
+    def _session_keys(self, backend: MemoryBackend) -> List[Tuple[str, str]]:
+        """(tenant, session_id) de toutes les sessions de la collection, triés"""
+        keys = set()
+        offset = None
+        while True:
+            records, offset = backend.scan(offset, self.batch_size,
+                                           with_payload=[TENANT_FIELD, "session_id"])
+            for record in records:
+                payload = record.payload or {}
+                if payload.get("session_id") is not None:
+                    keys.add((payload.get(TENANT_FIELD, DEFAULT_TENANT), payload["session_id"]))
+            if offset is None:
+                return sorted(keys)
+
+    def _session_entries(self, backend: MemoryBackend, tenant: str, session_id: str,
+                         vector_bytes: int) -> List[Tuple]:
+        """Entrées des points d'une session (chunks compris), lues page par page"""
+        entries = []
+        offset = None
+        while True:
+            records, offset = backend.scan(offset, self.batch_size, session_id=session_id)
+            entries.extend(self._entry(record, vector_bytes) for record in records
+                           if (record.payload or {}).get(TENANT_FIELD, DEFAULT_TENANT) == tenant)
+            if offset is None:
+                return entries
+
+    def _sessions(self, backend: MemoryBackend, state: Dict[str, Any], vector_bytes: int):
+        """Phase sessions : plafond de tours et compaction des sessions inactives"""
+        compact_cutoff = self._cutoff(state, self.compact_after_days)
+        report = state["report"]
+        for tenant, session_id in self._session_keys(backend):
+            if state["last_session"] is not None and [tenant, session_id] <= state["last_session"]:
+                continue
+            entries = self._session_entries(backend, tenant, session_id, vector_bytes)
+            # Tours hors chunks, du plus ancien au plus récent
+            turns = sorted((entry for entry in entries if entry[1] != CHUNK_KIND),
+                           key=lambda entry: entry[2])
+            originals = [entry for entry in turns if entry[1] != SUMMARY_KIND]
+            if (compact_cutoff is not None and originals and len(turns) > 1
+                    and turns[-1][2] < compact_cutoff):
+                self._compact(backend, tenant, session_id, entries, report)
+            elif self.max_turns_per_session and len(originals) > self.max_turns_per_session:
+                self._cap(backend, entries, originals, report)
+            else:
+                continue
+            state["last_session"] = [tenant, session_id]
+            self._save_state(state)
+
+    def _run_phases(self, backend: MemoryBackend, state: Dict[str, Any], vector_bytes: int):
+        """Phases ttl, sessions et vacuum d'une collection, à partir de state["phase"]"""
+        if state["phase"] == "ttl":
+            if self.ttl_days is not None:
+                self._expire(backend, state, vector_bytes)
+            state.update(phase="sessions", offset=None)
+            self._save_state(state)
+        if state["phase"] == "sessions":
+            if self.max_turns_per_session or self.compact_after_days is not None:
+                self._sessions(backend, state, vector_bytes)
+            state["phase"] = "vacuum"
+            self._save_state(state)
+        if state["phase"] == "vacuum":
+            state["report"]["storage_bytes_reclaimed"] += backend.vacuum()
+            state["phase"] = "collection_done"
+            self._save_state(state)
+
+    def run(self) -> Dict[str, Any]:
+        """Exécute (ou reprend) un passage complet et retourne son bilan"""
+        lock = None
+        if self.state_path:
+            import fcntl
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+            lock = open(self.state_path + ".lock", "w")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                logger.info("Rétention déjà en cours dans un autre processus")
+                return {"skipped": True}
+        start = time.perf_counter()
+        try:
+            if not self.memory._ensure_collection():
+                raise RuntimeError(self.memory.last_error)
+            vector_bytes = 4 * self.memory.embedding_model.get_sentence_embedding_dimension()
+            state = self._load_state()
+            with self.memory.metrics.timed("retention"):
+                for backend in self.memory.all_backends():
+                    if backend.collection_name in state["completed"]:
+                        continue
+                    if state["collection"] != backend.collection_name:
+                        state.update(collection=backend.collection_name, phase="ttl",
+                                     offset=None, last_session=None)
+                    self._run_phases(backend, state, vector_bytes)
+                    state["completed"].append(backend.collection_name)
+                    self._save_state(state)
+                state["phase"] = "done"
+                self._save_state(state)
+            report = dict(state["report"], duration_s=round(time.perf_counter() - start, 3))
+            logger.info(f"Rétention: {report['points_deleted']} points supprimés, "
+                        f"{report['sessions_compacted']} sessions compactées, "
+                        f"~{report['bytes_reclaimed']} octets récupérés")
+            return report
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def start(self, interval_s: float) -> threading.Thread:
+        """Relance run() toutes les interval_s secondes dans un thread d'arrière-plan"""
+        def loop():
+            while not self._stopped.wait(interval_s):
+                try:
+                    self.run()
+                except Exception as e:
+                    logger.error(f"Erreur lors de la rétention: {e}")
+        
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=loop, name="memory-retention", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stopped.set()
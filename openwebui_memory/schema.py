@@ -0,0 +1,175 @@
+"""
+Schéma des points : champs de payload, tenants, IDs et regroupement des chunks
+"""
+
+import base64
+import hashlib
+import re
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+from qdrant_client.models import (
+    FieldCondition, KeywordIndexParams, KeywordIndexType, MatchValue, PayloadSchemaType, ScoredPoint
+)
+
+# Clé de tenant portée par chaque point (chunks compris) ; recherche et historique
+# sont toujours filtrés dessus. Sans tenant explicite ni préfixe "<tenant><séparateur>"
+# dans session_id, un tour appartient à DEFAULT_TENANT.
+TENANT_FIELD = "tenant_id"
+DEFAULT_TENANT = "default"
+
+# Index de payload créés sur la collection (filtres et tri côté serveur) ;
+# is_tenant regroupe sur disque les points de chaque tenant
+PAYLOAD_INDEXES = {
+    TENANT_FIELD: KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True),
+    "session_id": PayloadSchemaType.KEYWORD,
+    "model_used": PayloadSchemaType.KEYWORD,
+    "timestamp_ms": PayloadSchemaType.INTEGER,
+}
+
+# Champs de payload lus par la recherche et l'historique (variantes "_z" compressées comprises)
+TEXT_FIELDS = ("user_message", "ai_response")
+SEARCH_PAYLOAD_FIELDS = [
+    "user_message", "user_message_z", "ai_response", "ai_response_z",
+    "model_used", "session_id", "timestamp", "turn_id"
+]
+HISTORY_PAYLOAD_FIELDS = [
+    "user_message", "user_message_z", "ai_response", "ai_response_z",
+    "model_used", "timestamp", "timestamp_ms"
+]
+
+# Découpage des tours longs : les chunks au-delà du premier sont des points
+# {"kind": "chunk", "turn_id": <id du tour>} ; la recherche demande
+# CHUNK_SEARCH_OVERSAMPLING fois plus de résultats (avec les seuls CHUNK_HIT_FIELDS)
+# pour pouvoir les regrouper par tour, double la demande tant que les chunks
+# masquent des tours, puis lit les payloads des tours retenus
+CHUNK_KIND = "chunk"
+CHUNK_SEARCH_OVERSAMPLING = 3
+CHUNK_HIT_FIELDS = ["turn_id", "kind"]
+
+# Point de résumé qui remplace les tours d'une session compactée
+SUMMARY_KIND = "summary"
+
+# Tours d'historique et conversations similaires inclus dans le contexte réflexif
+CONTEXT_HISTORY_TURNS = 3
+CONTEXT_SIMILAR_RESULTS = 3
+
+# Espace de noms des IDs de points (UUID v5 dérivés du contenu ou d'une clé d'idempotence)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c1a52-3e0b-5d8e-9b8a-0c6f8e5d2a41")
+
+def timestamp_to_ms(timestamp: Optional[str]) -> Optional[int]:
+    """Convertit un timestamp ISO en millisecondes depuis l'epoch"""
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return None
+
+def resolve_tenant(tenant_id: Optional[str], session_id: Optional[str],
+                   separator: Optional[str]) -> str:
+    """Tenant d'une requête : explicite, sinon préfixe de session_id ("<email>:..."), sinon DEFAULT_TENANT"""
+    if tenant_id:
+        return tenant_id
+    if separator and session_id and separator in session_id:
+        prefix = session_id.split(separator, 1)[0]
+        if prefix:
+            return prefix
+    return DEFAULT_TENANT
+
+def tenant_filter(tenant: Optional[str]) -> List[FieldCondition]:
+    """Conditions Qdrant limitant une requête à un tenant (aucune si tenant est None)"""
+    if tenant is None:
+        return []
+    return [FieldCondition(key=TENANT_FIELD, match=MatchValue(value=tenant))]
+
+def turn_point_id(metadata: Dict[str, Any]) -> str:
+    """ID déterministe d'un tour : clé d'idempotence si fournie, sinon session, modèle et contenu
+
+    Un même tour renvoyé (reprise n8n, double clic) retombe sur le même point.
+    Hors DEFAULT_TENANT, le tenant entre dans l'ID : deux tenants n'écrasent
+    jamais leurs points respectifs.
+
+    Le timestamp n'entre pas dans l'ID (il change à chaque reprise) : sans
+    clé d'idempotence, un échange identique répété dans une session (même
+    question, même réponse, même modèle) n'est stocké qu'une fois. Pour
+    garder chaque occurrence, passer une clé distincte par message (ID du
+    message OpenWebUI par exemple).
+    """
+    key = metadata.get("idempotency_key")
+    if key:
+        name = f"key\0{key}"
+    else:
+        name = "\0".join(("turn", metadata["session_id"], metadata["model_used"],
+                          metadata["user_message"], metadata["ai_response"]))
+    tenant = metadata.get(TENANT_FIELD, DEFAULT_TENANT)
+    if tenant != DEFAULT_TENANT:
+        name = f"{tenant}\0{name}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, name))
+
+def tenant_collection_name(collection_name: str, tenant: str) -> str:
+    """Nom de la collection dédiée d'un tenant (caractères sûrs et hash contre les collisions)"""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", tenant)[:48]
+    digest = hashlib.sha1(tenant.encode("utf-8")).hexdigest()[:8]
+    return f"{collection_name}__{slug}_{digest}"
+
+def chunk_point_id(turn_id: Any, index: int) -> str:
+    """ID déterministe du index-ième chunk d'un tour"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"chunk\0{turn_id}\0{index}"))
+
+def compress_text(text: str) -> str:
+    """Compresse un texte (zlib + base64) pour le stocker dans un payload JSON"""
+    return base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
+
+def payload_text(payload: Optional[Dict[str, Any]], key: str) -> str:
+    """Lit un champ texte d'un payload, compressé (clé "<key>_z") ou non"""
+    if not payload:
+        return ""
+    compressed = payload.get(f"{key}_z")
+    if compressed is not None:
+        return zlib.decompress(base64.b64decode(compressed)).decode("utf-8")
+    return payload.get(key, "")
+
+def combined_text(payload: Dict[str, Any]) -> str:
+    """Texte encodé pour un tour, reconstruit à partir du payload"""
+    return f"User: {payload_text(payload, 'user_message')}\nAI: {payload_text(payload, 'ai_response')}"
+
+def collapse_chunk_hits(hits: List[ScoredPoint], limit: int) -> "OrderedDict[Any, float]":
+    """Regroupe des résultats triés par score en un résultat par tour
+
+    Retourne {turn_id: meilleur score} pour au plus limit tours ; un chunk
+    compte pour le tour dont il porte l'ID.
+    """
+    best: "OrderedDict[Any, float]" = OrderedDict()
+    for hit in hits:
+        turn_id = (hit.payload or {}).get("turn_id", hit.id)
+        if turn_id in best:
+            continue
+        best[turn_id] = hit.score
+        if len(best) == limit:
+            break
+    return best
+
+def widened_search_limit(fetched: int, hits: int, turns: int, limit: int) -> Optional[int]:
+    """Taille de la recherche suivante, ou None si limit tours sont trouvés ou les résultats épuisés
+
+    Quand les chunks de quelques tours occupent la plupart des fetched
+    résultats, moins de limit tours distincts sont trouvés : la demande double.
+    """
+    if turns >= limit or hits < fetched:
+        return None
+    return fetched * 2
+
+def resolve_turn_hits(best: "OrderedDict[Any, float]", payloads: Dict[Any, Dict[str, Any]],
+                      ids_only: bool = False) -> List[ScoredPoint]:
+    """Résultats par tour, dans l'ordre des scores, avec le payload lu pour chaque tour"""
+    results = []
+    for turn_id, score in best.items():
+        payload = None
+        if not ids_only:
+            payload = payloads.get(turn_id)
+            if payload is None:
+                # Tour supprimé entre la recherche et la lecture des payloads
+                continue
+        results.append(ScoredPoint(id=turn_id, version=0, score=score, payload=payload))
+    return results
@@ -0,0 +1,245 @@
+"""
+Snapshots d'export / import en flux (vecteurs .npy, payloads NDJSON gzip)
+"""
+
+import gzip
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from qdrant_client.models import PointStruct
+import numpy as np
+import logging
+
+from .memory import OpenWebUIMemory
+from .schema import CHUNK_KIND, TENANT_FIELD, TEXT_FIELDS, chunk_point_id, payload_text, timestamp_to_ms
+from .streams import iter_ndjson
+
+logger = logging.getLogger(__name__)
+
+# Snapshot d'export : un répertoire avec manifest.json, les vecteurs en matrice
+# NumPy (.npy) et les payloads en NDJSON gzip ; la ligne i du NDJSON décrit la
+# ligne i de la matrice. L'en-tête .npy a une taille fixe pour être réécrit en
+# fin d'export, quand le nombre de lignes est connu.
+SNAPSHOT_FORMAT = "openwebui-memory-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MANIFEST = "manifest.json"
+SNAPSHOT_VECTORS = "vectors.npy"
+SNAPSHOT_PAYLOADS = "payloads.ndjson.gz"
+NPY_HEADER_BYTES = 128
+
+class ThroughputReport:
+    """Progression d'un transfert en flux (points, octets, débit), journalisée toutes les interval_s secondes"""
+
+    def __init__(self, label: str, total: Optional[int] = None, interval_s: float = 5.0):
+        self.label = label
+        self.total = total
+        self.interval_s = interval_s
+        self.points = 0
+        self.bytes = 0
+        self.start = self._last_log = time.perf_counter()
+
+    def _line(self, elapsed: float) -> str:
+        done = f"{self.points}/{self.total}" if self.total else str(self.points)
+        return (f"{self.label}: {done} points, {self.points / elapsed:.0f} points/s, "
+                f"{self.bytes / elapsed / 1e6:.1f} Mo/s")
+
+    def add(self, points: int, nbytes: int = 0):
+        self.points += points
+        self.bytes += nbytes
+        now = time.perf_counter()
+        if now - self._last_log >= self.interval_s:
+            self._last_log = now
+            logger.info(self._line(max(now - self.start, 1e-9)))
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        logger.info(self._line(elapsed))
+        return {
+            "points": self.points,
+            "bytes": self.bytes,
+            "duration_s": round(elapsed, 3),
+            "points_per_s": round(self.points / elapsed, 1),
+            "mb_per_s": round(self.bytes / elapsed / 1e6, 2)
+        }
+
+def _npy_header(rows: int, dim: int, dtype: np.dtype) -> bytes:
+    """En-tête .npy 1.0 de NPY_HEADER_BYTES octets pour une matrice rows x dim"""
+    header = repr({"descr": dtype.str, "fortran_order": False, "shape": (rows, dim)})
+    header = header.ljust(NPY_HEADER_BYTES - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1")
+
+def export_snapshot(memory: "OpenWebUIMemory", path: str, batch_size: int = 1024,
+                    vector_dtype: str = "float32", progress_interval_s: float = 5.0) -> Dict[str, Any]:
+    """Exporte la collection partagée et les collections dédiées dans le répertoire path
+
+    Les points sont lus par pages de batch_size et écrits au fil de l'eau : la
+    mémoire utilisée ne dépend pas de la taille de la collection. vector_dtype
+    "float16" divise la taille des vecteurs par deux. manifest.json est écrit
+    en dernier : un snapshot sans manifeste est incomplet.
+    """
+    if not memory._ensure_collection():
+        raise RuntimeError(memory.last_error)
+    dtype = np.dtype(vector_dtype).newbyteorder("<")
+    dim = memory.embedding_model.get_sentence_embedding_dimension()
+    backends = memory.all_backends()
+    progress = ThroughputReport("Export", sum(backend.count(exact=False) for backend in backends), progress_interval_s)
+    os.makedirs(path, exist_ok=True)
+    rows = 0
+    with open(os.path.join(path, SNAPSHOT_VECTORS), "wb") as vectors, \
+            gzip.open(os.path.join(path, SNAPSHOT_PAYLOADS), "wt", encoding="utf-8") as payloads:
+        vectors.write(_npy_header(0, dim, dtype))
+        for backend in backends:
+            offset = None
+            while True:
+                records, offset = backend.scan(offset, batch_size, with_vectors=True)
+                if records:
+                    matrix = np.asarray([record.vector for record in records], dtype=dtype)
+                    if matrix.shape[1] != dim:
+                        raise ValueError(f"{backend.collection_name}: dimension {matrix.shape[1]} != {dim}")
+                    vectors.write(matrix.tobytes())
+                    for record in records:
+                        payloads.write(json.dumps({"id": record.id, "payload": record.payload},
+                                                  ensure_ascii=False) + "\n")
+                    rows += len(records)
+                    progress.add(len(records), matrix.nbytes)
+                if offset is None:
+                    break
+        vectors.seek(0)
+        vectors.write(_npy_header(rows, dim, dtype))
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "model_name": memory.model_name,
+        "dim": dim,
+        "dtype": dtype.str,
+        "points": rows,
+        "collections": [backend.collection_name for backend in backends],
+        "vectors": SNAPSHOT_VECTORS,
+        "payloads": SNAPSHOT_PAYLOADS
+    }
+    manifest_path = os.path.join(path, SNAPSHOT_MANIFEST)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    report = progress.summary()
+    report["path"] = path
+    return report
+
+def read_snapshot_manifest(path: str) -> Dict[str, Any]:
+    """Manifeste d'un snapshot (ValueError si le répertoire n'en est pas un)"""
+    try:
+        with open(os.path.join(path, SNAPSHOT_MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"{path}: manifest.json absent (export incomplet ?)")
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version", 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"{path}: format de snapshot non reconnu")
+    return manifest
+
+def _reencoded_points(memory: "OpenWebUIMemory", turns: List[Tuple[Any, Dict[str, Any]]]) -> List[PointStruct]:
+    """Réencode des tours avec le modèle de la mémoire en gardant leurs IDs (chunks recalculés)"""
+    items = []
+    for _, payload in turns:
+        item = dict(payload)
+        for key in TEXT_FIELDS:
+            item[key] = payload_text(payload, key)
+            item.pop(f"{key}_z", None)
+        # Points antérieurs aux migrations backfill-timestamps / backfill-tenants
+        item.setdefault("session_id", "")
+        item.setdefault("model_used", "")
+        item.setdefault(TENANT_FIELD, memory.tenant(None, item["session_id"]))
+        item.setdefault("timestamp_ms", timestamp_to_ms(item.get("timestamp")) or 0)
+        items.append(item)
+    points = []
+    for (point_id, _), turn_points in zip(turns, memory._embed_turns(items)):
+        turn_points[0].id = point_id
+        for index, chunk in enumerate(turn_points[1:], start=1):
+            chunk.id = chunk_point_id(point_id, index)
+            chunk.payload["turn_id"] = point_id
+        points.extend(turn_points)
+    return points
+
+def import_snapshot(memory: "OpenWebUIMemory", path: str, batch_size: int = 512,
+                    parallelism: int = 4, reencode: Optional[bool] = None,
+                    progress_interval_s: float = 5.0) -> Dict[str, Any]:
+    """Importe un snapshot d'export_snapshot par upserts de batch_size points
+
+    La matrice est memory-mappée et le NDJSON décompressé ligne à ligne : la
+    mémoire reste bornée quelle que soit la taille du snapshot. Au plus
+    parallelism lots sont en vol. Chaque point garde son ID et rejoint la
+    collection de son tenant : relancer un import interrompu est sans risque.
+    
+    Avec reencode (par défaut : si le modèle du snapshot n'est pas celui de la
+    mémoire), les vecteurs stockés sont ignorés ; les tours sont réencodés par
+    lots et redécoupés en chunks, les anciens chunks sont écartés.
+    """
+    manifest = read_snapshot_manifest(path)
+    if not memory._ensure_collection():
+        raise RuntimeError(memory.last_error)
+    dim = memory.embedding_model.get_sentence_embedding_dimension()
+    if reencode is None:
+        reencode = manifest["model_name"] != memory.model_name or manifest["dim"] != dim
+    elif not reencode and manifest["dim"] != dim:
+        raise ValueError(f"Dimension du snapshot {manifest['dim']} != dimension du modèle {dim}: "
+                         f"réencodage nécessaire")
+    matrix = np.load(os.path.join(path, manifest["vectors"]), mmap_mode="r")
+    if matrix.shape != (manifest["points"], manifest["dim"]):
+        raise ValueError(f"{path}: matrice {matrix.shape} incohérente avec le manifeste")
+    if reencode:
+        logger.info(f"Réencodage {manifest['model_name']} -> {memory.model_name}")
+    progress = ThroughputReport("Import", manifest["points"], progress_interval_s)
+    skipped_chunks = 0
+    written = 0
+    in_flight: deque = deque()
+    
+    def drain(max_pending: int):
+        while len(in_flight) > max_pending:
+            in_flight.popleft().result()
+    
+    def flush(batch: List[Tuple[int, Dict[str, Any]]]):
+        nonlocal skipped_chunks, written
+        if reencode:
+            turns = [(entry["id"], entry["payload"]) for _, entry in batch
+                     if entry["payload"].get("kind") != CHUNK_KIND]
+            skipped_chunks += len(batch) - len(turns)
+            points = _reencoded_points(memory, turns) if turns else []
+        else:
+            # Les lignes d'un lot sont contiguës dans la matrice
+            vectors = np.asarray(matrix[batch[0][0]:batch[-1][0] + 1], dtype=np.float32)
+            points = [PointStruct(id=entry["id"], vector=vector.tolist(), payload=entry["payload"])
+                      for (_, entry), vector in zip(batch, vectors)]
+        groups: Dict[Optional[str], List[PointStruct]] = {}
+        for point in points:
+            tenant = point.payload.get(TENANT_FIELD) or memory.tenant(None, point.payload.get("session_id"))
+            groups.setdefault(tenant if tenant in memory.dedicated_tenants else None, []).append(point)
+        for tenant, group in groups.items():
+            in_flight.append(executor.submit(memory._upsert, group, False, None, tenant))
+            drain(parallelism)
+        written += len(points)
+        progress.add(len(batch), 4 * dim * len(points))
+    
+    rows = 0
+    with gzip.open(os.path.join(path, manifest["payloads"]), "rt", encoding="utf-8") as payloads, \
+            ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        batch: List[Tuple[int, Dict[str, Any]]] = []
+        for entry in iter_ndjson(payloads):
+            if isinstance(entry, Exception):
+                raise ValueError(f"{path}: ligne {rows + 1} illisible ({entry})")
+            batch.append((rows, entry))
+            rows += 1
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        drain(0)
+    if rows != manifest["points"]:
+        raise ValueError(f"{path}: {rows} payloads pour {manifest['points']} vecteurs")
+    report = progress.summary()
+    report.update(points_written=written, reencoded=reencode, chunks_skipped=skipped_chunks)
+    return report
@@ -0,0 +1,99 @@
+"""
+Lecture en flux des imports en masse (NDJSON et tableaux JSON)
+"""
+
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+# Lecture en flux des tableaux JSON : taille des lectures et d'un enregistrement (caractères)
+JSON_READ_CHUNK = 1 << 16
+MAX_JSON_RECORD_CHARS = 16 << 20
+
+def iter_ndjson(lines: Iterable[Any]) -> Iterator[Any]:
+    """Décode un flux NDJSON ligne par ligne
+
+    Les lignes invalides produisent une ValueError à la place de l'enregistrement
+    afin que l'appelant puisse la signaler avec l'index correspondant.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"JSON invalide: {e}")
+
+def iter_json_array(stream: Any, chunk_size: int = JSON_READ_CHUNK,
+                    max_record_chars: int = MAX_JSON_RECORD_CHARS) -> Iterator[Any]:
+    """Décode un tableau JSON élément par élément, sans le charger en entier
+
+    stream est un fichier texte ou binaire (UTF-8) lu par blocs de chunk_size.
+    Une entrée qui n'est pas un tableau lève ValueError à la première lecture.
+    Ensuite, comme pour iter_ndjson, une erreur produit une ValueError à la
+    place de l'enregistrement ; la lecture s'arrête alors, la suite du tableau
+    ne pouvant plus être délimitée.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def read_more() -> bool:
+        # Ajoute un bloc au tampon en oubliant ce qui précède position
+        nonlocal buffer, position, eof
+        if eof:
+            return False
+        data = stream.read(chunk_size)
+        if not data:
+            eof = True
+            return False
+        if isinstance(data, bytes):
+            data = utf8.decode(data)
+        buffer = buffer[position:] + data
+        position = 0
+        return True
+
+    def next_char() -> str:
+        # Premier caractère significatif à partir de position ("" en fin de flux)
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return ""
+
+    if next_char() != "[":
+        raise ValueError("JSON invalide: tableau attendu")
+    position += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                # Élément incomplet : lire la suite, dans la limite de max_record_chars
+                if len(buffer) - position <= max_record_chars and read_more():
+                    continue
+                yield ValueError(f"JSON invalide: {e}")
+                return
+            # Un nombre en fin de tampon peut se poursuivre dans le bloc suivant
+            if end < len(buffer) or not read_more():
+                break
+        position = end
+        yield value
+        separator = next_char()
+        if separator == "]":
+            return
+        if separator != ",":
+            yield ValueError("JSON invalide: ',' ou ']' attendu entre les éléments du tableau")
+            return
+        position += 1
@@ -0,0 +1,78 @@
+"""
+Fixtures communes : paquet openwebui_memory, service openwebui-memory.py et encodeur factice
+Les tests tournent sans serveur Qdrant (client embarqué) ni modèle d'embedding
+"""
+
+import hashlib
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import openwebui_memory as om  # noqa: E402
+
+
+def _load_service_module():
+    # Le nom du script contient un tiret : import par chemin
+    spec = importlib.util.spec_from_file_location(
+        "openwebui_memory_service", os.path.join(ROOT, "openwebui-memory.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+service = _load_service_module()
+
+
+class StubEncoder(om.Encoder):
+    """Encodeur déterministe : un vecteur pseudo-aléatoire par texte, sans modèle"""
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, texts, batch_size=None, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if not batch:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        vectors = np.stack([self._vector(text) for text in batch])
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+
+@pytest.fixture
+def encoder() -> StubEncoder:
+    return StubEncoder()
+
+
+@pytest.fixture(params=["qdrant", "local"])
+def backend_factory(request, tmp_path):
+    """Fabrique de backends vides (Qdrant embarqué ou stockage local), fermés en fin de test"""
+    created = []
+
+    def make(name: str = "main"):
+        if request.param == "qdrant":
+            backend = om.QdrantBackend(":memory:")
+        else:
+            backend = om.LocalMemoryBackend(str(tmp_path / name))
+        created.append(backend)
+        return backend
+
+    make.kind = request.param
+    yield make
+    for backend in created:
+        backend.close()
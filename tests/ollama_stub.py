@@ -0,0 +1,187 @@
+"""
+Serveur Ollama factice pour tester le préchargement de configure-models.py sans modèle ni GPU
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Union
+
+
+def keep_alive_seconds(value: Union[str, int, float]) -> Optional[float]:
+    """Durée keep_alive en secondes, None si le modèle reste résident indéfiniment"""
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        text = value.strip()
+        if re.fullmatch(r"-?\d+(\.\d+)?", text):
+            seconds = float(text)
+        elif re.fullmatch(r"-?(\d+(\.\d+)?(ms|s|m|h))+", text):
+            units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+            seconds = sum(float(number) * units[unit]
+                          for number, _, unit in re.findall(r"(\d+(\.\d+)?)(ms|s|m|h)", text))
+            seconds = -seconds if text.startswith("-") else seconds
+        else:
+            raise ValueError(f"keep_alive invalide: {value}")
+    return None if seconds < 0 else seconds
+
+
+class StubOllamaServer:
+    """Serveur Ollama factice pour tester le préchargement sans modèle ni GPU
+
+    Implémente /api/version, /api/tags, /api/ps et /api/generate : le chargement est simulé
+    par une attente de load_delay, les modèles expirent selon keep_alive et le moins récemment
+    utilisé est évincé quand capacity_bytes est dépassée. Le serveur répond 503 pendant
+    ready_after secondes pour exercer l'attente avec backoff.
+    """
+
+    DEFAULT_MODELS = {
+        "llama2:latest": 3_826_793_677,
+        "phi3:latest": 2_176_178_913,
+        "gemma2:latest": 5_443_152_417,
+    }
+
+    def __init__(self, models: Optional[Dict[str, int]] = None, load_delay: float = 0.5,
+                 capacity_bytes: Optional[int] = None, ready_after: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.models = dict(models or self.DEFAULT_MODELS)
+        self.load_delay = load_delay
+        self.capacity_bytes = capacity_bytes
+        self.ready_after = ready_after
+        # nom -> échéance monotone (None = résident indéfiniment), dans l'ordre LRU
+        self.loaded: "OrderedDict[str, Optional[float]]" = OrderedDict()
+        self.loads: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllamaServer":
+        self.started_at = time.monotonic()
+        # Arrêt rapide en fin de test
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05},
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _expire(self):
+        now = time.monotonic()
+        for name, deadline in list(self.loaded.items()):
+            if deadline is not None and deadline <= now:
+                del self.loaded[name]
+
+    def _make_room(self, name: str):
+        if self.capacity_bytes is None:
+            return
+        while self.loaded and sum(self.models[n] for n in self.loaded) + self.models[name] > self.capacity_bytes:
+            self.loaded.popitem(last=False)
+
+    def generate(self, body: Dict[str, Any]):
+        name = body.get("model")
+        if name not in self.models:
+            return 404, {"error": f"model '{name}' not found"}
+        keep_alive = keep_alive_seconds(body.get("keep_alive", "5m"))
+        with self.lock:
+            self._expire()
+            if keep_alive == 0:
+                self.loaded.pop(name, None)
+                return 200, {"model": name, "response": "", "done": True, "done_reason": "unload"}
+            resident = name in self.loaded
+        load_s = 0.0
+        if not resident:
+            time.sleep(self.load_delay)
+            load_s = self.load_delay
+        with self.lock:
+            if name not in self.loaded:
+                self._make_room(name)
+                self.loads[name] = self.loads.get(name, 0) + 1
+            self.loaded[name] = None if keep_alive is None else time.monotonic() + keep_alive
+            self.loaded.move_to_end(name)
+        prompt = body.get("prompt", "")
+        return 200, {
+            "model": name,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": "ok" if prompt else "",
+            "done": True,
+            "done_reason": "stop" if prompt else "load",
+            "load_duration": int(load_s * 1e9),
+            "total_duration": int(load_s * 1e9),
+        }
+
+    def ps(self) -> Dict[str, Any]:
+        with self.lock:
+            self._expire()
+            now = time.monotonic()
+            models = []
+            for name, deadline in self.loaded.items():
+                remaining = timedelta(days=100 * 365) if deadline is None else timedelta(seconds=deadline - now)
+                models.append({
+                    "name": name, "model": name, "size": self.models[name],
+                    "expires_at": (datetime.now(timezone.utc) + remaining).isoformat(),
+                })
+        return {"models": models}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _starting(self) -> bool:
+                if time.monotonic() - stub.started_at < stub.ready_after:
+                    self._reply(503, {"error": "starting"})
+                    return True
+                return False
+
+            def do_GET(self):
+                if self._starting():
+                    return
+                if self.path == "/api/version":
+                    self._reply(200, {"version": "0.0.0-stub"})
+                elif self.path == "/api/tags":
+                    self._reply(200, {"models": [{"name": name, "model": name, "size": size}
+                                                 for name, size in stub.models.items()]})
+                elif self.path == "/api/ps":
+                    self._reply(200, stub.ps())
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self._starting():
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/generate":
+                    self._reply(*stub.generate(body))
+                else:
+                    self._reply(404, {"error": "not found"})
+
+        return Handler
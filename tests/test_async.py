@@ -0,0 +1,51 @@
+"""
+Mode ASGI : sauvegardes regroupées par le batcher sans bloquer le pool d'encodage
+"""
+
+import asyncio
+import threading
+
+from conftest import StubEncoder, om
+
+
+class RecordingEncoder(StubEncoder):
+    """Encodeur factice qui note la taille de chaque appel"""
+
+    def __init__(self, dim: int = 32):
+        super().__init__(dim)
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def encode(self, texts, batch_size=None, **kwargs):
+        if not isinstance(texts, str):
+            with self.lock:
+                self.batch_sizes.append(len(texts))
+        return super().encode(texts, batch_size, **kwargs)
+
+
+def test_batched_saves_do_not_hold_encode_workers(tmp_path):
+    encoder = RecordingEncoder()
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=encoder,
+                                batching=True, batch_max_size=64, batch_max_wait_ms=200)
+    async_memory = om.AsyncOpenWebUIMemory(memory, encode_workers=1)
+
+    async def scenario():
+        saves = [asyncio.ensure_future(async_memory.save_conversation(f"question {index}", "réponse",
+                                                                      session_id="s"))
+                 for index in range(20)]
+        # Pendant que les sauvegardes attendent leur lot, une recherche obtient le thread d'encodage
+        await asyncio.sleep(0.05)
+        search = await asyncio.wait_for(async_memory.search_similar_conversations("question 1", 3), 0.15)
+        results = await asyncio.gather(*saves)
+        await async_memory.close()
+        return search, results
+
+    try:
+        search, results = asyncio.run(scenario())
+        assert all(results)
+        assert isinstance(search, list)
+        assert max(encoder.batch_sizes) > 1
+        assert sum(encoder.batch_sizes) == 20
+        assert memory.backend.count() == 20
+    finally:
+        memory.close()
@@ -0,0 +1,212 @@
+"""
+Comportement commun à QdrantBackend et LocalMemoryBackend
+Chaque test tourne sur les deux backends (fixture backend_factory)
+"""
+
+import uuid
+
+import numpy as np
+import pytest
+from qdrant_client.models import PointStruct
+
+from conftest import StubEncoder, om
+
+DIM = 32
+ENCODER = StubEncoder(DIM)
+
+
+def point_id(name: str) -> str:
+    return str(uuid.uuid5(om.POINT_ID_NAMESPACE, name))
+
+
+def make_point(name: str, session_id: str = "s1", tenant: str = om.DEFAULT_TENANT,
+               timestamp_ms: int = 1_000, **extra) -> PointStruct:
+    payload = {
+        om.TENANT_FIELD: tenant,
+        "user_message": f"question {name}",
+        "ai_response": f"réponse {name}",
+        "model_used": "phi3",
+        "session_id": session_id,
+        "timestamp": f"ts-{timestamp_ms}",
+        "timestamp_ms": timestamp_ms,
+    }
+    payload.update(extra)
+    return PointStruct(id=point_id(name), vector=ENCODER.encode(name).tolist(), payload=payload)
+
+
+@pytest.fixture
+def backend(backend_factory):
+    backend = backend_factory()
+    backend.ensure_collection(DIM)
+    return backend
+
+
+def test_upsert_search_retrieve(backend):
+    backend.upsert([make_point(name) for name in ("a", "b", "c")])
+    assert backend.count() == 3
+    assert backend.count(exact=False) == 3
+
+    hits = backend.search(ENCODER.encode("b").tolist(), limit=2)
+    assert [hit.id for hit in hits][0] == point_id("b")
+    assert hits[0].score == pytest.approx(1.0, abs=1e-4)
+    assert len(hits) == 2
+    assert hits[0].payload["user_message"] == "question b"
+
+    records = backend.retrieve([point_id("a"), point_id("inconnu")])
+    assert [record.id for record in records] == [point_id("a")]
+    assert records[0].payload["ai_response"] == "réponse a"
+    assert backend.existing_ids([point_id("c"), point_id("inconnu")]) == {point_id("c")}
+
+
+def test_upsert_replaces_existing_point(backend):
+    backend.upsert([make_point("a")])
+    backend.upsert([make_point("a", session_id="s2")])
+    assert backend.count() == 1
+    assert backend.retrieve([point_id("a")])[0].payload["session_id"] == "s2"
+
+
+def test_search_score_threshold_and_limit(backend):
+    backend.upsert([make_point(name) for name in ("a", "b", "c", "d")])
+    hits = backend.search(ENCODER.encode("a").tolist(), limit=10, score_threshold=0.9)
+    assert [hit.id for hit in hits] == [point_id("a")]
+    assert len(backend.search(ENCODER.encode("a").tolist(), limit=10)) == 4
+    scores = [hit.score for hit in backend.search(ENCODER.encode("a").tolist(), limit=10)]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_session_history_order_and_limit(backend):
+    timestamps = [5_000, 1_000, 4_000, 2_000, 3_000]
+    backend.upsert([make_point(f"t{ts}", timestamp_ms=ts) for ts in timestamps])
+    # Un chunk et une autre session ne font pas partie de l'historique
+    backend.upsert([
+        make_point("chunk", timestamp_ms=9_000, kind=om.CHUNK_KIND, turn_id=point_id("t5000")),
+        make_point("ailleurs", session_id="s2", timestamp_ms=8_000),
+    ])
+
+    history = backend.session_history("s1", limit=3)
+    assert [record.payload["timestamp_ms"] for record in history] == [5_000, 4_000, 3_000]
+    assert len(backend.session_history("s1", limit=10)) == 5
+    assert backend.session_history("inconnue", limit=3) == []
+
+
+def test_tenant_filtering(backend):
+    backend.upsert([
+        make_point("alice-1", session_id="alice:s", tenant="alice"),
+        make_point("alice-2", session_id="alice:s", tenant="alice", timestamp_ms=2_000),
+        make_point("bob-1", session_id="alice:s", tenant="bob"),
+    ])
+    query = ENCODER.encode("bob-1").tolist()
+
+    alice = backend.search(query, limit=10, tenant="alice")
+    assert {hit.id for hit in alice} == {point_id("alice-1"), point_id("alice-2")}
+    assert [hit.id for hit in backend.search(query, limit=10, tenant="bob")] == [point_id("bob-1")]
+    assert backend.search(query, limit=10, tenant="personne") == []
+    assert len(backend.search(query, limit=10)) == 3
+
+    assert len(backend.session_history("alice:s", limit=10, tenant="alice")) == 2
+    assert len(backend.session_history("alice:s", limit=10, tenant="bob")) == 1
+
+
+def test_delete_and_row_reuse(backend_factory):
+    backend = backend_factory()
+    backend.ensure_collection(DIM)
+    backend.upsert([make_point(name) for name in ("a", "b", "c")])
+
+    backend.delete([point_id("b")])
+    assert backend.count() == 2
+    assert backend.retrieve([point_id("b")]) == []
+    hits = backend.search(ENCODER.encode("b").tolist(), limit=10)
+    assert point_id("b") not in {hit.id for hit in hits}
+    assert len(hits) == 2
+
+    if backend_factory.kind == "local":
+        freed_row = backend._free[-1]
+        backend.upsert([make_point("d")])
+        assert backend._row_by_id[point_id("d")] == freed_row
+        assert not backend._free
+    else:
+        backend.upsert([make_point("d")])
+    assert backend.count() == 3
+    assert backend.search(ENCODER.encode("d").tolist(), limit=1)[0].id == point_id("d")
+
+
+def test_scan_paging(backend):
+    names = [f"p{index}" for index in range(10)]
+    backend.upsert([make_point(name, timestamp_ms=1_000 * (index + 1)) for index, name in enumerate(names)])
+
+    seen = []
+    offset = None
+    pages = 0
+    while True:
+        records, offset = backend.scan(offset, limit=3)
+        assert len(records) <= 3
+        seen.extend(record.id for record in records)
+        pages += 1
+        if offset is None:
+            break
+    assert sorted(seen) == sorted(point_id(name) for name in names)
+    assert pages >= 4
+
+    old, _ = backend.scan(None, limit=100, before_ms=4_000)
+    assert {record.id for record in old} == {point_id(name) for name in names[:3]}
+
+    with_vectors, _ = backend.scan(None, limit=1, with_vectors=True, with_payload=False)
+    assert len(with_vectors[0].vector) == DIM
+    assert not with_vectors[0].payload
+
+
+def test_scan_is_stable_under_deletes(backend):
+    backend.upsert([make_point(f"p{index}") for index in range(6)])
+    seen = []
+    offset = None
+    while True:
+        records, offset = backend.scan(offset, limit=2)
+        seen.extend(record.id for record in records)
+        backend.delete([record.id for record in records])
+        if offset is None:
+            break
+    assert len(seen) == 6
+    assert backend.count() == 0
+
+
+def test_scan_one_session(backend):
+    chunk = make_point("p0-chunk", session_id="s2", kind=om.CHUNK_KIND, turn_id=point_id("p0"))
+    backend.upsert([make_point(f"p{index}", session_id="s1" if index % 2 else "s2") for index in range(8)]
+                   + [chunk])
+    seen = []
+    offset = None
+    while True:
+        records, offset = backend.scan(offset, limit=2, session_id="s2")
+        assert len(records) <= 2
+        seen.extend(record.id for record in records)
+        backend.delete([record.id for record in records])
+        if offset is None:
+            break
+    # Chunks compris, et stable sous suppression
+    assert sorted(seen) == sorted([point_id(f"p{index}") for index in range(0, 8, 2)] + [chunk.id])
+    assert backend.count() == 4
+    assert backend.session_history("s2", 10) == []
+
+
+def test_vacuum_keeps_live_points(backend_factory):
+    backend = backend_factory("vacuum")
+    backend.ensure_collection(DIM)
+    backend.upsert([make_point(f"p{index}") for index in range(8)])
+    backend.upsert([make_point("p0", session_id="s2")])
+    backend.delete([point_id(f"p{index}") for index in range(1, 5)])
+
+    reclaimed = backend.vacuum()
+    if backend_factory.kind == "local":
+        assert reclaimed > 0
+        backend.close()
+        # Le journal compacté suffit à reconstruire les index
+        backend = backend_factory("vacuum")
+        backend.ensure_collection(DIM)
+    else:
+        assert reclaimed == 0
+
+    assert backend.count() == 4
+    assert backend.retrieve([point_id("p0")])[0].payload["session_id"] == "s2"
+    hits = backend.search(ENCODER.encode("p7").tolist(), limit=1)
+    assert hits[0].id == point_id("p7")
+    assert np.isclose(hits[0].score, 1.0, atol=1e-4)
@@ -0,0 +1,112 @@
+"""
+Micro-batching des sauvegardes : regroupement des appels concurrents et propagation des erreurs
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import StubEncoder, om
+
+
+class RecordingEncoder(StubEncoder):
+    """Encodeur factice qui note chaque lot et peut échouer à la demande"""
+
+    def __init__(self, dim: int = 32):
+        super().__init__(dim)
+        self.batches = []
+        self.error = None
+        self.lock = threading.Lock()
+
+    def encode(self, texts, batch_size=None, **kwargs):
+        if not isinstance(texts, str):
+            with self.lock:
+                self.batches.append(len(texts))
+            if self.error is not None:
+                raise self.error
+        return super().encode(texts, batch_size, **kwargs)
+
+
+def submit_all(batcher, items):
+    barrier = threading.Barrier(len(items))
+
+    def submit(item):
+        barrier.wait()
+        return batcher.submit(item)
+
+    with ThreadPoolExecutor(max_workers=len(items)) as executor:
+        return list(executor.map(submit, items))
+
+
+def test_concurrent_submits_share_one_flush():
+    calls = []
+    batcher = om.EmbeddingBatcher(lambda items: calls.append(list(items)) or [item * 2 for item in items],
+                                  max_batch_size=8, max_wait_ms=1000)
+    try:
+        futures = submit_all(batcher, list(range(8)))
+        assert sorted(future.result(5) for future in futures) == [item * 2 for item in range(8)]
+        assert len(calls) == 1 and sorted(calls[0]) == list(range(8))
+    finally:
+        batcher.close()
+
+
+def failing_flush(items):
+    raise ValueError("encodeur indisponible")
+
+
+def short_flush(items):
+    # Un résultat manquant : aucun appelant ne doit rester bloqué
+    return [True] * (len(items) - 1)
+
+
+@pytest.mark.parametrize("flush_fn, error", [(failing_flush, ValueError), (short_flush, RuntimeError)])
+def test_batch_errors_reach_every_caller(flush_fn, error):
+    batcher = om.EmbeddingBatcher(flush_fn, max_batch_size=4, max_wait_ms=1000)
+    try:
+        futures = submit_all(batcher, list(range(4)))
+        for future in futures:
+            with pytest.raises(error):
+                future.result(5)
+    finally:
+        batcher.close()
+
+
+@pytest.fixture
+def batched_memory(tmp_path):
+    encoder = RecordingEncoder()
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=encoder,
+                                batching=True, batch_max_size=8, batch_max_wait_ms=1000)
+    yield memory, encoder
+    memory.close()
+
+
+def save_concurrently(memory, prefix: str, count: int):
+    barrier = threading.Barrier(count)
+
+    def save(index):
+        barrier.wait()
+        return memory.save_conversation(f"{prefix} {index}", "réponse", session_id="s")
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(save, range(count)))
+
+
+def test_batched_save_conversation_encodes_once(batched_memory):
+    memory, encoder = batched_memory
+    assert save_concurrently(memory, "question", 8) == [True] * 8
+    assert encoder.batches == [8]
+    assert memory.backend.count() == 8
+
+
+def test_batched_save_conversation_reports_encode_errors(batched_memory):
+    memory, encoder = batched_memory
+    encoder.error = RuntimeError("modèle indisponible")
+    assert save_concurrently(memory, "perdue", 8) == [False] * 8
+    assert encoder.batches == [8]
+    assert memory.backend.count() == 0
+
+    # Le batcher reste utilisable après un lot en erreur
+    encoder.error = None
+    assert save_concurrently(memory, "question", 4) == [True] * 4
+    assert memory.backend.count() == 4
@@ -0,0 +1,183 @@
+"""
+configure-models.py : attente d'OpenWebUI (par nombre de tentatives ou par échéance),
+lecture des réglages OLLAMA_* et préchargement contre un serveur Ollama factice
+"""
+
+import importlib.util
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import ROOT
+from ollama_stub import StubOllamaServer
+
+
+def _load_configure_models():
+    spec = importlib.util.spec_from_file_location("configure_models", os.path.join(ROOT, "configure-models.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+cm = _load_configure_models()
+
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def openwebui():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200 if self.path == "/api/version" else 404)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_wait_for_service_ready(openwebui):
+    configurator = cm.OpenWebUIConfigurator(openwebui)
+    assert configurator.wait_for_service()
+    assert configurator.wait_for_service(5)
+    assert configurator.wait_for_service(max_retries=5, timeout=1.0)
+
+
+def test_wait_for_service_max_retries_is_still_accepted(monkeypatch, capsys):
+    monkeypatch.setattr(cm.time, "sleep", lambda seconds: None)
+    configurator = cm.OpenWebUIConfigurator(closed_port_url())
+    assert configurator.wait_for_service(max_retries=3) is False
+    assert "après 3 tentatives" in capsys.readouterr().out
+    assert configurator.wait_for_service(2) is False
+    assert "après 2 tentatives" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("-1", -1),
+    (" 300 ", 300),
+    ("0", 0),
+    (-1, -1),
+    ("30m", "30m"),
+    ("1h30m", "1h30m"),
+    (" 24h ", "24h"),
+    # Ni entier ni durée : transmis tel quel, Ollama tranchera
+    ("1.5", "1.5"),
+    ("-5m", "-5m"),
+])
+def test_parse_keep_alive(value, expected):
+    parsed = cm.parse_keep_alive(value)
+    assert parsed == expected and type(parsed) is type(expected)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, {}),
+    ("", {}),
+    ("phi3=120,llama2=40", {"phi3": 120.0, "llama2": 40.0}),
+    (" phi3 = 2.5 , gemma2=0 ", {"phi3": 2.5, "gemma2": 0.0}),
+    # Entrées sans « = » ignorées, la dernière occurrence l'emporte
+    ("phi3,llama2=1,,", {"llama2": 1.0}),
+    ("phi3=1,phi3=3", {"phi3": 3.0}),
+])
+def test_parse_usage(value, expected):
+    assert cm.parse_usage(value) == expected
+
+
+def test_parse_usage_rejects_invalid_count():
+    with pytest.raises(ValueError):
+        cm.parse_usage("phi3=beaucoup")
+
+
+GIB = cm.GIB
+MODELS = {"llama2:latest": 4 * GIB, "phi3:3.8b": 2 * GIB, "phi3:14b": 8 * GIB, "gemma2:latest": 3 * GIB}
+
+
+@pytest.fixture
+def ollama():
+    with StubOllamaServer(MODELS, load_delay=0.01) as stub:
+        yield stub
+
+
+def preloader(stub, **kwargs) -> "cm.OllamaPreloader":
+    return cm.OllamaPreloader(stub.url, **dict({"memory_overhead": 1.0}, **kwargs))
+
+
+def actions(plan):
+    return {entry["model"]: (entry["action"], entry["resolved"]) for entry in plan}
+
+
+def test_plan_ranks_by_usage_and_pins_first(ollama):
+    plan = preloader(ollama, pin_count=1, usage={"gemma2": 10, "phi3": 5}).plan(["llama2", "phi3", "gemma2"])
+    assert [entry["model"] for entry in plan] == ["gemma2", "phi3", "llama2"]
+    # « phi3 » sans tag ni :latest : premier tag par ordre alphabétique
+    assert actions(plan) == {"gemma2": ("pin", "gemma2:latest"), "phi3": ("warm", "phi3:14b"),
+                             "llama2": ("warm", "llama2:latest")}
+    assert plan[0]["keep_alive"] == -1 and plan[1]["keep_alive"] == "30m"
+    assert plan[1]["estimate"] == 8 * GIB
+
+
+def test_plan_skips_missing_duplicates_and_over_budget(ollama):
+    plan = preloader(ollama, pin_count=0, memory_budget_bytes=9 * GIB, memory_overhead=1.5).plan(
+        ["llama2", "mistral", "llama2:latest", "gemma2", "phi3:3.8b", "phi3:7b"])
+    reasons = {entry["model"]: entry["reason"] for entry in plan if entry["action"] == "skip"}
+    assert reasons == {"mistral": "absent d'Ollama", "llama2:latest": "doublon",
+                       "gemma2": "hors budget mémoire", "phi3:7b": "absent d'Ollama"}
+    # 6 Gio réservés pour llama2 : gemma2 (4,5) dépasse, phi3:3.8b (3) tient encore
+    assert actions(plan)["llama2"] == ("warm", "llama2:latest")
+    assert actions(plan)["phi3:3.8b"] == ("warm", "phi3:3.8b")
+
+
+def test_preload_loads_each_model_once(ollama):
+    plan = preloader(ollama, pin_count=1).preload(["phi3:3.8b", "gemma2"])
+    assert [(entry["action"], entry["resolved"]) for entry in plan] == [("pin", "phi3:3.8b"),
+                                                                         ("warm", "gemma2:latest")]
+    # La vérification retrouve les modèles résidents : aucun second chargement
+    assert ollama.loads == {"phi3:3.8b": 1, "gemma2:latest": 1}
+    assert all(entry["probe_load_s"] == 0 for entry in plan)
+
+
+def test_enforce_budget_unloads_least_used_warm_models(ollama):
+    # Estimation trop optimiste : tout tient sur le papier, pas en mémoire réelle
+    loader = preloader(ollama, pin_count=1, memory_budget_bytes=6 * GIB, memory_overhead=0.5,
+                       usage={"llama2": 30, "gemma2": 20, "phi3": 10})
+    plan = loader.preload(["llama2", "gemma2", "phi3:3.8b"])
+    assert [entry["action"] for entry in plan] == ["pin", "skip", "skip"]
+    assert all(entry["reason"].startswith("déchargé") for entry in plan[1:])
+    assert list(ollama.loaded) == ["llama2:latest"]
+
+
+def test_enforce_budget_never_unloads_pinned_models(ollama):
+    loader = preloader(ollama, pin_count=2, memory_budget_bytes=5 * GIB, memory_overhead=0.5,
+                       usage={"llama2": 30, "gemma2": 20, "phi3": 10})
+    plan = loader.preload(["llama2", "gemma2", "phi3:3.8b"])
+    assert [entry["action"] for entry in plan] == ["pin", "pin", "skip"]
+    assert set(ollama.loaded) == {"llama2:latest", "gemma2:latest"}
+
+
+def test_enforce_budget_without_budget_or_ps(ollama, capsys):
+    plan = [{"model": "llama2", "resolved": "llama2:latest", "action": "warm"}]
+    preloader(ollama).enforce_budget(plan)
+    assert capsys.readouterr().out == ""
+
+    loader = cm.OllamaPreloader(closed_port_url(), memory_budget_bytes=GIB)
+    loader.enforce_budget(plan)
+    assert "budget non vérifié" in capsys.readouterr().out
+    assert plan[0]["action"] == "warm"
+
+
+def test_wait_until_ready_retries_while_ollama_starts():
+    with StubOllamaServer(MODELS, ready_after=0.3) as stub:
+        assert cm.wait_until_ready("Ollama", f"{stub.url}/api/version", timeout=5, initial_delay=0.05)
+        assert not cm.wait_until_ready("Ollama", f"{stub.url}/api/inconnu", timeout=0.3, initial_delay=0.05)
@@ -0,0 +1,93 @@
+"""
+Contexte réflexif : pool arrêté par close() et budget de tokens (max_tokens)
+"""
+
+import threading
+import time
+
+import pytest
+
+from conftest import StubEncoder, om
+
+
+def context_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("context")]
+
+
+def test_close_shuts_down_context_executor(tmp_path):
+    before = set(context_threads())
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=StubEncoder())
+    memory.save_conversation("bonjour", "salut", session_id="s")
+    assert "bonjour" in memory.create_reflective_context("bonjour", session_id="s")
+    assert set(context_threads()) - before
+
+    memory.close()
+    with pytest.raises(RuntimeError):
+        memory._context_executor.submit(time.sleep, 0)
+    deadline = time.monotonic() + 5
+    while set(context_threads()) - before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not set(context_threads()) - before
+
+
+def turn(name: str, words: int = 10):
+    return {"user_message": f"question {name}", "ai_response": " ".join([name] * words)}
+
+
+@pytest.fixture
+def memory(tmp_path):
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=StubEncoder())
+    yield memory
+    memory.close()
+
+
+def words(text: str) -> int:
+    # Sans tokenizer, un token est un mot
+    return len(text.split())
+
+
+@pytest.mark.parametrize("max_tokens", [20, 35, 50, 80, 1000])
+def test_fit_budget_respects_max_tokens(memory, max_tokens):
+    history = [turn(f"h{index}") for index in range(3)]
+    similar = [turn(f"s{index}") for index in range(3)]
+    fitted_history, fitted_similar = memory._fit_budget("quelle est la suite", history, similar, max_tokens)
+    context = memory._render_context("quelle est la suite", fitted_history, fitted_similar)
+    assert words(context) <= max_tokens
+    if max_tokens == 1000:
+        assert (fitted_history, fitted_similar) == (history, similar)
+
+
+def test_fit_budget_prefers_recent_history(memory):
+    history = [turn("ancien"), turn("milieu"), turn("récent")]
+    similar = [turn("proche"), turn("lointain")]
+    fixed = words(memory._render_context("la suite", [{"user_message": "", "ai_response": ""}],
+                                         [{"user_message": "", "ai_response": ""}]))
+    per_turn = words("User: question récent\nAI: " + " ".join(["récent"] * 10))
+    # Place pour deux tours entiers : les plus récents de l'historique, aucune conversation similaire
+    fitted_history, fitted_similar = memory._fit_budget("la suite", history, similar, fixed + 2 * per_turn)
+    assert fitted_history == [turn("milieu"), turn("récent")]
+    assert fitted_similar == []
+
+    # Un tour et demi : le second est tronqué (réponse d'abord), dans l'ordre chronologique
+    fitted_history, _ = memory._fit_budget("la suite", history, similar, fixed + per_turn + 6)
+    assert fitted_history[1] == turn("récent")
+    assert fitted_history[0]["user_message"] == "question milieu"
+    assert fitted_history[0]["ai_response"].startswith("milieu")
+    assert fitted_history[0]["ai_response"].endswith("…")
+    assert words(fitted_history[0]["ai_response"]) == 6 - 4
+
+    # Historique entier : les conversations similaires suivent, par score décroissant
+    fitted_history, fitted_similar = memory._fit_budget("la suite", history, similar, fixed + 4 * per_turn)
+    assert fitted_history == history and fitted_similar == [turn("proche")]
+
+
+def test_fit_budget_smaller_than_query(memory):
+    query = " ".join(["mot"] * 50)
+    history, similar = [turn("h")], [turn("s")]
+    assert memory._fit_budget(query, history, similar, 10) == ([], [])
+
+    memory.save_conversation("question h", "h " * 10, session_id="s")
+    context = memory.create_reflective_context(query, session_id="s", max_tokens=10)
+    # La question courante reste entière, sans historique ni conversation similaire
+    assert context.endswith(f"User: {query}")
+    assert "question h" not in context
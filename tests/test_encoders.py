@@ -0,0 +1,60 @@
+"""
+Taille de lot laissée aux encodeurs et cache des modèles ONNX quantifiés
+"""
+
+import os
+
+import pytest
+
+from conftest import StubEncoder, om
+
+
+class KwargsEncoder(StubEncoder):
+    """Encodeur factice qui note les arguments de chaque appel"""
+
+    def __init__(self, dim: int = 32):
+        super().__init__(dim)
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        if not isinstance(texts, str):
+            self.calls.append(kwargs)
+        return super().encode(texts, **kwargs)
+
+
+def test_turns_are_encoded_with_the_encoder_batch_size(tmp_path):
+    encoder = KwargsEncoder()
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=encoder)
+    try:
+        assert memory.save_conversation("bonjour", "salut", session_id="s")
+        records = [{"user_message": f"question {index}", "ai_response": "réponse", "session_id": "s"}
+                   for index in range(10)]
+        assert memory.save_conversations(records, batch_size=4, parallelism=1)["saved"] == 10
+        assert encoder.calls and all("batch_size" not in kwargs for kwargs in encoder.calls)
+    finally:
+        memory.close()
+
+
+def test_quantized_cache_depends_on_model_path(tmp_path, monkeypatch):
+    quantization = pytest.importorskip("onnxruntime.quantization")
+
+    def fake_quantize(source, target, **kwargs):
+        with open(source, "rb") as f, open(target, "wb") as out:
+            out.write(f.read())
+
+    monkeypatch.setattr(quantization, "quantize_dynamic", fake_quantize)
+    cache = str(tmp_path / "cache")
+    paths = []
+    for name in ("a", "b"):
+        model_path = tmp_path / name
+        model_path.mkdir()
+        (model_path / "model.onnx").write_bytes(name.encode())
+        paths.append(om.OnnxEncoder._quantized(str(model_path / "model.onnx"), "local/model",
+                                               cache, str(model_path)))
+
+    assert paths[0] != paths[1]
+    assert [open(path, "rb").read() for path in paths] == [b"a", b"b"]
+    assert all(os.path.basename(path).startswith("local--model-") for path in paths)
+    # Même source : le modèle en cache est réutilisé
+    assert om.OnnxEncoder._quantized(str(tmp_path / "a" / "model.onnx"), "local/model",
+                                     cache, str(tmp_path / "a")) == paths[0]
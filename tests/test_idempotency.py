@@ -0,0 +1,114 @@
+"""
+Idempotence des sauvegardes : IDs déterministes, doublons à l'import et sauvegardes concurrentes d'un même tour
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import StubEncoder, om
+
+
+class CountingEncoder(StubEncoder):
+    """Encodeur factice lent qui compte les textes encodés pour les tours"""
+
+    def __init__(self, dim: int = 32):
+        super().__init__(dim)
+        self.encoded = 0
+        self.lock = threading.Lock()
+
+    def encode(self, texts, batch_size=None, **kwargs):
+        if not isinstance(texts, str):
+            with self.lock:
+                self.encoded += len(texts)
+            time.sleep(0.05)
+        return super().encode(texts, batch_size, **kwargs)
+
+
+def metadata(**overrides):
+    base = {om.TENANT_FIELD: om.DEFAULT_TENANT, "session_id": "s", "model_used": "phi3",
+            "user_message": "bonjour", "ai_response": "salut", "timestamp": "2024-05-01T12:00:00"}
+    base.update(overrides)
+    return base
+
+
+def test_turn_point_id():
+    reference = om.turn_point_id(metadata())
+    # Une reprise arrive avec un autre timestamp : même point
+    assert om.turn_point_id(metadata(timestamp="2024-05-01T12:00:05")) == reference
+    assert om.turn_point_id(metadata(session_id="autre")) != reference
+    assert om.turn_point_id(metadata(ai_response="bonsoir")) != reference
+    assert om.turn_point_id(metadata(**{om.TENANT_FIELD: "alice"})) != reference
+    keyed = om.turn_point_id(metadata(idempotency_key="msg-1"))
+    assert keyed != reference
+    assert om.turn_point_id(metadata(idempotency_key="msg-1", user_message="autre")) == keyed
+
+
+@pytest.fixture
+def memory(backend_factory):
+    memory = om.OpenWebUIMemory(backend=backend_factory(), encoder=CountingEncoder())
+    yield memory
+    memory.close()
+
+
+def test_reimport_reports_duplicates(memory):
+    records = [{"user_message": f"question {index}", "ai_response": "réponse", "session_id": "s",
+                "timestamp": f"2024-05-01T12:00:{index:02d}"} for index in range(6)]
+    # Un seul lot : le client Qdrant embarqué ne supporte pas les lectures pendant un upsert en vol
+    first = memory.save_conversations(records + records[:2], batch_size=16, parallelism=1)
+    assert (first["saved"], first["duplicates"], first["failed"]) == (6, 2, 0)
+
+    encoded = memory.embedding_model.encoded
+    second = memory.save_conversations(records, batch_size=16, parallelism=1)
+    assert (second["saved"], second["duplicates"], second["failed"]) == (0, 6, 0)
+    assert memory.embedding_model.encoded == encoded
+    assert memory.backend.count() == 6
+
+
+def test_concurrent_saves_of_one_turn_write_once(memory):
+    barrier = threading.Barrier(6)
+
+    def save(_):
+        barrier.wait()
+        return memory.save_conversation("bonjour", "salut", session_id="s")
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        assert list(executor.map(save, range(6))) == [True] * 6
+    assert memory.embedding_model.encoded == 1
+    assert memory.backend.count() == 1
+
+
+def test_async_concurrent_saves_of_one_turn_write_once(tmp_path):
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=CountingEncoder())
+    async_memory = om.AsyncOpenWebUIMemory(memory, encode_workers=2)
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(async_memory.save_conversation("bonjour", "salut", session_id="s")
+                                          for _ in range(6)))
+        finally:
+            await async_memory.close()
+
+    try:
+        assert asyncio.run(scenario()) == [True] * 6
+        assert memory.embedding_model.encoded == 1
+        assert memory.backend.count() == 1
+    finally:
+        memory.close()
+
+
+def test_repeated_message_needs_an_idempotency_key(memory):
+    # Sans clé, le même échange répété dans la session n'est stocké qu'une fois
+    assert memory.save_conversation("oui", "d'accord", session_id="s")
+    assert memory.save_conversation("oui", "d'accord", session_id="s")
+    assert memory.backend.count() == 1
+
+    # Une clé par message garde chaque occurrence
+    assert memory.save_conversation("oui", "d'accord", session_id="s", idempotency_key="msg-2")
+    assert memory.save_conversation("oui", "d'accord", session_id="s", idempotency_key="msg-3")
+    assert memory.backend.count() == 3
+    history = memory.get_conversation_history("s", limit=10)
+    assert [turn["user_message"] for turn in history] == ["oui"] * 3
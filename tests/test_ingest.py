@@ -0,0 +1,96 @@
+"""
+Import en masse : tableaux JSON lus en flux et bornes de batch_size / parallelism
+"""
+
+import io
+import json
+
+import pytest
+
+from conftest import StubEncoder, om, service
+
+RECORDS = [
+    {"user_message": "crochets ] et virgules , dans une chaîne", "ai_response": "réponse é€", "session_id": "s"},
+    {"user_message": "question", "ai_response": "réponse", "session_id": "s", "nested": {"list": [1, 2.5e3]}},
+    12345678,
+    {"user_message": "dernière", "ai_response": "fin", "session_id": "s"},
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+@pytest.mark.parametrize("binary", [False, True])
+def test_iter_json_array_matches_json_loads(chunk_size, binary):
+    text = json.dumps(RECORDS, ensure_ascii=False, indent=2)
+    stream = io.BytesIO(text.encode("utf-8")) if binary else io.StringIO(text)
+    assert list(om.iter_json_array(stream, chunk_size)) == RECORDS
+
+
+def test_iter_json_array_edge_cases():
+    assert list(om.iter_json_array(io.StringIO("  [ ]  "), 1)) == []
+    with pytest.raises(ValueError, match="tableau"):
+        list(om.iter_json_array(io.StringIO('{"user_message": "x"}')))
+    with pytest.raises(ValueError):
+        list(om.iter_json_array(io.StringIO("")))
+
+    # Une erreur remplace l'enregistrement fautif et termine la lecture
+    records = list(om.iter_json_array(io.StringIO('[{"a": 1}, {"b": }, {"c": 3}]'), 4))
+    assert records[0] == {"a": 1}
+    assert len(records) == 2 and isinstance(records[1], ValueError)
+    records = list(om.iter_json_array(io.StringIO('[{"a": 1} {"b": 2}]'), 4))
+    assert isinstance(records[-1], ValueError)
+    records = list(om.iter_json_array(io.StringIO('[{"a": 1}, {"b": 2}'), 4))
+    assert records[:2] == [{"a": 1}, {"b": 2}] and isinstance(records[-1], ValueError)
+
+    # Un élément trop volumineux n'est pas accumulé indéfiniment
+    big = '[{"a": "' + "x" * 1000 + '"}]'
+    records = list(om.iter_json_array(io.StringIO(big), 16, max_record_chars=100))
+    assert len(records) == 1 and isinstance(records[0], ValueError)
+
+
+class ClampedMemory:
+    """Remplace la mémoire du module pour observer les options transmises"""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self.calls = []
+
+    def save_conversations(self, records, batch_size, parallelism):
+        self.calls.append((batch_size, parallelism))
+        return self.memory.save_conversations(records, batch_size=batch_size, parallelism=parallelism)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=StubEncoder())
+    spy = ClampedMemory(memory)
+    monkeypatch.setattr(service, "memory", spy)
+    monkeypatch.setattr(service, "_background_started", True)
+    monkeypatch.setenv("MEMORY_MAX_BATCH_SIZE", "64")
+    monkeypatch.setenv("MEMORY_MAX_PARALLELISM", "2")
+    yield service.app.test_client(), spy
+    memory.close()
+
+
+def test_save_batch_streams_json_array_and_clamps_options(client):
+    client, spy = client
+    records = [{"user_message": f"question {index}", "ai_response": "réponse", "session_id": "s"}
+               for index in range(5)] + ["pas un objet"]
+    response = client.post("/memory/save_batch?batch_size=100000&parallelism=500", json=records)
+    report = response.get_json()
+    assert report["saved"] == 5
+    assert report["failed"] == 1 and report["errors"][0]["index"] == 5
+    assert spy.calls == [(64, 2)]
+
+    response = client.post("/memory/save_batch?batch_size=0&parallelism=-3", json=[])
+    assert response.get_json()["saved"] == 0
+    assert spy.calls[-1] == (1, 1)
+
+    response = client.post("/memory/save_batch", json={"user_message": "x"})
+    assert response.status_code == 400
+
+
+def test_clamp_ingest_options_defaults(monkeypatch):
+    monkeypatch.delenv("MEMORY_MAX_BATCH_SIZE", raising=False)
+    monkeypatch.delenv("MEMORY_MAX_PARALLELISM", raising=False)
+    assert service.clamp_ingest_options(256, 4) == (256, 4)
+    assert service.clamp_ingest_options(10 ** 9, 10 ** 6) == (1024, 8)
@@ -0,0 +1,28 @@
+"""
+Point d'entrée : le serveur par défaut n'est jamais lancé en mode debug
+"""
+
+import pytest
+
+from conftest import service
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    calls = []
+    monkeypatch.delenv("MEMORY_API_PORT", raising=False)
+    monkeypatch.setattr(service.app, "run", lambda **kwargs: calls.append(kwargs))
+    monkeypatch.setattr(service, "start_background_tasks", lambda: calls.append("background"))
+    return calls
+
+
+def test_no_command_serves_without_debug(runs):
+    assert service.main([]) == 0
+    assert runs == ["background", {"host": "0.0.0.0", "port": 5001}]
+
+
+def test_debug_requires_explicit_flag(runs):
+    service.main(["serve", "--port", "7000"])
+    service.main(["serve", "--debug"])
+    assert runs[:2] == ["background", {"host": "0.0.0.0", "port": 7000}]
+    assert runs[2] == {"host": "0.0.0.0", "port": 5001, "debug": True}
@@ -0,0 +1,27 @@
+"""
+/metrics : la taille de la collection est une estimation, pas un comptage exact
+"""
+
+from conftest import StubEncoder, om
+
+
+class CountingBackend(om.LocalMemoryBackend):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.count_calls = []
+
+    def count(self, exact: bool = True) -> int:
+        self.count_calls.append(exact)
+        return super().count(exact)
+
+
+def test_metrics_use_approximate_count(tmp_path):
+    backend = CountingBackend(str(tmp_path))
+    memory = om.OpenWebUIMemory(backend=backend, encoder=StubEncoder())
+    try:
+        assert memory.save_conversation("bonjour", "salut", session_id="s")
+        metrics = memory.get_metrics()
+        assert "memory_collection_points 1.0" in metrics
+        assert backend.count_calls == [False]
+    finally:
+        memory.close()
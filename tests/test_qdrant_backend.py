@@ -0,0 +1,293 @@
+"""
+Spécificités de QdrantBackend : API de requête query_points (client synchrone et asynchrone),
+reprise des erreurs transitoires, migrations, réglages de collection et rapport rappel / latence
+"""
+
+import asyncio
+import types
+
+import httpx
+import pytest
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+from qdrant_client.models import Disabled, PointStruct, ScalarQuantization, ScoredPoint
+
+from conftest import StubEncoder, om, service
+from test_backends import DIM, ENCODER, make_point, point_id
+
+
+@pytest.fixture
+def backend():
+    backend = om.QdrantBackend(":memory:")
+    backend.ensure_collection(DIM)
+    yield backend
+    backend.close()
+
+
+def test_search_uses_query_points(backend, monkeypatch):
+    def deprecated_search(**kwargs):
+        raise AssertionError("client.search est déprécié")
+
+    monkeypatch.setattr(backend.client, "search", deprecated_search)
+    backend.upsert([make_point(name, tenant=tenant) for name, tenant in (("a", "t1"), ("b", "t2"))])
+    hits = backend.search(ENCODER.encode("a").tolist(), limit=5, tenant="t1")
+    assert [hit.id for hit in hits] == [point_id("a")]
+    assert hits[0].payload["user_message"] == "question a"
+    assert backend.search(ENCODER.encode("a").tolist(), limit=5, score_threshold=0.99, tenant="t2") == []
+
+
+class FakeAsyncClient:
+    """Client asynchrone factice : seule query_points est disponible"""
+
+    def __init__(self, points):
+        self.points = points
+        self.calls = []
+
+    async def query_points(self, **kwargs):
+        self.calls.append(kwargs)
+        return types.SimpleNamespace(points=self.points)
+
+    async def close(self):
+        pass
+
+
+def test_async_search_uses_query_points(backend):
+    memory = om.OpenWebUIMemory(backend=backend, encoder=StubEncoder(DIM))
+    async_memory = om.AsyncOpenWebUIMemory(memory, encode_workers=1)
+    hit = ScoredPoint(id=point_id("a"), version=0, score=0.5, payload={"turn_id": None})
+    async_memory.qdrant_client = FakeAsyncClient([hit])
+
+    async def scenario():
+        try:
+            return await async_memory._search(ENCODER.encode("a").tolist(), 3, tenant="t1")
+        finally:
+            await async_memory.close()
+
+    try:
+        assert asyncio.run(scenario()) == [hit]
+    finally:
+        memory.close()
+    call = async_memory.qdrant_client.calls[0]
+    assert call["query"] == ENCODER.encode("a").tolist()
+    assert call["limit"] == 3
+    assert call["query_filter"].must[0].match.value == "t1"
+
+
+class RpcError(Exception):
+    """Erreur au format grpc.RpcError (code() renvoie un StatusCode)"""
+
+    def __init__(self, status: str):
+        super().__init__(status)
+        self.status = status
+
+    def code(self):
+        return types.SimpleNamespace(name=self.status)
+
+
+def unexpected_response(status_code: int) -> UnexpectedResponse:
+    return UnexpectedResponse(status_code, "erreur", b"", httpx.Headers())
+
+
+@pytest.mark.parametrize("error, transient", [
+    (unexpected_response(503), True),
+    (unexpected_response(429), True),
+    (unexpected_response(400), False),
+    (unexpected_response(404), False),
+    (ResponseHandlingException(OSError("connexion perdue")), True),
+    (ConnectionError(), True),
+    (TimeoutError(), True),
+    (RpcError("UNAVAILABLE"), True),
+    (RpcError("DEADLINE_EXCEEDED"), True),
+    (RpcError("INVALID_ARGUMENT"), False),
+    (RpcError("NOT_FOUND"), False),
+    (ValueError("payload invalide"), False),
+])
+def test_is_transient_error(error, transient):
+    assert om.is_transient_error(error) is transient
+
+
+class Flaky:
+    """Échoue failures fois avec error, puis renvoie result"""
+
+    def __init__(self, failures: int, error: Exception = None, result="ok"):
+        self.failures = failures
+        self.error = error or RpcError("UNAVAILABLE")
+        self.result = result
+        self.attempts = 0
+
+    def __call__(self, *args, **kwargs):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error
+        return self.result
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(om.backends.time, "sleep", delays.append)
+    return delays
+
+
+def test_call_retries_transient_errors(sleeps):
+    backend = om.QdrantBackend(":memory:", retries=3, retry_backoff=0.1)
+    flaky = Flaky(failures=2)
+    assert backend.call(flaky, 1, key="valeur") == "ok"
+    assert flaky.attempts == 3
+    assert len(sleeps) == 2
+    # Délai exponentiel avec gigue : [0.05, 0.1] puis [0.1, 0.2]
+    assert 0.05 <= sleeps[0] <= 0.1 and 0.1 <= sleeps[1] <= 0.2
+
+
+def test_call_gives_up_after_retries(sleeps):
+    backend = om.QdrantBackend(":memory:", retries=2)
+    flaky = Flaky(failures=5)
+    with pytest.raises(RpcError):
+        backend.call(flaky)
+    assert flaky.attempts == 3
+    assert len(sleeps) == 2
+
+
+def test_call_does_not_retry_permanent_errors(sleeps):
+    backend = om.QdrantBackend(":memory:", retries=3)
+    flaky = Flaky(failures=1, error=RpcError("INVALID_ARGUMENT"))
+    with pytest.raises(RpcError):
+        backend.call(flaky)
+    assert flaky.attempts == 1
+    assert sleeps == []
+
+
+def test_acall_retries_transient_errors():
+    backend = om.QdrantBackend(":memory:", retries=2, retry_backoff=0)
+    flaky = Flaky(failures=2)
+    permanent = Flaky(failures=1, error=unexpected_response(400))
+
+    async def call(fn):
+        async def wrapper():
+            return fn()
+        return await backend.acall(wrapper)
+
+    assert asyncio.run(call(flaky)) == "ok"
+    assert flaky.attempts == 3
+    with pytest.raises(UnexpectedResponse):
+        asyncio.run(call(permanent))
+    assert permanent.attempts == 1
+
+
+class FlakyClient:
+    """Client Qdrant dont scroll et batch_update_points échouent une fois sur deux"""
+
+    def __init__(self, client):
+        self.client = client
+        self.failed = set()
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if name not in ("scroll", "batch_update_points"):
+            return method
+
+        def flaky(*args, **kwargs):
+            if name not in self.failed:
+                self.failed.add(name)
+                raise RpcError("UNAVAILABLE")
+            self.failed.discard(name)
+            return method(*args, **kwargs)
+        return flaky
+
+
+def test_backfills_retry_transient_errors(backend, sleeps):
+    legacy = []
+    for index, name in enumerate(("a", "b", "c")):
+        point = make_point(name, session_id=f"alice:s{index}")
+        del point.payload["timestamp_ms"], point.payload[om.TENANT_FIELD]
+        point.payload["timestamp"] = "2024-05-01T12:00:00"
+        legacy.append(PointStruct(id=point.id, vector=point.vector, payload=point.payload))
+    backend.upsert(legacy)
+    backend._client = FlakyClient(backend.client)
+
+    assert backend.backfill_timestamps(batch_size=2) == 3
+    assert backend.backfill_tenants(":", batch_size=2) == 3
+    assert sleeps
+    payloads = [record.payload for record in backend.retrieve([point_id(name) for name in "abc"], True)]
+    assert all(payload["timestamp_ms"] == om.timestamp_to_ms("2024-05-01T12:00:00") for payload in payloads)
+    assert all(payload[om.TENANT_FIELD] == "alice" for payload in payloads)
+
+
+@pytest.fixture
+def updates(backend, monkeypatch):
+    # Le client embarqué ignore update_collection : on vérifie la requête envoyée
+    calls = []
+    monkeypatch.setattr(backend.client, "update_collection", lambda **kwargs: calls.append(kwargs))
+    return calls
+
+
+def test_apply_collection_config(backend, updates):
+    backend.quantization, backend.vectors_on_disk, backend.hnsw_m = "scalar", True, 32
+    backend.apply_collection_config()
+    call = updates[0]
+    assert call["collection_name"] == backend.collection_name
+    assert call["vectors_config"][""].on_disk is True
+    assert isinstance(call["quantization_config"], ScalarQuantization)
+    assert call["hnsw_config"].m == 32
+
+
+def test_apply_collection_config_disables_quantization(backend, updates):
+    backend.tenant_hnsw = True
+    backend.apply_collection_config()
+    call = updates[0]
+    assert call["quantization_config"] == Disabled.DISABLED
+    assert call["vectors_config"][""].on_disk is False
+    # Index par tenant : pas de graphe global
+    assert (call["hnsw_config"].m, call["hnsw_config"].payload_m) == (0, 16)
+
+
+def test_tune_collection_is_a_noop_on_local_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("MEMORY_BACKEND", "local")
+    monkeypatch.setenv("MEMORY_LOCAL_PATH", str(tmp_path))
+    assert service.main(["tune-collection"]) == 0
+    with pytest.raises(SystemExit):
+        service.main(["recall-report"])
+
+
+@pytest.mark.parametrize("quantization, rows_per_ef", [(None, 1), ("scalar", 2)])
+def test_recall_latency_report(backend, quantization, rows_per_ef):
+    backend.quantization = quantization
+    backend.upsert([make_point(f"p{index}") for index in range(20)])
+    report = om.recall_latency_report(backend, sample_size=8, limit=5, ef_values=(16, 64))
+    assert (report["queries"], report["limit"], report["quantization"]) == (8, 5, quantization)
+    rows = report["results"]
+    assert len(rows) == 2 * rows_per_ef
+    assert [row["hnsw_ef"] for row in rows] == [16] * rows_per_ef + [64] * rows_per_ef
+    for row in rows:
+        # Le client embarqué cherche toujours exactement : rappel parfait
+        assert row["recall"] == pytest.approx(1.0)
+        assert 0 <= row["latency_ms_mean"] and 0 <= row["latency_ms_p95"]
+    if quantization:
+        assert [row["rescore"] for row in rows[:2]] == [False, True]
+        assert rows[1]["oversampling"] == 2.0
+
+
+def test_recall_latency_report_filters_on_tenants(backend, monkeypatch):
+    backend.tenant_hnsw = True
+    backend.upsert([make_point(f"p{index}", tenant=f"t{index % 2}") for index in range(10)])
+    searches = []
+    search = backend.search
+
+    def recording_search(vector, limit, search_params=None, with_payload=om.SEARCH_PAYLOAD_FIELDS,
+                         score_threshold=None, tenant=None):
+        hits = search(vector, limit, search_params, True, score_threshold, tenant)
+        searches.append((tenant, {hit.payload[om.TENANT_FIELD] for hit in hits}))
+        return hits
+
+    monkeypatch.setattr(backend, "search", recording_search)
+    report = om.recall_latency_report(backend, sample_size=10, limit=5, ef_values=(16,))
+    assert report["tenant_hnsw"] is True
+    assert report["results"][0]["recall"] == pytest.approx(1.0)
+    # Vérité terrain puis réglage mesuré : jamais de recherche sans tenant
+    assert len(searches) == 20
+    assert all(tenant in ("t0", "t1") and found == {tenant} for tenant, found in searches)
+
+
+def test_recall_latency_report_empty_collection(backend):
+    report = om.recall_latency_report(backend, ef_values=(32,))
+    assert report["queries"] == 0
+    assert report["results"][0]["recall"] == 0.0
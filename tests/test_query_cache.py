@@ -0,0 +1,56 @@
+"""
+Clés du cache des embeddings de requêtes : la casse ne compte que pour les modèles sensibles à la casse
+"""
+
+import types
+
+from conftest import StubEncoder, om
+
+
+class CountingEncoder(StubEncoder):
+    def __init__(self, tokenizer=None):
+        super().__init__()
+        self.tokenizer = tokenizer
+        self.queries = 0
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            self.queries += 1
+        return super().encode(texts, **kwargs)
+
+
+def test_make_key_normalization():
+    key = om.QueryEmbeddingCache.make_key
+    assert key("Ｂonjour   le\tmonde", "m") == key("Bonjour le monde", "m")
+    assert key("Bonjour", "m") != key("bonjour", "m")
+    assert key("Bonjour", "m", lowercase=True) == key("BONJOUR", "m", lowercase=True)
+    assert key("bonjour", "m") != key("bonjour", "autre")
+
+
+def test_encoder_lowercases():
+    assert not om.encoder_lowercases(StubEncoder())
+    assert om.encoder_lowercases(types.SimpleNamespace(tokenizer=types.SimpleNamespace(do_lower_case=True)))
+    assert not om.encoder_lowercases(types.SimpleNamespace(tokenizer=types.SimpleNamespace(do_lower_case=False)))
+    tokenizer = types.SimpleNamespace(init_kwargs={"do_lower_case": True})
+    assert om.encoder_lowercases(types.SimpleNamespace(tokenizer=tokenizer))
+
+    class SentenceTransformerLike:
+        tokenizer = types.SimpleNamespace(init_kwargs={})
+
+        def _first_module(self):
+            return types.SimpleNamespace(do_lower_case=True)
+
+    assert om.encoder_lowercases(SentenceTransformerLike())
+
+
+def test_query_cache_follows_model_casing(tmp_path):
+    for tokenizer, expected_queries in ((None, 2), (types.SimpleNamespace(do_lower_case=True), 1)):
+        encoder = CountingEncoder(tokenizer)
+        memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path / str(expected_queries))),
+                                    encoder=encoder)
+        try:
+            memory._encode_query("Paris en été")
+            memory._encode_query("paris en ÉTÉ")
+            assert encoder.queries == expected_queries
+        finally:
+            memory.close()
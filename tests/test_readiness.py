@@ -0,0 +1,33 @@
+"""
+Préparation sous un serveur WSGI qui importe app directement (sans main())
+"""
+
+import time
+
+import pytest
+
+from conftest import StubEncoder, om, service
+
+
+@pytest.fixture
+def wsgi_memory(monkeypatch, tmp_path):
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=StubEncoder())
+    monkeypatch.setattr(service, "memory", memory)
+    monkeypatch.setattr(service, "_background_started", False)
+    monkeypatch.delenv("MEMORY_RETENTION_INTERVAL_S", raising=False)
+    yield memory
+    memory.close()
+
+
+def test_first_request_starts_warm_up(wsgi_memory):
+    client = service.app.test_client()
+    assert client.get("/healthz").status_code == 200
+    assert service._background_started
+
+    deadline = time.monotonic() + 5
+    response = client.get("/readyz")
+    while response.status_code != 200 and time.monotonic() < deadline:
+        time.sleep(0.01)
+        response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.get_json()["model_warm"] is True
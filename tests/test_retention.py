@@ -0,0 +1,182 @@
+"""
+Rétention : TTL, plafond par session, compaction idempotente et reprise d'un passage interrompu
+Chaque test tourne sur les deux backends ; le service ne charge le résumeur qu'au démarrage de la rétention
+"""
+
+import importlib.util
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import ROOT, StubEncoder, om, service
+
+OLD = "2020-01-01T12:00:00"
+
+
+def recent(minutes: int = 0) -> str:
+    return (datetime.now() - timedelta(minutes=minutes)).isoformat()
+
+
+def record(session_id: str, index: int, timestamp: str, tenant_id: str = "alice", words: int = 3):
+    return {"user_message": f"question {session_id} {index}", "ai_response": " ".join(["réponse"] * words),
+            "session_id": session_id, "tenant_id": tenant_id, "timestamp": timestamp}
+
+
+@pytest.fixture
+def memory(backend_factory):
+    # chunk_tokens : les longs tours ont des chunks, supprimés avec leur tour
+    memory = om.OpenWebUIMemory(backend=backend_factory(), encoder=StubEncoder(), chunk_tokens=8)
+    yield memory
+    memory.close()
+
+
+def save(memory, records):
+    # Un seul lot : le client Qdrant embarqué ne supporte pas les lectures pendant un upsert en vol
+    report = memory.save_conversations(records, batch_size=64, parallelism=1)
+    assert report["failed"] == 0
+
+
+def payloads(memory):
+    records, _ = memory.backend.scan(limit=1000)
+    return [record.payload for record in records]
+
+
+def session_turns(memory, session_id: str):
+    return [payload for payload in payloads(memory)
+            if payload["session_id"] == session_id and payload.get("kind") != om.CHUNK_KIND]
+
+
+def test_ttl_deletes_old_points(memory):
+    save(memory, [record("ancienne", 0, OLD, words=20), record("ancienne", 1, OLD),
+                  record("active", 0, recent())])
+    before = memory.backend.count()
+    report = om.RetentionJob(memory, ttl_days=30, batch_size=2).run()
+
+    assert [payload["session_id"] for payload in payloads(memory)] == ["active"]
+    assert report["points_deleted"] == before - 1
+    assert report["bytes_reclaimed"] > 0
+
+
+def test_cap_keeps_most_recent_turns_per_session(memory):
+    records = [record("s", index, recent(10 - index), tenant_id=tenant, words=20 if index == 0 else 3)
+               for tenant in ("alice", "bob") for index in range(4)]
+    save(memory, records + [record("courte", 0, recent())])
+    report = om.RetentionJob(memory, max_turns_per_session=2, batch_size=3).run()
+
+    assert report["sessions_capped"] == 2
+    for tenant in ("alice", "bob"):
+        history = memory.get_conversation_history("s", limit=10, tenant_id=tenant)
+        assert [turn["user_message"] for turn in history] == ["question s 2", "question s 3"]
+    remaining, _ = memory.backend.scan(limit=1000)
+    chunk_turns = {record.payload["turn_id"] for record in remaining
+                   if record.payload.get("kind") == om.CHUNK_KIND}
+    # Les chunks du premier tour, supprimé, ne restent pas orphelins
+    assert chunk_turns <= {record.id for record in remaining}
+    assert len(remaining) == 5
+
+    again = om.RetentionJob(memory, max_turns_per_session=2, batch_size=3).run()
+    assert (again["sessions_capped"], again["points_deleted"]) == (0, 0)
+
+
+def test_compaction_is_idempotent(memory):
+    save(memory, [record("vieille", index, OLD) for index in range(3)] + [record("active", 0, recent())])
+    job = om.RetentionJob(memory, compact_after_days=30)
+    first = job.run()
+    assert first["sessions_compacted"] == 1
+
+    summaries = session_turns(memory, "vieille")
+    assert len(summaries) == 1 and summaries[0]["kind"] == om.SUMMARY_KIND
+    assert summaries[0]["compacted_turns"] == 3
+    count = memory.backend.count()
+
+    second = job.run()
+    assert (second["sessions_compacted"], second["points_deleted"]) == (0, 0)
+    assert memory.backend.count() == count
+    assert session_turns(memory, "vieille") == summaries
+
+
+def test_interrupted_run_resumes_after_last_session(memory, tmp_path, monkeypatch):
+    save(memory, [record(f"s{session}", index, recent(10 - index)) for session in range(3) for index in range(3)])
+    state_path = str(tmp_path / "state" / "retention.json")
+    job = om.RetentionJob(memory, max_turns_per_session=1, state_path=state_path)
+    capped = []
+    cap = job._cap
+
+    def interrupted_cap(backend, entries, turns, report):
+        if len(capped) == 1:
+            raise KeyboardInterrupt
+        capped.append(entries)
+        cap(backend, entries, turns, report)
+
+    monkeypatch.setattr(job, "_cap", interrupted_cap)
+    with pytest.raises(KeyboardInterrupt):
+        job.run()
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    assert (state["phase"], state["last_session"]) == ("sessions", ["alice", "s0"])
+    assert state["report"]["sessions_capped"] == 1
+
+    resumed = om.RetentionJob(memory, max_turns_per_session=1, state_path=state_path)
+    resumed_sessions = []
+    original_entries = resumed._session_entries
+
+    def recording_entries(backend, tenant, session_id, vector_bytes):
+        resumed_sessions.append(session_id)
+        return original_entries(backend, tenant, session_id, vector_bytes)
+
+    monkeypatch.setattr(resumed, "_session_entries", recording_entries)
+    report = resumed.run()
+    # s0 n'est ni relu ni retraité ; le bilan cumule les deux passages
+    assert resumed_sessions == ["s1", "s2"]
+    assert (report["sessions_capped"], report["points_deleted"]) == (3, 6)
+    assert memory.backend.count() == 3
+
+    # Passage terminé : le suivant repart de zéro et n'a plus rien à faire
+    assert resumed.run()["sessions_capped"] == 0
+
+
+def _load_service(name: str):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "openwebui-memory.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_bad_summarizer_does_not_break_service(monkeypatch, tmp_path):
+    monkeypatch.setenv("MEMORY_BACKEND", "local")
+    monkeypatch.setenv("MEMORY_LOCAL_PATH", str(tmp_path))
+    monkeypatch.setenv("MEMORY_COMPACTION_SUMMARIZER", "module_introuvable:fabrique")
+    monkeypatch.setenv("MEMORY_RETENTION_INTERVAL_S", "3600")
+    module = _load_service("openwebui_memory_bad_summarizer")
+    try:
+        assert module.retention is None
+        monkeypatch.setattr(module.memory, "start_warm_up", lambda: None)
+        module.start_background_tasks()
+        assert module.retention is None
+    finally:
+        module.memory.close()
+
+
+@pytest.fixture
+def background(monkeypatch, tmp_path):
+    memory = om.OpenWebUIMemory(backend=om.LocalMemoryBackend(str(tmp_path)), encoder=StubEncoder())
+    monkeypatch.setattr(memory, "start_warm_up", lambda: None)
+    monkeypatch.setattr(service, "memory", memory)
+    monkeypatch.setattr(service, "retention", None)
+    monkeypatch.setattr(service, "_background_started", False)
+    monkeypatch.setenv("MEMORY_RETENTION_INTERVAL_S", "3600")
+    monkeypatch.setenv("MEMORY_RETENTION_MAX_TURNS", "5")
+    yield memory
+    if service.retention is not None:
+        service.retention.stop()
+    memory.close()
+
+
+def test_retention_is_built_when_background_tasks_start(background):
+    service.start_background_tasks()
+    job = service.retention
+    assert isinstance(job, om.RetentionJob)
+    assert job.memory is background and job.max_turns_per_session == 5
+    assert isinstance(job.summarizer, om.ExtractiveSummarizer)
@@ -0,0 +1,149 @@
+"""
+Recherche avec chunks : suréchantillonnage à payloads réduits, élargi tant que des chunks
+masquent des tours, puis lecture des tours retenus
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from conftest import StubEncoder, om
+
+
+class SpyBackend(om.LocalMemoryBackend):
+    """Stockage local qui note les payloads demandés par search et les IDs lus par retrieve"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.searched = []
+        self.retrieved = []
+
+    def search(self, vector, limit, search_params=None, with_payload=om.SEARCH_PAYLOAD_FIELDS,
+               score_threshold=None, tenant=None):
+        self.searched.append((limit, with_payload))
+        return super().search(vector, limit, search_params, with_payload, score_threshold, tenant)
+
+    def retrieve(self, ids, with_payload=om.SEARCH_PAYLOAD_FIELDS):
+        self.retrieved.append(list(ids))
+        return super().retrieve(ids, with_payload)
+
+
+@pytest.fixture
+def memory(tmp_path):
+    memory = om.OpenWebUIMemory(backend=SpyBackend(str(tmp_path)), encoder=StubEncoder(), chunk_tokens=8)
+    for index in range(12):
+        # Un tour sur deux est découpé en plusieurs chunks
+        memory.save_conversation(f"question {index}", "réponse détaillée " * (30 if index % 2 else 1),
+                                 session_id="s")
+    memory.backend.searched.clear()
+    memory.backend.retrieved.clear()
+    yield memory
+    memory.close()
+
+
+def turn_ids(backend):
+    records, _ = backend.scan(None, 1000, with_payload=True)
+    return {record.id for record in records if record.payload.get("kind") != om.CHUNK_KIND}
+
+
+def test_search_reads_full_payloads_only_for_final_turns(memory):
+    backend = memory.backend
+    assert backend.count() > 12
+
+    hits = memory._search_hits("question 3", 4)
+    assert backend.searched == [(4 * om.CHUNK_SEARCH_OVERSAMPLING, om.CHUNK_HIT_FIELDS)]
+    assert backend.retrieved == [[hit.id for hit in hits]]
+    assert len(hits) == 4
+    assert len({hit.id for hit in hits}) == 4
+    assert {hit.id for hit in hits} <= turn_ids(backend)
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+
+    results = memory.search_similar_conversations("question 3", 4)
+    assert [result["score"] for result in results] == [hit.score for hit in hits]
+    assert all(result["user_message"].startswith("question ") for result in results)
+    assert all(result["session_id"] == "s" for result in results)
+
+
+def test_ids_only_search_skips_retrieve(memory):
+    results = memory.search_similar_conversations("question 3", 4, ids_only=True)
+    assert len(results) == 4
+    assert {result["id"] for result in results} <= turn_ids(memory.backend)
+    assert memory.backend.retrieved == []
+
+
+def test_async_search_reads_full_payloads_only_for_final_turns(memory):
+    async_memory = om.AsyncOpenWebUIMemory(memory, encode_workers=1)
+
+    async def scenario():
+        try:
+            return await async_memory.search_similar_conversations("question 3", 4)
+        finally:
+            await async_memory.close()
+
+    results = asyncio.run(scenario())
+    assert results == memory.search_similar_conversations("question 3", 4)
+    assert memory.backend.searched[0] == (4 * om.CHUNK_SEARCH_OVERSAMPLING, om.CHUNK_HIT_FIELDS)
+    assert len(memory.backend.retrieved[0]) == 4
+
+
+class TopicEncoder(StubEncoder):
+    """Les textes qui parlent de Qdrant sont tous proches d'une même direction"""
+
+    def _vector(self, text: str):
+        vector = super()._vector(text)
+        if "qdrant" in text.lower():
+            vector = 0.1 * vector
+            vector[0] += 1.0
+        return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def chunk_heavy_memory(backend_factory):
+    backend = backend_factory()
+    memory = om.OpenWebUIMemory(backend=backend, encoder=TopicEncoder(), chunk_tokens=4)
+    # 3 tours longs dont les 8 chunks occupent les premiers résultats, 10 tours courts
+    for index in range(3):
+        memory.save_conversation(f"qdrant {index}", "qdrant " * 40, session_id="longs")
+    for index in range(10):
+        memory.save_conversation(f"bref {index}", "ok", session_id="courts")
+    yield memory
+    memory.close()
+
+
+def similar_section(context: str):
+    section = context.split("=== Conversations similaires ===\n")[1].split("\n\n")[0]
+    return [line for line in section.splitlines() if line.startswith("User: ")]
+
+
+def test_chunk_heavy_turns_do_not_starve_search(chunk_heavy_memory):
+    memory = chunk_heavy_memory
+    # 8 points par tour long, 2 par tour court
+    assert memory.backend.count() == 3 * 8 + 10 * 2
+
+    hits = memory._search_hits("qdrant", 5)
+    assert len(hits) == 5 and len({hit.id for hit in hits}) == 5
+    assert {hit.payload["user_message"] for hit in hits[:3]} == {"qdrant 0", "qdrant 1", "qdrant 2"}
+    assert len(memory.search_similar_conversations("qdrant", 5)) == 5
+    # Moins de tours que demandé : tous sont renvoyés, sans boucler
+    assert len(memory.search_similar_conversations("qdrant", 50)) == 13
+
+    context = memory.create_reflective_context("qdrant", max_results=5)
+    assert len(similar_section(context)) == 5
+
+
+def test_async_chunk_heavy_turns_do_not_starve_search(chunk_heavy_memory):
+    if isinstance(chunk_heavy_memory.backend, om.QdrantBackend):
+        pytest.skip("le client asynchrone embarqué ne partage pas les données du client synchrone")
+    async_memory = om.AsyncOpenWebUIMemory(chunk_heavy_memory, encode_workers=1)
+
+    async def scenario():
+        try:
+            return (await async_memory.search_similar_conversations("qdrant", 5),
+                    await async_memory.create_reflective_context("qdrant", max_results=5))
+        finally:
+            await async_memory.close()
+
+    results, context = asyncio.run(scenario())
+    assert len(results) == 5
+    assert len(similar_section(context)) == 5
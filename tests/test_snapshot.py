@@ -0,0 +1,132 @@
+"""
+Export / import de snapshots contre le client Qdrant embarqué
+"""
+
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+from conftest import StubEncoder, om
+
+
+def make_memory(model_name: str = "all-MiniLM-L6-v2", dim: int = 32, **options) -> "om.OpenWebUIMemory":
+    return om.OpenWebUIMemory(backend=om.QdrantBackend(":memory:"), model_name=model_name,
+                              encoder=StubEncoder(dim), **options)
+
+
+def fill(memory, turns: int = 60):
+    records = [{
+        "user_message": f"question {index}",
+        # Un tour sur cinq est découpé en plusieurs chunks
+        "ai_response": "réponse détaillée " * (40 if index % 5 == 0 else 1),
+        "session_id": f"{'big' if index % 3 == 0 else 'alice'}:s{index % 4}",
+    } for index in range(turns)]
+    # Le client embarqué n'est pas thread-safe : un seul lot en vol
+    report = memory.save_conversations(records, parallelism=1)
+    assert report["saved"] == turns
+
+
+def dump(memory):
+    points = {}
+    for backend in memory.all_backends():
+        offset = None
+        while True:
+            records, offset = backend.scan(offset, 50, with_vectors=True)
+            for record in records:
+                points[record.id] = (np.asarray(record.vector), record.payload)
+            if offset is None:
+                break
+    return points
+
+
+@pytest.fixture
+def source():
+    memory = make_memory(dedicated_tenants=["big"], chunk_tokens=8)
+    fill(memory)
+    yield memory
+    memory.close()
+
+
+def test_round_trip_same_model(source, tmp_path):
+    path = str(tmp_path / "snapshot")
+    exported = om.export_snapshot(source, path, batch_size=17)
+    original = dump(source)
+    assert exported["points"] == len(original)
+    assert sorted(os.listdir(path)) == [om.SNAPSHOT_MANIFEST, om.SNAPSHOT_PAYLOADS, om.SNAPSHOT_VECTORS]
+    assert np.load(os.path.join(path, om.SNAPSHOT_VECTORS), mmap_mode="r").shape == (len(original), 32)
+
+    target = make_memory(dedicated_tenants=["big"])
+    try:
+        report = om.import_snapshot(target, path, batch_size=13, parallelism=1)
+        assert report["reencoded"] is False
+        assert report["points_written"] == len(original)
+        restored = dump(target)
+        assert restored.keys() == original.keys()
+        for point_id, (vector, payload) in original.items():
+            assert np.allclose(restored[point_id][0], vector, atol=1e-6)
+            assert restored[point_id][1] == payload
+        assert [backend.count() for backend in target.all_backends()] == \
+            [backend.count() for backend in source.all_backends()]
+
+        query = "User: question 7\nAI: réponse détaillée "
+        expected = source.search_similar_conversations(query, 3, session_id="alice:x")
+        assert target.search_similar_conversations(query, 3, session_id="alice:x") == expected
+
+        # Réimporter remplace les points au lieu de les dupliquer
+        om.import_snapshot(target, path, parallelism=1)
+        assert sum(backend.count() for backend in target.all_backends()) == len(original)
+    finally:
+        target.close()
+
+
+def test_import_reencodes_with_other_model(source, tmp_path):
+    path = str(tmp_path / "snapshot")
+    om.export_snapshot(source, path, vector_dtype="float16")
+    original = dump(source)
+    turns = {point_id for point_id, (_, payload) in original.items() if payload.get("kind") != om.CHUNK_KIND}
+
+    target = make_memory(model_name="autre-modele", dim=16, chunk_tokens=8)
+    try:
+        with pytest.raises(ValueError):
+            om.import_snapshot(target, path, reencode=False, parallelism=1)
+        report = om.import_snapshot(target, path, batch_size=20, parallelism=1)
+        assert report["reencoded"] is True
+        assert report["chunks_skipped"] == len(original) - len(turns)
+
+        restored = dump(target)
+        assert turns <= restored.keys()
+        assert all(len(vector) == 16 for vector, _ in restored.values())
+        for point_id in turns:
+            payload = restored[point_id][1]
+            assert om.payload_text(payload, "user_message") == \
+                om.payload_text(original[point_id][1], "user_message")
+        # Les chunks recalculés sont rattachés à l'ID d'origine de leur tour
+        chunks = [payload for _, payload in restored.values() if payload.get("kind") == om.CHUNK_KIND]
+        assert chunks and all(chunk["turn_id"] in turns for chunk in chunks)
+    finally:
+        target.close()
+
+
+def test_incomplete_snapshot_is_rejected(source, tmp_path):
+    path = str(tmp_path / "snapshot")
+    om.export_snapshot(source, path)
+    target = make_memory()
+    try:
+        # Export interrompu : le manifeste est écrit en dernier
+        os.rename(os.path.join(path, om.SNAPSHOT_MANIFEST), os.path.join(path, "manifest.bak"))
+        with pytest.raises(ValueError, match="manifest"):
+            om.import_snapshot(target, path, parallelism=1)
+        os.rename(os.path.join(path, "manifest.bak"), os.path.join(path, om.SNAPSHOT_MANIFEST))
+
+        # Payloads tronqués : le nombre de lignes ne correspond plus à la matrice
+        payloads = os.path.join(path, om.SNAPSHOT_PAYLOADS)
+        with gzip.open(payloads, "rt", encoding="utf-8") as f:
+            lines = f.readlines()
+        with gzip.open(payloads, "wt", encoding="utf-8") as f:
+            f.writelines(lines[:len(lines) // 2])
+        with pytest.raises(ValueError):
+            om.import_snapshot(target, path, parallelism=1)
+    finally:
+        target.close()
@@ -0,0 +1,58 @@
+"""
+Isolation des tenants de bout en bout : recherche, historique et contexte réflexif
+Chaque test tourne sur les deux backends, collection partagée ou collections dédiées
+"""
+
+import pytest
+
+from conftest import StubEncoder, om
+
+QUERY = "recette de la tarte aux pommes"
+SECRET = "le secret d'alice : beaucoup de cannelle"
+
+
+@pytest.fixture(params=[(), ("alice",), ("alice", "bob")],
+                ids=["partagee", "alice-dediee", "toutes-dediees"])
+def memory(request, backend_factory):
+    memory = om.OpenWebUIMemory(backend=backend_factory(), encoder=StubEncoder(),
+                                dedicated_tenants=request.param)
+    yield memory
+    memory.close()
+
+
+def context(memory, **kwargs) -> str:
+    return memory.create_reflective_context(QUERY, session_id="alice:cuisine", score_threshold=-1.0,
+                                            **kwargs)
+
+
+def test_tenant_sees_only_its_own_conversations(memory):
+    # Tenant déduit du préfixe de session_id pour l'un, explicite pour l'autre
+    assert memory.save_conversation(QUERY, SECRET, session_id="alice:cuisine")
+    assert memory.save_conversation(QUERY, "une autre recette", session_id="partage",
+                                    tenant_id="alice")
+
+    alice = memory.search_similar_conversations(QUERY, limit=10, tenant_id="alice")
+    assert {hit["ai_response"] for hit in alice} == {SECRET, "une autre recette"}
+    assert [turn["ai_response"] for turn in memory.get_conversation_history("alice:cuisine")] == [SECRET]
+    assert SECRET in context(memory)
+
+    assert memory.search_similar_conversations(QUERY, limit=10, tenant_id="bob") == []
+    assert memory.search_similar_conversations(QUERY, limit=10, session_id="bob:cuisine") == []
+    assert memory.search_similar_conversations(QUERY, limit=10, ids_only=True, tenant_id="bob") == []
+    # Même session_id, autre tenant : rien ne fuit
+    assert memory.get_conversation_history("alice:cuisine", tenant_id="bob") == []
+    assert memory.get_conversation_history("partage", tenant_id="bob") == []
+    bob_context = context(memory, tenant_id="bob")
+    assert SECRET not in bob_context and "une autre recette" not in bob_context
+
+
+def test_tenants_with_identical_turns_keep_their_own_points(memory):
+    assert memory.save_conversation(QUERY, SECRET, session_id="cuisine", tenant_id="alice")
+    assert memory.save_conversation(QUERY, SECRET, session_id="cuisine", tenant_id="bob")
+    assert memory.save_conversation(QUERY, SECRET, session_id="cuisine", tenant_id="bob",
+                                    idempotency_key="msg-2")
+
+    assert len(memory.get_conversation_history("cuisine", tenant_id="alice")) == 1
+    assert len(memory.get_conversation_history("cuisine", tenant_id="bob")) == 2
+    assert len(memory.search_similar_conversations(QUERY, limit=10, tenant_id="alice")) == 1
+    assert sum(backend.count() for backend in memory.all_backends()) == 3